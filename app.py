@@ -1,109 +1,706 @@
-from flask import Flask, render_template, request, redirect, url_for, abort
+from flask import Flask, render_template, request, redirect, url_for, abort, Response, jsonify, send_file, stream_with_context, session
 from flask_sqlalchemy import SQLAlchemy
-from GoogleNews import GoogleNews
-import google.generativeai as genai
 from pytz import timezone
 import os
+import re
 import datetime
+import threading
+import time
+import uuid
+from collections import OrderedDict
 
-# --- 引入 LINE Bot 相關套件 ---
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import MessageEvent, TextMessage, TextSendMessage
-
-# --- 引入排程套件 ---
-from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 
-# 引入你的功能模組
-from src import market_data, strategy, chart, chips, ml_predict, backtest, sentiment
+# 引入你的功能模組 (輕量的直接載入)
+from src import trading_calendar, leader, metrics, profiling, lazy, cache, page_cache
 from config import Config 
 
+# 會用到 pandas / sklearn / plotly / yfinance / Gemini 的模組改成延遲載入：
+# worker 開機只載入 Flask，第一次有人查股票才 import (見 src/lazy.py、bench/bench_startup.py)
+market_data = lazy.lazy_import('src.market_data')
+strategy = lazy.lazy_import('src.strategy')
+chart = lazy.lazy_import('src.chart')
+chips = lazy.lazy_import('src.chips')
+ml_predict = lazy.lazy_import('src.ml_predict')
+backtest = lazy.lazy_import('src.backtest')
+sentiment = lazy.lazy_import('src.sentiment')
+snapshot = lazy.lazy_import('src.snapshot')
+prewarm = lazy.lazy_import('src.prewarm')
+forward_returns = lazy.lazy_import('src.forward_returns')
+pd = lazy.lazy_import('pandas')
+llm = lazy.lazy_import('src.llm')
+line_push = lazy.lazy_import('src.line_push')
+robustness = lazy.lazy_import('src.robustness')
+similarity = lazy.lazy_import('src.similarity')
+intraday = lazy.lazy_import('src.intraday')
+
+# --- LINE Bot 相關套件 (第一次收到訊息 / 推播才載入) ---
+line_sdk = lazy.lazy_import('linebot')
+line_models = lazy.lazy_import('linebot.models')
+line_exceptions = lazy.lazy_import('linebot.exceptions')
+
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # 初始化資料庫
 db = SQLAlchemy(app)
 
-# 初始化 Gemini
-genai.configure(api_key=app.config.get('GOOGLE_API_KEY'))
+# 初始化 LINE Bot (第一次用到才建立)
+def _create_line_handler():
+    line_handler = line_sdk.WebhookHandler(app.config.get('LINE_CHANNEL_SECRET'))
+    line_handler.add(line_models.MessageEvent, message=line_models.TextMessage)(handle_message)
+    return line_handler
 
-# 初始化 LINE Bot
-line_bot_api = LineBotApi(app.config.get('LINE_CHANNEL_ACCESS_TOKEN'))
-handler = WebhookHandler(app.config.get('LINE_CHANNEL_SECRET'))
+line_bot_api = lazy.LazyObject(lambda: line_sdk.LineBotApi(app.config.get('LINE_CHANNEL_ACCESS_TOKEN')))
+handler = lazy.LazyObject(_create_line_handler)
 
 # --- 資料庫模型 ---
 class Watchlist(db.Model):
+    """ 舊版的全域自選股：現在只當「預設清單」，新的瀏覽器第一次修改時從這裡複製一份 """
     id = db.Column(db.Integer, primary_key=True)
     ticker = db.Column(db.String(10), unique=True, nullable=False)
 
+class UserWatchlist(db.Model):
+    """ 個人自選股：owner = 'line:<LINE userId>' 或 'web:<瀏覽器 session>' """
+    id = db.Column(db.Integer, primary_key=True)
+    owner = db.Column(db.String(64), nullable=False)
+    ticker = db.Column(db.String(10), nullable=False, index=True)
+    created_at = db.Column(db.DateTime)
+
+    # (owner, ticker) 的唯一索引同時也是「查某人清單」用的索引
+    __table_args__ = (db.UniqueConstraint('owner', 'ticker', name='uq_user_watchlist_owner_ticker'),)
+
+class DailySnapshot(db.Model):
+    """ 盤後快照：每檔股票每個交易日一筆 """
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(10), nullable=False, index=True)
+    trade_date = db.Column(db.Date, nullable=False, index=True)
+    close = db.Column(db.Float)
+    change_pct = db.Column(db.Float)
+    vol_ratio = db.Column(db.Float)
+    rsi = db.Column(db.Float)
+    macd_status = db.Column(db.String(30))
+    is_breakout = db.Column(db.Boolean, default=False)
+    is_buy = db.Column(db.Boolean, default=False)
+    signal_msg = db.Column(db.String(100))
+    ml_prob = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.UniqueConstraint('ticker', 'trade_date', name='uq_snapshot_ticker_date'),)
+
+class SignalLog(db.Model):
+    """ 訊號紀錄：網頁、LINE、批次看到的訊號每檔每個交易日一筆，事後補上實際報酬 (%) """
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(10), nullable=False, index=True)
+    trade_date = db.Column(db.Date, nullable=False, index=True)
+    source = db.Column(db.String(10))          # 最後一次寫入的來源：web / line / batch
+    close = db.Column(db.Float)
+    vol_ratio = db.Column(db.Float)
+    rsi = db.Column(db.Float)
+    is_breakout = db.Column(db.Boolean)
+    is_buy = db.Column(db.Boolean)
+    signal_msg = db.Column(db.String(100))
+    ml_prob = db.Column(db.Float)
+    ai_score = db.Column(db.Float)
+    ret_1d = db.Column(db.Float)
+    ret_5d = db.Column(db.Float)
+    ret_20d = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.UniqueConstraint('ticker', 'trade_date', name='uq_signal_ticker_date'),)
+
+class DeliveryLog(db.Model):
+    """ 排程推播紀錄：每個任務每天每位收件人一筆，重跑時只補送還沒成功的人 """
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(30), nullable=False)
+    run_date = db.Column(db.Date, nullable=False, index=True)
+    user_id = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(10))          # sent / failed
+    attempts = db.Column(db.Integer)
+    error = db.Column(db.String(200))
+    request_id = db.Column(db.String(64))      # LINE 回傳的 X-Line-Request-Id，查問題用
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.UniqueConstraint('job', 'run_date', 'user_id', name='uq_delivery_job_date_user'),)
+
+def latest_snapshots(tickers):
+    """ 一次查詢取出每檔股票最新的一筆快照，回傳 {ticker: DailySnapshot} """
+    if not tickers:
+        return {}
+    latest = db.session.query(
+        DailySnapshot.ticker,
+        db.func.max(DailySnapshot.trade_date).label('trade_date')
+    ).filter(DailySnapshot.ticker.in_(tickers)).group_by(DailySnapshot.ticker).subquery()
+
+    rows = DailySnapshot.query.join(
+        latest,
+        db.and_(DailySnapshot.ticker == latest.c.ticker, DailySnapshot.trade_date == latest.c.trade_date)
+    ).all()
+    return {row.ticker: row for row in rows}
+
+def migrate_legacy_watchlist():
+    """ 第一次升級：舊的全域自選股原本是推播給 ADMIN_USER_ID 的，複製一份到他的個人清單 """
+    admin_id = os.getenv('ADMIN_USER_ID')
+    if not admin_id or UserWatchlist.query.first() is not None:
+        return
+    tickers = [stock.ticker for stock in Watchlist.query.order_by(Watchlist.id).all()]
+    now = datetime.datetime.now()
+    try:
+        for ticker in tickers:
+            db.session.add(UserWatchlist(owner=line_owner(admin_id), ticker=ticker, created_at=now))
+        db.session.commit()
+    except Exception:
+        # 多個 worker 同時開機，別人已經搬好了
+        db.session.rollback()
+        return
+    if tickers:
+        print(f"📦 已把舊自選股 {len(tickers)} 檔搬到 ADMIN 的個人清單")
+
+# --- 自選股讀取 (記憶體快取) ---
+# 每個 owner 的清單快取在 process 裡；新增 / 刪除會把共用版本號 +1，
+# 其他 gunicorn worker 下次讀取時發現版本不同就重新查資料庫
+DEFAULT_OWNER = 'default'
+_watchlist_cache = OrderedDict()  # { owner: (version, [tickers], 上次對版本號的時間) }，最近用到的放最後
+_watchlist_lock = threading.Lock()
+
+# 股票代號：4~6 碼數字 (ETF 可能多一個英文字，例如 00632R)，可以帶 .TW / .TWO
+TICKER_RE = re.compile(r'^\d{4,6}[A-Z]?(\.TWO?)?$')
+
+def normalize_ticker(text):
+    """ 使用者輸入的代號轉成標準寫法 (去空白、大寫、沒有後綴補 .TW)，看起來不像股票代號回傳 None """
+    ticker = (text or '').strip().upper()
+    if not TICKER_RE.match(ticker):
+        return None
+    return ticker if '.' in ticker else f"{ticker}.TW"
+
+def line_owner(user_id):
+    return f"line:{user_id}"
+
+def web_owner(create=False):
+    """
+    目前瀏覽器的 owner；還沒改過自選股的瀏覽器看的是預設清單 (DEFAULT_OWNER)
+    create=True (要新增 / 刪除時) 才建立個人清單，並先複製預設清單
+    這樣爬蟲、只看不改的訪客都不會在資料庫留下資料
+    """
+    owner = session.get('watchlist_owner')
+    if owner is not None or not create:
+        return owner or DEFAULT_OWNER
+
+    owner = f"web:{uuid.uuid4().hex}"
+    now = datetime.datetime.now()
+    for ticker in get_watchlist(DEFAULT_OWNER):
+        db.session.add(UserWatchlist(owner=owner, ticker=ticker, created_at=now))
+    db.session.commit()
+    session['watchlist_owner'] = owner
+    session.permanent = True
+    return owner
+
+def get_watchlist(owner):
+    """
+    回傳 owner 的自選股代號 (加入順序)，版本沒變就直接用記憶體裡的
+    剛對過版本號的 (WATCHLIST_VERSION_TTL 秒內) 連共用快取檔都不開；
+    自己這個 worker 改的會立刻丟掉記憶體裡的那份，別的 worker 改的最多晚幾秒看到
+    """
+    with _watchlist_lock:
+        entry = _watchlist_cache.get(owner)
+        if entry is not None and time.monotonic() - entry[2] < Config.WATCHLIST_VERSION_TTL:
+            _watchlist_cache.move_to_end(owner)
+            return list(entry[1])
+
+    version = cache.get_version(f"watchlist:{owner}")
+    with _watchlist_lock:
+        entry = _watchlist_cache.get(owner)
+        if entry is not None and version is not None and entry[0] == version:
+            _watchlist_cache[owner] = (version, entry[1], time.monotonic())
+            _watchlist_cache.move_to_end(owner)
+            return list(entry[1])
+
+    if owner == DEFAULT_OWNER:
+        tickers = [row.ticker for row in Watchlist.query.order_by(Watchlist.id).all()]
+    else:
+        tickers = [row.ticker for row in
+                   UserWatchlist.query.filter_by(owner=owner).order_by(UserWatchlist.id).all()]
+
+    with _watchlist_lock:
+        _watchlist_cache[owner] = (version, tickers, time.monotonic())
+        _watchlist_cache.move_to_end(owner)
+        while len(_watchlist_cache) > Config.WATCHLIST_CACHE_SIZE:
+            _watchlist_cache.popitem(last=False)
+    return list(tickers)
+
+def add_watchlist_ticker(owner, ticker):
+    if UserWatchlist.query.filter_by(owner=owner, ticker=ticker).first() is None:
+        db.session.add(UserWatchlist(owner=owner, ticker=ticker, created_at=datetime.datetime.now()))
+        db.session.commit()
+        cache.bump_version(f"watchlist:{owner}")
+        _forget_watchlist(owner)
+
+def remove_watchlist_ticker(owner, ticker):
+    deleted = UserWatchlist.query.filter_by(owner=owner, ticker=ticker).delete()
+    db.session.commit()
+    if deleted:
+        cache.bump_version(f"watchlist:{owner}")
+        _forget_watchlist(owner)
+    return deleted
+
+def _forget_watchlist(owner):
+    """ 自己改過的清單不等 WATCHLIST_VERSION_TTL，下次讀取直接重新查 """
+    with _watchlist_lock:
+        _watchlist_cache.pop(owner, None)
+
+def all_watchlist_tickers():
+    """ 所有人自選股的聯集 (不重複)，給盤後快照、預熱、批次用 """
+    tickers = get_watchlist(DEFAULT_OWNER)
+    rows = db.session.query(UserWatchlist.ticker).distinct().order_by(UserWatchlist.ticker).all()
+    return tickers + [row.ticker for row in rows if row.ticker not in tickers]
+
 with app.app_context():
     db.create_all()
+    migrate_legacy_watchlist()
 
 # ===========================
 #  PART 1: 定時推播任務
 # ===========================
 
-def send_morning_report():
-    """ 每天早上執行的任務：掃描自選股並推播 """
-    # 1. 取得使用者 ID (從 .env 讀取)
-    user_id = os.getenv('ADMIN_USER_ID')
-    if not user_id:
-        print("❌ 尚未設定 ADMIN_USER_ID，無法推播")
+def save_snapshot(ticker):
+    """ 下載 + 計算單檔快照，寫入 (或更新) DailySnapshot，回傳該筆資料 """
+    df, valid_ticker = market_data.get_stock_data(ticker)
+    if df is None:
+        return None
+
+    data = snapshot.compute_snapshot(df, valid_ticker)
+    row = DailySnapshot.query.filter_by(ticker=ticker, trade_date=data['trade_date']).first()
+    if row is None:
+        row = DailySnapshot(ticker=ticker, trade_date=data['trade_date'])
+        db.session.add(row)
+    for key, value in data.items():
+        setattr(row, key, value)
+    row.updated_at = datetime.datetime.now()
+    db.session.commit()
+    return row
+
+def build_daily_snapshot():
+    """ 盤後任務：把自選股的收盤數據算好存進 DailySnapshot """
+    if not trading_calendar.is_trading_day(trading_calendar.today_tw()):
+        print("💤 今天休市，不更新快照")
         return
 
-    print("⏰ 開始執行每日早報推播...")
-    
-    # 2. 讀取資料庫中的自選股
+    print("📸 開始建立盤後快照...")
     with app.app_context():
-        watchlist = Watchlist.query.all()
-        if not watchlist:
+        tickers = all_watchlist_tickers()
+        # ML 機率先一次批次算好 (存進快取)，下面逐檔建快照時直接拿
+        frames = {}
+        for ticker in tickers:
+            df, valid_ticker = market_data.get_stock_data(ticker)
+            if df is not None:
+                frames[valid_ticker] = df
+        try:
+            ml_predict.predict_batch(frames)
+        except Exception as e:
+            print(f"⚠️ ML 批次預測失敗 (改成逐檔算): {e}")
+        for ticker in tickers:
             try:
-                line_bot_api.push_message(user_id, TextSendMessage(text="早安！目前自選清單是空的，趕快加入股票吧！"))
-            except:
-                pass
+                save_snapshot(ticker)
+            except Exception as e:
+                db.session.rollback()
+                print(f"快照 {ticker} 失敗: {e}")
+        print(f"✅ 快照完成，共 {len(tickers)} 檔")
+
+def signal_record(df, ticker, **fields):
+    """ 組一筆訊號紀錄 (交易日取股價資料最後一天) """
+    record = {'ticker': ticker, 'trade_date': forward_returns.trade_dates(df.tail(1)).iloc[0]}
+    record.update(fields)
+    return record
+
+def record_signals(records, source):
+    """
+    寫入 (或更新) 訊號紀錄，一次 commit
+    同一檔同一天只會有一筆；這次沒有的欄位 (例如 LINE 沒跑 ML) 保留原本的值
+    """
+    if not records:
+        return
+    try:
+        keys = {(r['ticker'], r['trade_date']) for r in records}
+        existing = {
+            (row.ticker, row.trade_date): row
+            for row in SignalLog.query.filter(
+                SignalLog.ticker.in_({k[0] for k in keys}),
+                SignalLog.trade_date.in_({k[1] for k in keys}),
+            )
+        }
+        now = datetime.datetime.now()
+        for record in records:
+            key = (record['ticker'], record['trade_date'])
+            row = existing.get(key)
+            if row is None:
+                row = existing[key] = SignalLog(ticker=key[0], trade_date=key[1])
+                db.session.add(row)
+            for name, value in record.items():
+                if value is not None:
+                    setattr(row, name, value)
+            row.source = source
+            row.updated_at = now
+        db.session.commit()
+    except Exception as e:
+        # 紀錄失敗不影響使用者看結果
+        db.session.rollback()
+        print(f"⚠️ 訊號紀錄寫入失敗: {e}")
+
+def update_forward_returns():
+    """ 盤後任務：幫還沒滿 20 個交易日的訊號補上實際報酬 """
+    horizons = forward_returns.HORIZONS
+    since = trading_calendar.today_tw() - datetime.timedelta(days=Config.FORWARD_RETURN_LOOKBACK_DAYS)
+    last_col = getattr(SignalLog, forward_returns.column(max(horizons)))
+
+    with app.app_context():
+        pending = SignalLog.query.with_entities(SignalLog.id, SignalLog.ticker, SignalLog.trade_date) \
+            .filter(last_col.is_(None), SignalLog.trade_date >= since).all()
+        if not pending:
             return
 
-        report_content = "🌞 早安！您的自選股快報：\n"
-        
-        # 3. 逐一分析每一檔股票
-        for stock in watchlist:
+        signals = pd.DataFrame(pending, columns=['id', 'ticker', 'trade_date'])
+        bars = {}
+        for ticker in signals['ticker'].unique():
+            df, _ = market_data.get_stock_data(ticker)
+            bars[ticker] = df
+
+        merged = forward_returns.attach_forward_returns(signals, bars, horizons)
+        updates = []
+        for record in merged.to_dict('records'):
+            values = {forward_returns.column(h): record[forward_returns.column(h)] for h in horizons}
+            values = {k: v for k, v in values.items() if pd.notna(v)}
+            if values:
+                updates.append({'id': int(record['id']), **values})
+
+        db.session.bulk_update_mappings(SignalLog, updates)
+        db.session.commit()
+        print(f"📐 實際報酬更新 {len(updates)} / {len(signals)} 筆訊號")
+
+def signal_stats(days=None):
+    """
+    各種訊號的實際表現 (直接在資料庫彙總)：
+    {訊號: {count, ret_1d: {n, avg, hit_rate}, ...}}，hit_rate = 之後上漲的比例 (%)
+    """
+    conditions = {
+        'strategy_buy': SignalLog.is_buy.is_(True),
+        'volume_breakout': SignalLog.is_breakout.is_(True),
+        'ml_bullish': SignalLog.ml_prob > 50,
+        'ai_bullish': SignalLog.ai_score >= 0.2,
+        'ai_bearish': SignalLog.ai_score <= -0.2,
+    }
+    columns = []
+    for h in forward_returns.HORIZONS:
+        col = getattr(SignalLog, forward_returns.column(h))
+        columns += [
+            db.func.count(col),
+            db.func.avg(col),
+            db.func.sum(db.case((col > 0, 1), else_=0)),
+        ]
+
+    stats = {}
+    for name, condition in conditions.items():
+        query = db.session.query(db.func.count(SignalLog.id), *columns).filter(condition)
+        if days:
+            query = query.filter(SignalLog.trade_date >= trading_calendar.today_tw() - datetime.timedelta(days=days))
+        row = query.one()
+        item = {'count': row[0]}
+        for i, h in enumerate(forward_returns.HORIZONS):
+            n, avg, wins = row[1 + i * 3: 4 + i * 3]
+            item[forward_returns.column(h)] = {
+                'n': n,
+                'avg': round(avg, 2) if avg is not None else None,
+                'hit_rate': round(wins * 100 / n, 1) if n else None,
+            }
+        stats[name] = item
+    return stats
+
+def run_prewarm(job_name):
+    """ 預熱任務：自選股 + 熱門股，依 Config.PREWARM_JOBS 設定的階段暖快取 """
+    if not trading_calendar.is_trading_day(trading_calendar.today_tw()):
+        return
+
+    job = next((j for j in Config.PREWARM_JOBS if j['name'] == job_name), None)
+    if job is None:
+        print(f"❌ 找不到預熱任務 {job_name}")
+        return
+
+    with app.app_context():
+        tickers = all_watchlist_tickers()
+        tickers += [t for t in Config.POPULAR_TICKERS if t not in tickers]
+        prewarm.run_job(job_name, job['stages'], tickers)
+
+def run_ml_training():
+    """ 盤後任務：共用 ML 模型太舊就用自選股 + 熱門股 + 最近有人看過的股票重新訓練，順便把機率算好 """
+    if not trading_calendar.is_trading_day(trading_calendar.today_tw()):
+        return
+
+    with app.app_context():
+        tickers = all_watchlist_tickers()
+    tickers += [t for t in Config.POPULAR_TICKERS + similarity.recent_tickers() if t not in tickers]
+    frames = {}
+    for ticker in tickers:
+        df, valid_ticker = market_data.get_stock_data(ticker)
+        if df is not None:
+            frames[valid_ticker] = df
+    start = time.perf_counter()
+    results = ml_predict.predict_batch(frames)
+    done = sum(1 for prob in results.values() if prob is not None)
+    print(f"🤖 ML 預測完成：{done}/{len(frames)} 檔，{time.perf_counter() - start:.1f} 秒")
+
+def run_robustness():
+    """ 盤後任務：自選股 + 熱門股的回測穩健度先算好 (結果頁直接用快取) """
+    if not trading_calendar.is_trading_day(trading_calendar.today_tw()):
+        return
+
+    with app.app_context():
+        tickers = all_watchlist_tickers()
+    tickers += [t for t in Config.POPULAR_TICKERS if t not in tickers]
+    frames = {}
+    for ticker in tickers:
+        df, valid_ticker = market_data.get_stock_data(ticker)
+        if df is not None:
+            frames[valid_ticker] = df
+    start = time.perf_counter()
+    # 網頁 process 有很多執行緒 (請求、aiohttp 事件迴圈、排程)，不能 fork；預設直接在這條執行緒算
+    results = robustness.run_universe(frames, workers=Config.ROBUSTNESS_APP_WORKERS, start_method='spawn')
+    done = sum(1 for r in results.values() if r is not None)
+    print(f"🎲 穩健度分析完成：{done}/{len(frames)} 檔，{time.perf_counter() - start:.1f} 秒")
+
+def run_similarity_index():
+    """ 盤後任務：重建相似股索引 (自選股 + 熱門股 + 最近有人看過的股票，太久沒人看的拿掉) """
+    if not trading_calendar.is_trading_day(trading_calendar.today_tw()):
+        return
+
+    with app.app_context():
+        tickers = all_watchlist_tickers()
+    tickers += [t for t in Config.POPULAR_TICKERS + similarity.recent_tickers() if t not in tickers]
+    frames = {}
+    for ticker in tickers:
+        df, valid_ticker = market_data.get_stock_data(ticker)
+        if df is not None:
+            frames[valid_ticker] = df
+    # 自選股 / 熱門股就算很久沒人點進去看也要留著 (代號可能沒補 .TW，兩種寫法都算)
+    updated = similarity.rebuild(frames, keep=set(tickers) | set(frames))
+    print(f"🧭 相似股索引更新 {updated} 檔 (共 {len(similarity.tickers())} 檔)")
+
+def _report_line(ticker, snap, expected_date):
+    """ expected_date：早報應該要有的最新交易日，快照比這天舊 (停牌、資料源沒更新) 就標上日期 """
+    emoji = "🔴" if snap.change_pct > 0 else "🟢" if snap.change_pct < 0 else "⚪"
+    line = f"{emoji} {ticker.replace('.TWO','').replace('.TW','')}: {snap.close} ({snap.change_pct}%)"
+    if snap.trade_date < expected_date:
+        line += f" ⚠️ {snap.trade_date:%m/%d} 的資料"
+    return line + "\n"
+
+def delivered_user_ids(job, run_date):
+    rows = db.session.query(DeliveryLog.user_id).filter_by(job=job, run_date=run_date, status='sent').all()
+    return {row.user_id for row in rows}
+
+def record_deliveries(job, run_date, results):
+    """ 把 line_push.deliver() 的結果寫進 DeliveryLog (同一天重跑會覆蓋狀態) """
+    now = datetime.datetime.now()
+    try:
+        existing = {row.user_id: row for row in DeliveryLog.query.filter_by(job=job, run_date=run_date).all()}
+        for result in results:
+            for user_id in result.batch.to:
+                row = existing.get(user_id)
+                if row is None:
+                    row = DeliveryLog(job=job, run_date=run_date, user_id=user_id, attempts=0)
+                    db.session.add(row)
+                row.status = result.status
+                row.attempts = (row.attempts or 0) + result.attempts
+                row.error = result.error[:200] if result.error else None
+                row.request_id = result.request_id
+                row.updated_at = now
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ 推播紀錄寫入失敗: {e}")
+
+def send_morning_report():
+    """
+    每天早上執行的任務：推播每位 LINE 使用者的自選股快報
+    1. 一次查出所有訂閱 (owner, ticker)
+    2. 每檔股票只讀一次快照 (沒有快照的才現場補算)，不管有幾個人訂閱
+    3. 自選清單一模一樣的使用者共用同一則訊息，交給 line_push 分批 multicast
+    4. 結果記在 DeliveryLog；同一天重跑只會補送之前失敗的人
+    """
+    print("⏰ 開始執行每日早報推播...")
+    job = 'morning_report'
+    run_date = trading_calendar.today_tw()
+
+    with app.app_context():
+        rows = db.session.query(UserWatchlist.owner, UserWatchlist.ticker) \
+            .filter(UserWatchlist.owner.like('line:%')).order_by(UserWatchlist.id).all()
+
+        subscriptions = {}  # { user_id: [tickers] }
+        for owner, ticker in rows:
+            subscriptions.setdefault(owner[len('line:'):], []).append(ticker)
+
+        groups = []  # [(messages, [user_ids])]
+        admin_id = os.getenv('ADMIN_USER_ID')
+        if admin_id and admin_id not in subscriptions:
+            groups.append(([line_push.text_message("早安！目前自選清單是空的，趕快加入股票吧！")], [admin_id]))
+
+        # 今天已經送到的人不要再送
+        done = delivered_user_ids(job, run_date)
+        subscriptions = {u: t for u, t in subscriptions.items() if u not in done}
+        groups = [(m, [u for u in ids if u not in done]) for m, ids in groups]
+
+        # 每檔股票只處理一次
+        tickers = sorted({t for user_tickers in subscriptions.values() for t in user_tickers})
+        snapshots = latest_snapshots(tickers)
+        expected_date = trading_calendar.previous_trading_day(run_date)
+        lines = {}
+        for ticker in tickers:
+            snap = snapshots.get(ticker)
             try:
-                ticker = stock.ticker
-                df, valid_ticker = market_data.get_stock_data(ticker)
-                
-                if df is not None:
-                    # 簡單判斷漲跌
-                    today = df.iloc[-1]
-                    price = round(today['Close'], 2)
-                    prev_close = df['Close'].iloc[-2] if len(df) >= 2 else price
-                    change_pct = round(((price - prev_close) / prev_close) * 100, 2)
-                    
-                    # 加上 emoji
-                    emoji = "🔴" if change_pct > 0 else "🟢" if change_pct < 0 else "⚪"
-                    
-                    report_content += f"{emoji} {valid_ticker.replace('.TW','')}: {price} ({change_pct}%)\n"
+                # 沒有快照、或快照比上一個交易日舊 (昨天盤後沒建到)：現場補算
+                if snap is None or snap.trade_date < expected_date:
+                    snap = save_snapshot(ticker) or snap
             except Exception as e:
-                print(f"分析 {stock.ticker} 失敗: {e}")
+                db.session.rollback()
+                print(f"分析 {ticker} 失敗: {e}")
+            if snap is not None:
+                # 補算不到新的就用舊快照，但標上日期，不要讓人以為是昨天的收盤
+                lines[ticker] = _report_line(ticker, snap, expected_date)
+
+        # 清單相同的使用者合併成一組
+        same_list = {}  # { (tickers...): [user_ids] }
+        for user_id, user_tickers in subscriptions.items():
+            same_list.setdefault(tuple(user_tickers), []).append(user_id)
+        for user_tickers, user_ids in same_list.items():
+            report_content = "🌞 早安！您的自選股快報：\n"
+            report_content += "".join(lines[t] for t in user_tickers if t in lines)
+            report_content += "\n💡 輸入股票代號可查看詳細 AI 與策略分析！"
+            groups.append(([line_push.text_message(report_content)], user_ids))
 
-        report_content += "\n💡 輸入股票代號可查看詳細 AI 與策略分析！"
+        groups = [(m, ids) for m, ids in groups if ids]
+        if not groups:
+            print(f"🍂 沒有需要推播的對象 (今天已送達 {len(done)} 人)")
+            return
 
-        # 4. 發送推播
         try:
-            line_bot_api.push_message(user_id, TextSendMessage(text=report_content))
-            print("✅ 早報推播成功！")
+            results = line_push.deliver(groups, token=app.config.get('LINE_CHANNEL_ACCESS_TOKEN'))
         except Exception as e:
-            print(f"❌ 推播失敗: {e}")
+            print(f"❌ 早報推播失敗: {e}")
+            return
+        record_deliveries(job, run_date, results)
+
+    failed = sum(len(r.batch.to) for r in results if not r.ok)
+    print(f"✅ 早報推播完成：{len(tickers)} 檔股票、{len(groups)} 種內容、{len(results)} 批，失敗 {failed} 人")
+    if failed:
+        print("💡 失敗的人已記錄在 DeliveryLog，同一天再執行一次 send_morning_report 只會補送他們")
+
+# 盤中監控：每天一個 monitor (起始狀態是昨天收盤算的，隔天整個換掉)
+_intraday = {'day': None, 'monitor': None, 'recorder': None}
+
+def intraday_monitor():
+    day = trading_calendar.today_tw()
+    if _intraday['day'] != day:
+        if _intraday['recorder'] is not None:
+            _intraday['recorder'].close()
+        recorder = None
+        if Config.INTRADAY_RECORD_DIR:
+            recorder = intraday.QuoteRecorder(os.path.join(Config.INTRADAY_RECORD_DIR, f"quotes-{day}.jsonl"))
+        _intraday.update(day=day, recorder=recorder,
+                         monitor=intraday.IntradayMonitor(intraday.TwseMisSource(), recorder=recorder))
+    return _intraday['monitor']
+
+def run_intraday_poll():
+    """ 盤中每 INTRADAY_POLL_SECONDS 秒：抓自選股報價，爆量的推播給有加自選的 LINE 使用者 """
+    if not trading_calendar.is_market_open():
+        return
+
+    with app.app_context():
+        tickers = all_watchlist_tickers()
+        if not tickers:
+            return
+        try:
+            alerts = intraday_monitor().poll(tickers)
+        except Exception as e:
+            print(f"⚠️ [盤中] 報價更新失敗: {e}")
+            return
+        if alerts:
+            send_intraday_alerts(alerts)
+
+def send_intraday_alerts(alerts, run_date=None):
+    """
+    盤中提醒：每則提醒推給自選清單有這檔的 LINE 使用者
+    DeliveryLog 的 job 是 alert:<種類>:<股票>，同一天每人只會收到一次 (重開機也一樣)
+    """
+    run_date = run_date or trading_calendar.today_tw()
+    tickers = sorted({a['ticker'] for a in alerts})
+    rows = db.session.query(UserWatchlist.owner, UserWatchlist.ticker) \
+        .filter(UserWatchlist.ticker.in_(tickers), UserWatchlist.owner.like('line:%')).all()
+    watchers = {}  # { ticker: [user_ids] }
+    for owner, ticker in rows:
+        watchers.setdefault(ticker, []).append(owner[len('line:'):])
+
+    groups, jobs, sent = [], {}, []
+    for alert in alerts:
+        job = f"alert:{alert['kind']}:{alert['ticker']}"
+        done = delivered_user_ids(job, run_date)
+        user_ids = [u for u in watchers.get(alert['ticker'], []) if u not in done]
+        if not user_ids:
+            continue
+        messages = [line_push.text_message(alert['text'])]
+        jobs[id(messages)] = job
+        groups.append((messages, user_ids))
+        sent.append(alert['ticker'])
+    if not groups:
+        return
+
+    try:
+        results = line_push.deliver(groups, token=app.config.get('LINE_CHANNEL_ACCESS_TOKEN'))
+    except Exception as e:
+        print(f"❌ 盤中提醒推播失敗: {e}")
+        return
+    by_job = {}
+    for result in results:
+        by_job.setdefault(jobs[id(result.batch.messages)], []).append(result)
+    for job, job_results in by_job.items():
+        record_deliveries(job, run_date, job_results)
+    print(f"🚨 盤中提醒 {len(groups)} 則：" + ", ".join(sent))
 
-# 啟動排程器
-if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+def start_scheduler():
+    """ 只在拿到主控權的 process 執行 (見 src/leader.py) """
+    from apscheduler.schedulers.background import BackgroundScheduler
     tw_timezone = timezone('Asia/Taipei') 
     scheduler = BackgroundScheduler(timezone=tw_timezone)
     # 設定每天早上 09:00 執行
     scheduler.add_job(func=send_morning_report, trigger="cron", hour=9, minute=0)
+    # 共用 ML 模型 (太舊才重新訓練) 與全部股票的機率，在快照之前
+    scheduler.add_job(func=run_ml_training, trigger="cron", day_of_week="mon-fri",
+                      hour=Config.ML_TRAIN_HOUR, minute=20)
+    # 盤後 14:30 (yfinance 定稿後) 建立當日快照
+    scheduler.add_job(func=build_daily_snapshot, trigger="cron", day_of_week="mon-fri", hour=14, minute=30)
+    # 接著幫過去的訊號補上實際報酬
+    scheduler.add_job(func=update_forward_returns, trigger="cron", day_of_week="mon-fri", hour=14, minute=45)
+    # 回測穩健度 (幾千次模擬，先算好結果頁就不用等)
+    scheduler.add_job(func=run_robustness, trigger="cron", day_of_week="mon-fri",
+                      hour=Config.ROBUSTNESS_NIGHTLY_HOUR, minute=0)
+    # 相似股索引
+    scheduler.add_job(func=run_similarity_index, trigger="cron", day_of_week="mon-fri",
+                      hour=Config.SIMILARITY_NIGHTLY_HOUR, minute=15)
+    # 盤中監控 (非盤中時間直接跳過)
+    if Config.INTRADAY_ENABLED:
+        scheduler.add_job(func=run_intraday_poll, trigger="interval", seconds=Config.INTRADAY_POLL_SECONDS,
+                          id="intraday_poll", max_instances=1, coalesce=True)
+    # 預熱任務 (盤後 / 開盤前分段執行)
+    for job in Config.PREWARM_JOBS:
+        scheduler.add_job(func=run_prewarm, args=[job['name']], trigger="cron",
+                          day_of_week="mon-fri", hour=job['hour'], minute=job['minute'],
+                          id=f"prewarm_{job['name']}", misfire_grace_time=600)
+    # 重新啟動時，把今天被中斷的預熱接著跑完
+    for job_name in prewarm.unfinished_jobs():
+        scheduler.add_job(func=run_prewarm, args=[job_name], id=f"resume_{job_name}")
     scheduler.start()
     atexit.register(lambda: scheduler.shutdown())
 
+# 啟動排程器 (多個 gunicorn worker 只會有一個真的啟動)
+if Config.SCHEDULER_ENABLED and (not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    leader.run_when_leader(Config.SCHEDULER_LOCK_FILE, start_scheduler)
+
 # ===========================
 #  PART 2: LINE Bot 互動
 # ===========================
@@ -114,18 +711,47 @@ def callback():
     body = request.get_data(as_text=True)
     try:
         handler.handle(body, signature)
-    except InvalidSignatureError:
+    except line_exceptions.InvalidSignatureError:
         abort(400)
     return 'OK'
 
-@handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     user_msg = event.message.text.strip()
     
     # 簡易後門：查詢 User ID
     if user_msg.upper() == "ID":
         user_id = event.source.user_id
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"您的 User ID 是：\n{user_id}\n(請貼到 .env 檔案中)"))
+        line_bot_api.reply_message(event.reply_token, line_models.TextSendMessage(text=f"您的 User ID 是：\n{user_id}\n(請貼到 .env 檔案中)"))
+        return
+
+    # 個人自選清單：「加入 2330」/「+2330」、「刪除 2330」/「-2330」、「清單」
+    owner = line_owner(event.source.user_id)
+    command, _, arg = user_msg.partition(' ')
+    if user_msg[:1] in ('+', '-') and user_msg[1:].strip():
+        command, arg = user_msg[0], user_msg[1:]
+    if command in ('加入', '+', '刪除', '-') and arg.strip():
+        # 跟網頁 /stock/<ticker> 一樣的代號檢查，亂打的字不會寫進自選清單
+        ticker = normalize_ticker(arg)
+        if ticker is None and command in ('刪除', '-'):
+            # 刪除放寬一點：以前沒檢查時存進去的怪代號也要刪得掉
+            ticker = arg.strip().upper()
+        if ticker is None:
+            line_bot_api.reply_message(event.reply_token, line_models.TextSendMessage(
+                text=f"❓ 看不懂的股票代號：{arg.strip()[:20]}\n請輸入像「加入 2330」這樣的格式"))
+            return
+        if command in ('加入', '+'):
+            add_watchlist_ticker(owner, ticker)
+            text = f"✅ 已加入 {ticker}"
+        else:
+            text = f"🗑️ 已移除 {ticker}" if remove_watchlist_ticker(owner, ticker) else f"清單裡沒有 {ticker}"
+        line_bot_api.reply_message(event.reply_token, line_models.TextSendMessage(
+            text=text, quick_reply=watchlist_quick_reply(owner)))
+        return
+    if user_msg in ('清單', '自選'):
+        tickers = get_watchlist(owner)
+        text = "📋 您的自選股：\n" + "\n".join(tickers) if tickers else "自選清單是空的，輸入「加入 2330」試試看！"
+        line_bot_api.reply_message(event.reply_token, line_models.TextSendMessage(
+            text=text, quick_reply=watchlist_quick_reply(owner)))
         return
 
     # 判斷是否為股票代號 (數字 或 .TW 結尾)
@@ -136,7 +762,7 @@ def handle_message(event):
             # 1. 抓取資料
             df, valid_ticker = market_data.get_stock_data(ticker)
             if df is None:
-                line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"❌ 找不到 {ticker}"))
+                line_bot_api.reply_message(event.reply_token, line_models.TextSendMessage(text=f"❌ 找不到 {ticker}"))
                 return
 
             # 2. 執行策略分析 (爆量檢查 + 實戰訊號)
@@ -154,9 +780,6 @@ def handle_message(event):
             # 3. 抓新聞 & AI 分析
             news = market_data.get_recent_news(stock_name)
             
-            model_name = app.config.get('GEMINI_MODEL_NAME')
-            model = genai.GenerativeModel(model_name)
-            
             news_text = "\n".join([f"- {n}" for n in news]) if news else "無重大新聞"
             
             prompt = f"""
@@ -166,8 +789,16 @@ def handle_message(event):
             新聞：{news_text}
             """
             
-            response = model.generate_content(prompt)
-            ai_comment = response.text.strip()
+            try:
+                ai_comment = llm.generate(prompt, priority=llm.INTERACTIVE, fallback_key=f"line:{stock_name}")
+            except llm.LLMFallback as e:
+                ai_comment = f"(AI 額度不足，上一次的簡評) {e.text}"
+            except llm.LLMBusyError:
+                ai_comment = "AI 額度暫時用完，請稍後再試"
+
+            record_signals([signal_record(df, valid_ticker, close=price, vol_ratio=vol_ratio, rsi=tech_info.get('rsi'),
+                                          is_breakout=bool(is_breakout), is_buy=bool(is_buy),
+                                          signal_msg=signal_msg)], source='line')
 
             # 4. 組合回覆訊息
             signal_icon = "🚀 強力買進" if is_buy else "⏸️ 觀望"
@@ -185,12 +816,34 @@ def handle_message(event):
                 f"----------------\n"
                 f"💡 詳情請見網頁版"
             )
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=result_msg))
+            line_bot_api.reply_message(event.reply_token, line_models.TextSendMessage(text=result_msg))
 
         except Exception as e:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"系統忙碌中: {str(e)}"))
+            line_bot_api.reply_message(event.reply_token, line_models.TextSendMessage(text=f"系統忙碌中: {str(e)}"))
     else:
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text="請輸入股票代號 (如 2330)"))
+        line_bot_api.reply_message(event.reply_token, line_models.TextSendMessage(
+            text="請輸入股票代號 (如 2330)",
+            quick_reply=watchlist_quick_reply(owner)
+        ))
+
+def watchlist_quick_reply(owner):
+    """ 用盤後快照做 LINE 快速回覆按鈕 (例如「🔴 2330 +1.5%」)，最多 13 顆 """
+    tickers = get_watchlist(owner)[:13]
+    if not tickers:
+        return None
+
+    snapshots = latest_snapshots(tickers)
+    items = []
+    for ticker in tickers:
+        code = ticker.replace('.TWO', '').replace('.TW', '')
+        snap = snapshots.get(ticker)
+        if snap is None:
+            label = code
+        else:
+            emoji = "🔴" if snap.change_pct > 0 else "🟢" if snap.change_pct < 0 else "⚪"
+            label = f"{emoji} {code} {snap.change_pct:+}%"
+        items.append(line_models.QuickReplyButton(action=line_models.MessageAction(label=label[:20], text=code)))
+    return line_models.QuickReply(items=items)
 
 # ===========================
 #  PART 3: 網頁路由
@@ -198,37 +851,173 @@ def handle_message(event):
 
 @app.route('/add/<ticker>')
 def add_to_watchlist(ticker):
-    exists = Watchlist.query.filter_by(ticker=ticker).first()
-    if not exists:
-        new_stock = Watchlist(ticker=ticker)
-        db.session.add(new_stock)
-        db.session.commit()
+    ticker = normalize_ticker(ticker)
+    if ticker is None:
+        abort(404)
+    add_watchlist_ticker(web_owner(create=True), ticker)
     return redirect(url_for('index'))
 
-@app.route('/delete/<int:id>')
-def delete_from_watchlist(id):
-    stock = Watchlist.query.get_or_404(id)
-    db.session.delete(stock)
-    db.session.commit()
+@app.route('/delete/<ticker>')
+def delete_from_watchlist(ticker):
+    remove_watchlist_ticker(web_owner(create=True), ticker)
     return redirect(url_for('index'))
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    watchlist = Watchlist.query.all()
+    watchlist = get_watchlist(web_owner())
     if request.method == 'POST':
         ticker = request.form.get('ticker').strip()
         if not ticker.endswith('.TW') and ticker.isdigit():
             ticker = f"{ticker}.TW"
+        # 結果頁改成 GET 網址，重新整理 / 上一頁才能用快取與 304
+        return redirect(url_for('stock_page', ticker=ticker, **request.args.to_dict()), code=303)
+    snapshots = latest_snapshots(watchlist)
+    return render_template('index.html', watchlist=watchlist, snapshots=snapshots)
+
+@app.route('/stock/<ticker>')
+def stock_page(ticker):
+    """
+    結果頁 (可快取)：輸入資料的版本都沒變就直接回傳上次的 HTML，
+    瀏覽器帶 If-None-Match 來而且版本一樣則回 304，連 HTML 都不用傳
+    """
+    ticker = normalize_ticker(ticker)
+    if ticker is None:
+        abort(404)
+    if profiling.should_profile(request):
+        return profiling.run_profiled(analyze, ticker, label=ticker)
+    # 要顯示各階段耗時就一定要真的跑一次
+    if app.config.get('SHOW_TIMINGS') or request.args.get('timing'):
         return analyze(ticker)
-    return render_template('index.html', watchlist=watchlist)
+
+    versions = page_cache.input_versions(ticker)
+    if versions is not None:
+        tag = page_cache.etag(ticker, versions)
+        if request.if_none_match.contains(tag):
+            metrics.inc('page_cache_requests_total', result='not_modified')
+            return _page_response(None, tag, versions, status=304)
+        html = page_cache.get(ticker, tag)
+        if html is not None:
+            metrics.inc('page_cache_requests_total', result='hit')
+            return _page_response(html, tag, versions)
+
+    metrics.inc('page_cache_requests_total', result='miss')
+    html = analyze(ticker)
+    # 分析完輸入都進快取了，這時候的版本才對得上這份 HTML
+    versions = page_cache.input_versions(ticker)
+    if versions is None:
+        return html
+    tag = page_cache.etag(ticker, versions)
+    page_cache.put(ticker, tag, html)
+    return _page_response(html, tag, versions)
+
+def _page_response(html, tag, versions, status=200):
+    response = Response(html, status=status, mimetype='text/html')
+    response.set_etag(tag)
+    response.last_modified = page_cache.last_modified(versions)
+    # no-cache = 可以存，但每次都要回來確認 (帶 If-None-Match)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/healthz')
+def healthz():
+    """ 健康檢查：不碰資料庫也不載入分析模組，開機後馬上能回應 """
+    return 'OK'
+
+@app.route('/similar/<ticker>')
+def similar_stocks(ticker):
+    """ 走勢最像的股票：?k=10 (預設 Config.SIMILARITY_TOP_K)；不在索引裡就現抓股價算指紋並加進索引 """
+    ticker = ticker.strip().upper()
+    if ticker.isdigit():
+        ticker = f"{ticker}.TW"
+    k = min(request.args.get('k', Config.SIMILARITY_TOP_K, type=int), 50)
+    result = similarity.query(ticker, k)
+    if not result and ticker not in similarity.tickers():
+        df, valid_ticker = market_data.get_stock_data(ticker)
+        if df is None:
+            abort(404)
+        ticker = valid_ticker
+        similarity.update(ticker, df)
+        result = similarity.query(ticker, k, df=df)
+    return jsonify({'ticker': ticker, 'similar': result})
+
+@app.route('/signals/stats')
+def signals_stats():
+    """ 訊號實際表現：?days=90 只看最近 90 天 """
+    days = request.args.get('days', type=int)
+    return jsonify(signal_stats(days))
+
+@app.route('/signals/<ticker>')
+def signals_history(ticker):
+    """ 單檔的訊號紀錄 (新到舊) """
+    if ticker.isdigit():
+        ticker = f"{ticker}.TW"
+    rows = SignalLog.query.filter_by(ticker=ticker).order_by(SignalLog.trade_date.desc()).limit(250).all()
+    columns = ['trade_date', 'source', 'close', 'vol_ratio', 'rsi', 'is_breakout', 'is_buy', 'signal_msg',
+               'ml_prob', 'ai_score', 'ret_1d', 'ret_5d', 'ret_20d']
+    return jsonify([
+        {c: (getattr(row, c).isoformat() if c == 'trade_date' else getattr(row, c)) for c in columns}
+        for row in rows
+    ])
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """ Prometheus 抓取用 (各 worker 各自統計) """
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def _check_profile_token():
+    token = app.config.get('PROFILE_TOKEN')
+    # 沒設定 token 就不開放 (剖析檔有內部路徑與耗時)，只留隨機抽樣寫到磁碟
+    if not token:
+        abort(404)
+    if request.args.get('token') != token and request.headers.get('X-Profile-Token') != token:
+        abort(403)
+
+@app.route('/profiles')
+def list_profiles():
+    """ 列出最近的剖析紀錄 (股票、總耗時、各階段耗時) """
+    _check_profile_token()
+    return jsonify(profiling.list_profiles())
+
+@app.route('/profiles/<name>')
+def download_profile(name):
+    """ 下載剖析檔：預設 .prof (snakeviz / pstats 可讀)，?format=txt 看文字摘要 """
+    _check_profile_token()
+    ext = '.txt' if request.args.get('format') == 'txt' else '.prof'
+    path = profiling.profile_file(name, ext) or profiling.profile_file(name, '.txt')
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=path.endswith('.prof'))
+
+@app.route('/ai_comment/<ticker>')
+def stream_ai_comment(ticker):
+    """ AI 總評串流：輸入 (股價、籌碼、新聞) 都走快取，只有 Gemini 是邊產生邊送 """
+    df, valid_ticker = market_data.get_stock_data(ticker)
+    if df is None:
+        abort(404)
+    is_breakout, tech_info = strategy.check_volume_breakout(df)
+    chip_data = chips.get_institutional_chips(valid_ticker)
+    stock_name = valid_ticker.replace('.TWO', '').replace('.TW', '')
+    news = market_data.get_recent_news(stock_name)
+
+    def stream():
+        yield from sentiment.stream_sentiment(stock_name, news, tech_info, chip_data)
+        # 串流結束 (結果已進快取) 再把 AI 分數補進今天的訊號紀錄
+        cached_ai = sentiment.get_cached_sentiment(stock_name, news, tech_info, chip_data)
+        if cached_ai is not None:
+            record_signals([signal_record(df, valid_ticker, ai_score=cached_ai[0])], source='web')
+
+    # X-Accel-Buffering：叫 nginx 不要整包收完才送出
+    return Response(stream_with_context(stream()), mimetype='text/plain; charset=utf-8',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 def analyze(ticker):
-    watchlist = Watchlist.query.all()
+    metrics.start_request()
+    start = time.perf_counter()
     
     # 1. 抓取資料
     df, valid_ticker = market_data.get_stock_data(ticker)
     if df is None:
-        return render_template('result.html', error=f"找不到股票 {ticker}", watchlist=watchlist)
+        return render_template('result.html', error=f"找不到股票 {ticker}")
     ticker = valid_ticker
 
     # 2. 技術分析
@@ -244,20 +1033,44 @@ def analyze(ticker):
     stock_name = valid_ticker.replace('.TWO', '').replace('.TW', '')
     news = market_data.get_recent_news(stock_name)
     
-    ai_score, ai_comment = sentiment.analyze_sentiment(
-        stock_name=stock_name,
-        news_list=news,
-        tech_data=tech_info,  
-        chip_data=chip_data   
-    )
+    # 快取沒有的話先把頁面送出去，AI 總評由網頁另外串流 (/ai_comment/<ticker>)
+    # 分層模式 (SENTIMENT_MODE='tiered')：串流期間先顯示新聞關鍵字的快速分數
+    ai_pending = False
+    cached_ai = sentiment.get_cached_sentiment(stock_name, news, tech_info, chip_data)
+    if cached_ai is not None:
+        ai_score, ai_comment = cached_ai
+    elif app.config.get('AI_STREAMING') and Config.SENTIMENT_MODE != 'fast':
+        ai_pending = True
+        ai_score, ai_comment = sentiment.quick_score(news) if Config.SENTIMENT_MODE == 'tiered' else (0, "")
+    else:
+        ai_score, ai_comment = sentiment.analyze_sentiment(
+            stock_name=stock_name,
+            news_list=news,
+            tech_data=tech_info,  
+            chip_data=chip_data   
+        )
+        # 快速分數 (分層模式 / LLM 失敗的備用) 不記進訊號紀錄的 AI 分數
+        cached_ai = sentiment.get_cached_sentiment(stock_name, news, tech_info, chip_data)
 
     # 6. ML & 回測 & 實戰訊號
-    ml_prob = ml_predict.predict_next_day(df)
+    ml_prob = ml_predict.predict_next_day(df, ticker)
     backtest_result = backtest.run_backtest(df)
+    robustness_result = robustness.get_or_analyze(df, ticker) if Config.ROBUSTNESS_ON_PAGE else None
+
+    # 相似股：這檔的指紋順手更新進索引 (一天一次)，再查走勢最像的幾檔
+    similarity.update(ticker, df)
+    similar = similarity.query(ticker, df=df)
     
     # [新增] 網頁版也要顯示實戰訊號
     is_buy, signal_msg = strategy.check_buy_signal(df)
     
+    record_signals([signal_record(
+        df, ticker,
+        close=tech_info.get('price'), vol_ratio=tech_info.get('vol_ratio'), rsi=tech_info.get('rsi'),
+        is_breakout=bool(is_breakout), is_buy=bool(is_buy), signal_msg=signal_msg,
+        ml_prob=ml_prob, ai_score=cached_ai[0] if cached_ai is not None else None,
+    )], source='web')
+
     result = {
         "ticker": ticker,
         "price": tech_info.get('price', 'N/A'),
@@ -269,14 +1082,23 @@ def analyze(ticker):
         "macd_status": tech_info.get('macd_status', '無數據'),
         "ml_prob": ml_prob,
         "backtest": backtest_result,
+        "robustness": robustness_result,
+        "similar": similar,
         "ai_score": ai_score,
         "ai_comment": ai_comment,
+        "ai_pending": ai_pending,
         "signal": "強力買進" if is_buy else "觀望", # 這裡改用嚴格的策略判斷
         "signal_msg": signal_msg,                 # [新增] 可以傳給網頁顯示
         "chips": chip_data 
     }
     
-    return render_template('result.html', result=result, plot_div=plot_div, watchlist=watchlist)
+    total_ms = round((time.perf_counter() - start) * 1000, 1)
+    metrics.observe('request_latency_seconds', total_ms / 1000, route='analyze')
+    timings = None
+    if app.config.get('SHOW_TIMINGS') or request.args.get('timing'):
+        timings = {"stages": metrics.request_timings(), "total_ms": total_ms}
+
+    return render_template('result.html', result=result, plot_div=plot_div, timings=timings)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+運算核心 (src/kernels.py) 的一致性檢查與全市場規模量測
+
+用法 (在專案根目錄執行)：
+    python -m bench.bench_kernels --check                  # 只檢查結果跟原本 pandas 寫法一致 (不一致就失敗)
+    python -m bench.bench_kernels                          # 檢查 + 量測 (預設 2000 檔 × 1 年)
+    python -m bench.bench_kernels --tickers 2000 --size 5y
+    KERNEL_BACKEND=numpy python -m bench.bench_kernels     # 有裝 numba 也強制量 numpy 版
+    python -m bench.bench_kernels --tickers 200 --robustness   # 加量回測穩健度模擬
+
+一致性檢查涵蓋：上市較晚 (前面補 NaN)、中間停牌 (缺值)、平盤 (漲跌都是 0) 的股票。
+"""
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from bench import fixtures
+from src import kernels, strategy, backtest, robustness
+
+def _ragged_close(n_tickers, n_bars, seed=0):
+    """ (股票 × 日期) 收盤價，刻意放進各種邊界情況 """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0004, 0.018, (n_tickers, n_bars)), axis=1))
+    close = close.round(2)
+    if n_tickers >= 4:
+        close[1, :n_bars // 3] = np.nan                 # 上市較晚
+        close[2, n_bars // 2:n_bars // 2 + 5] = np.nan  # 停牌 5 天
+        close[3, :] = 50.0                              # 一直平盤 (RSI = 0/0)
+    return close
+
+def _same(a, b):
+    return np.array_equal(a, b, equal_nan=True)
+
+def _max_diff(a, b):
+    with np.errstate(invalid='ignore'):
+        diff = np.abs(a - b)
+    return np.nanmax(diff) if np.isfinite(diff).any() else 0.0
+
+def check_indicators(backend, n_tickers=50, n_bars=300):
+    close = _ragged_close(n_tickers, n_bars)
+
+    kernels.set_backend('pandas')
+    expected_rsi = np.vstack([strategy.calculate_rsi(pd.Series(row)).to_numpy() for row in close])
+    expected_macd = [np.vstack(lines) for lines in
+                     zip(*[[s.to_numpy() for s in strategy.calculate_macd(pd.Series(row))] for row in close])]
+
+    kernels.set_backend(backend)
+    result = kernels.indicators(close)
+    failures = []
+    for name, got, expected in (('rsi', result['rsi'], expected_rsi),
+                                ('macd', result['macd'], expected_macd[0]),
+                                ('signal', result['signal'], expected_macd[1]),
+                                ('hist', result['hist'], expected_macd[2])):
+        if not _same(got, expected):
+            failures.append(f"{name} (最大差異 {_max_diff(got, expected):.3g})")
+    return failures
+
+def check_backtest(backend, n_tickers=30, size='1y'):
+    universe = fixtures.synthetic_universe(n_tickers, fixtures.SIZES[size])
+    failures = []
+    for ticker, df in universe.items():
+        kernels.set_backend('pandas')
+        expected = backtest.run_backtest(df)
+        kernels.set_backend(backend)
+        got = backtest.run_backtest(df)
+        if got != expected:
+            failures.append(f"{ticker}: {got} != {expected}")
+    return failures
+
+def run_checks(backends):
+    ok = True
+    for backend in backends:
+        failures = check_indicators(backend) + check_backtest(backend)
+        if failures:
+            ok = False
+            print(f"❌ [{backend}] 跟 pandas 結果不一致：")
+            for line in failures[:10]:
+                print(f"   {line}")
+        else:
+            print(f"✅ [{backend}] RSI / MACD / 回測結果跟 pandas 完全一致")
+    return ok
+
+def _timeit(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+def run_bench(backends, n_tickers, size, repeat):
+    n_bars = fixtures.SIZES[size]
+    print(f"\n⏱️ 全市場量測：{n_tickers} 檔 × {n_bars} 天 (取 {repeat} 次最快)")
+    close = _ragged_close(n_tickers, n_bars)
+    series = [pd.Series(row) for row in close]
+    universe = fixtures.synthetic_universe(n_tickers, n_bars)
+
+    def pandas_indicators():
+        for s in series:
+            strategy.calculate_rsi(s)
+            strategy.calculate_macd(s)
+
+    def backtest_all():
+        for df in universe.values():
+            backtest.run_backtest(df)
+
+    kernels.set_backend('pandas')
+    base_ind = _timeit(pandas_indicators, repeat)
+    base_bt = _timeit(backtest_all, 1)
+    print(f"  {'pandas (逐檔)':<28} 指標 {base_ind * 1000:9.1f} ms   回測 {base_bt * 1000:9.1f} ms")
+
+    for backend in backends:
+        kernels.set_backend(backend)
+        kernels.indicators(close[:2])  # numba 第一次要編譯，不算在量測裡
+        ind = _timeit(lambda: kernels.indicators(close), repeat)
+        bt = _timeit(backtest_all, 1)
+        print(f"  {backend + ' (2-D 一次算)':<28} 指標 {ind * 1000:9.1f} ms   回測 {bt * 1000:9.1f} ms"
+              f"   ({base_ind / ind:5.1f}x / {base_bt / bt:5.1f}x)")
+
+def run_robustness_bench(n_tickers, size, workers):
+    """ 穩健度模擬 (Config.ROBUSTNESS_SIMULATIONS 次數)：單檔延遲 + 全市場換算 """
+    universe = fixtures.synthetic_universe(n_tickers, fixtures.SIZES[size])
+    sample = dict(list(universe.items())[:20])
+    start = time.perf_counter()
+    analyzed = [r for r in map(robustness.analyze, sample.values()) if r is not None]
+    per_ticker = (time.perf_counter() - start) / len(sample)
+    sims = analyzed[0]['simulations'] if analyzed else 0
+    print(f"\n🎲 穩健度：單檔 {per_ticker * 1000:.1f} ms ({sims} 次模擬)，"
+          f"{n_tickers} 檔單核約 {per_ticker * n_tickers:.0f} 秒")
+    start = time.perf_counter()
+    robustness.run_universe(universe, workers=workers)
+    print(f"  process pool ({workers or '全部核心'}) 實測 {n_tickers} 檔：{time.perf_counter() - start:.1f} 秒")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="運算核心一致性檢查與量測")
+    parser.add_argument('--check', action='store_true', help="只做一致性檢查")
+    parser.add_argument('--tickers', type=int, default=2000)
+    parser.add_argument('--size', default='1y', choices=fixtures.SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--robustness', action='store_true', help="也量穩健度模擬 (單檔 + 全市場)")
+    parser.add_argument('--processes', type=int, default=None, help="穩健度模擬的 process 數")
+    args = parser.parse_args(argv)
+
+    first = kernels.backend()
+    if first == 'pandas':
+        first = kernels.set_backend('auto')
+    backends = [first]
+    if first == 'numba':
+        backends.append('numpy')
+    elif not kernels.numba_available():
+        print("💡 沒有安裝 numba，只檢查 / 量測 numpy 版 (pip install numba 可以再快很多)")
+
+    ok = run_checks(backends)
+    if not args.check:
+        run_bench(backends, args.tickers, args.size, args.repeat)
+        if args.robustness:
+            run_robustness_bench(args.tickers, args.size, args.processes)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+ML 批次預測 (src/ml_predict.py) 的一致性檢查與全市場規模量測
+
+用法 (在專案根目錄執行)：
+    python -m bench.bench_ml --check                  # 只檢查批次特徵跟逐檔 prepare_features 一致
+    python -m bench.bench_ml                          # 檢查 + 量測 (預設 2000 檔 × 1 年)
+    python -m bench.bench_ml --tickers 500 --single 50
+
+量測項目：
+- 原本的做法：每檔各自訓練一個單檔模型 (只量 --single 檔，再換算成全部)
+- 批次：疊起來做特徵 + 訓練共用模型、疊起來做特徵 + 一次 predict_proba、全部命中快取
+模型檔與快取都用暫存的，不會動到 instance/ 裡的東西。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+from bench import fixtures
+from config import Config
+from src import ml_predict, cache
+
+def check(frames):
+    """ 回傳不一致的說明 (空的就是全部一致) """
+    batch = ml_predict.prepare_features_batch(frames)
+    failures = []
+    for ticker, df in frames.items():
+        expected = ml_predict.prepare_features(df)
+        got = batch[batch['Ticker'] == ticker]
+        if len(expected) != len(got):
+            failures.append(f"{ticker}: 列數 {len(got)} vs {len(expected)}")
+            continue
+        for col in ml_predict.FEATURE_COLS + ['Target']:
+            a = expected[col].to_numpy(dtype=float)
+            b = got[col].to_numpy(dtype=float)
+            if not np.allclose(a, b, equal_nan=True):
+                failures.append(f"{ticker} {col}: 最大差 {np.nanmax(np.abs(a - b)):.3g}")
+    return failures
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ML 批次預測量測")
+    parser.add_argument('--tickers', type=int, default=2000)
+    parser.add_argument('--size', default='1y', choices=list(fixtures.SIZES))
+    parser.add_argument('--single', type=int, default=20, help="單檔模型量幾檔 (很慢，取樣後換算)")
+    parser.add_argument('--check', action='store_true', help="只做一致性檢查")
+    args = parser.parse_args(argv)
+
+    frames = fixtures.synthetic_universe(args.tickers, fixtures.SIZES[args.size], seed=0)
+    sample = dict(list(frames.items())[:50])
+    failures = check(sample)
+    if failures:
+        print("❌ 批次特徵跟 prepare_features 不一致：")
+        for line in failures[:10]:
+            print(f"   {line}")
+        return 1
+    print(f"✅ 批次特徵跟逐檔 prepare_features 一致 ({len(sample)} 檔)")
+    if args.check:
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix='bench_ml_')
+    Config.ML_MODEL_PATH = os.path.join(workdir, 'ml_model.pkl')
+    Config.SHARED_CACHE_PATH = None
+    n = len(frames)
+
+    single = dict(list(frames.items())[:args.single])
+    _, seconds = _timed(lambda: [ml_predict._fit_predict(df) for df in single.values()])
+    per_ticker = seconds / max(len(single), 1)
+    print(f"🐢 單檔模型：每檔 {per_ticker * 1000:.0f} ms → {n} 檔約 {per_ticker * n:.1f} 秒")
+
+    features, seconds = _timed(lambda: ml_predict.prepare_features_batch(frames))
+    print(f"🧮 批次特徵：{n} 檔 {len(features)} 列 {seconds:.2f} 秒")
+    pooled, seconds = _timed(lambda: ml_predict.train_pooled(frames, features))
+    print(f"🤖 訓練共用模型：{pooled['rows']} 筆 {seconds:.2f} 秒 (一週一次)")
+
+    cache.clear_memory('ml')
+    results, seconds = _timed(lambda: ml_predict.predict_batch(frames, train=False))
+    done = sum(1 for v in results.values() if v is not None)
+    print(f"⚡ 批次預測 (特徵 + 一次 predict_proba)：{done}/{n} 檔 {seconds:.2f} 秒，"
+          f"比單檔模型快 {per_ticker * n / seconds:.0f} 倍")
+    _, seconds = _timed(lambda: ml_predict.predict_batch(frames, train=False))
+    print(f"💾 全部命中快取：{seconds * 1000:.0f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
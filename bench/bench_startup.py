@@ -0,0 +1,149 @@
+"""
+開機時間基準測試：每次開一個新的 Python process 量 import app 要多久
+
+用法 (在專案根目錄執行)：
+    python -m bench.bench_startup                      # 結果寫到 bench/results/startup.json
+    python -m bench.bench_startup --repeat 10
+    python -m bench.bench_startup --baseline bench/results/startup_baseline.json   # 變慢就失敗
+    python -m bench.bench_startup --save-baseline
+
+量測項目：
+    startup[import_app]      import app (Flask + 資料庫 + 路由註冊)
+    startup[first_healthz]   開機後第一個 /healthz (平台健康檢查打的就是這個)
+    startup[first_index]     開機後第一個首頁 GET / (查資料庫)
+    startup[process_total]   從啟動 python 到結束的總時間 (含直譯器本身)
+    startup[eager_imports]   對照組：把延遲載入的大套件全部 import 要多久 (= 延遲載入省下的時間)
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+DEFAULT_OUT = os.path.join(RESULTS_DIR, 'startup.json')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'startup_baseline.json')
+
+# 這些應該要等到真的用到才載入，開機後出現在 sys.modules 就代表有人提早 import 了
+HEAVY_MODULES = ['pandas', 'sklearn', 'plotly', 'yfinance', 'GoogleNews', 'google.generativeai', 'linebot']
+
+# 在子 process 裡執行的量測程式，結果用 JSON 印到最後一行
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/healthz')
+healthz = time.perf_counter()
+client.get('/')
+index = time.perf_counter()
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{
+    "import_app": imported - start,
+    "first_healthz": healthz - imported,
+    "first_index": index - healthz,
+    "heavy_loaded_at_startup": loaded,
+}}))
+"""
+
+# 對照組 (另開 process)：延遲載入的大套件全部 import 一次
+_CHILD_EAGER = """
+import json, time
+start = time.perf_counter()
+import pandas, sklearn.ensemble, plotly.graph_objects, plotly.subplots, yfinance, GoogleNews
+import google.generativeai, linebot, linebot.models
+print(json.dumps({"eager_imports": time.perf_counter() - start}))
+"""
+
+def _child_env():
+    env = dict(os.environ)
+    env.setdefault('LINE_CHANNEL_ACCESS_TOKEN', 'bench')
+    env.setdefault('LINE_CHANNEL_SECRET', 'bench')
+    env.setdefault('GOOGLE_API_KEY', 'bench')
+    env['SCHEDULER_ENABLED'] = '0'
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+def _run_child(code):
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, env=_child_env(), text=True)
+    return json.loads(output.strip().splitlines()[-1]), time.perf_counter() - start
+
+def run_once():
+    sample, total = _run_child(_CHILD.format(heavy=HEAVY_MODULES))
+    sample['process_total'] = total
+    eager, _ = _run_child(_CHILD_EAGER)
+    sample.update(eager)
+    return sample
+
+def _stats(samples):
+    return {
+        "median_s": round(statistics.median(samples), 6),
+        "min_s": round(min(samples), 6),
+        "max_s": round(max(samples), 6),
+        "repeat": len(samples),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI 選股系統開機時間基準測試")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--baseline', help="基準 JSON，有給就比較並在退步時回傳非 0")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save-baseline', action='store_true', help="把結果另存為 bench/results/startup_baseline.json")
+    args = parser.parse_args(argv)
+
+    print(f"🏁 開機時間測試 (每次都是新的 process，共 {args.repeat} 次)")
+    # 第一次會被作業系統的檔案快取影響，當暖身丟掉
+    run_once()
+    samples = [run_once() for _ in range(args.repeat)]
+
+    results = {}
+    for metric in ('import_app', 'first_healthz', 'first_index', 'process_total', 'eager_imports'):
+        case = f"startup[{metric}]"
+        results[case] = _stats([s[metric] for s in samples])
+        print(f"  {case:<60} {results[case]['median_s'] * 1000:10.2f} ms")
+
+    heavy_loaded = sorted({m for s in samples for m in s['heavy_loaded_at_startup']})
+    if heavy_loaded:
+        print(f"\n⚠️ 開機時就載入了：{', '.join(heavy_loaded)} (應該延遲載入)")
+    else:
+        print("\n✅ 開機時沒有載入任何大套件")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "heavy_loaded_at_startup": heavy_loaded,
+        },
+        "results": results,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 結果已存到 {args.out}")
+
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 已更新基準 {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        from bench.run_bench import compare
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n🚨 開機變慢 {len(regressions)} 項：{', '.join(regressions)}")
+            return 1
+        print("\n✅ 沒有效能退步")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
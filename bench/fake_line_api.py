@@ -0,0 +1,138 @@
+"""
+本地假的 LINE Messaging API：測試排程推播 (src/line_push.py) 不用真的打到 LINE
+
+用法 (在專案根目錄執行)：
+    python -m bench.fake_line_api                          # 聽 127.0.0.1:8765
+    python -m bench.fake_line_api --latency 0.2 --rate 50  # 每次回應慢 0.2 秒、每秒超過 50 次就回 429
+    python -m bench.fake_line_api --fail-rate 0.1          # 隨機 10% 回 500
+
+然後在另一個終端機：
+    LINE_API_ENDPOINT=http://127.0.0.1:8765 python -c "import app; app.send_morning_report()"
+
+GET /_stats 可以看收到幾次請求、推給幾個人、回了幾次 429 / 500。
+跑推播量測：python -m bench.fake_line_api --bench 20000
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from aiohttp import web
+
+class FakeLineAPI:
+    def __init__(self, latency=0.05, rate=None, fail_rate=0.0, limit=500):
+        self.latency = latency
+        self.rate = rate
+        self.fail_rate = fail_rate
+        self.limit = limit
+        self.seen_keys = set()
+        self.recipients = {}      # { user_id: 收到幾次 }
+        self.stats = {'requests': 0, 'accepted': 0, 'duplicate': 0, 'rate_limited': 0, 'failed': 0}
+        self._window = []
+
+    def _over_rate(self):
+        if not self.rate:
+            return False
+        now = time.monotonic()
+        self._window = [t for t in self._window if now - t < 1.0]
+        if len(self._window) >= self.rate:
+            return True
+        self._window.append(now)
+        return False
+
+    async def multicast(self, request):
+        self.stats['requests'] += 1
+        if not request.headers.get('Authorization', '').startswith('Bearer '):
+            return web.json_response({'message': 'Authentication failed'}, status=401)
+        if self._over_rate():
+            self.stats['rate_limited'] += 1
+            return web.json_response({'message': 'The API rate limit has been exceeded.'},
+                                     status=429, headers={'Retry-After': '1'})
+
+        payload = await request.json()
+        to = payload.get('to') or []
+        if not to or len(to) > self.limit or not payload.get('messages'):
+            return web.json_response({'message': 'The request body has 1 error(s)'}, status=400)
+
+        await asyncio.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            self.stats['failed'] += 1
+            return web.json_response({'message': 'Internal server error'}, status=500)
+
+        key = request.headers.get('X-Line-Retry-Key')
+        if key and key in self.seen_keys:
+            self.stats['duplicate'] += 1
+            return web.json_response({'message': 'The retry key is already accepted'}, status=409)
+        if key:
+            self.seen_keys.add(key)
+        self.stats['accepted'] += 1
+        for user_id in to:
+            self.recipients[user_id] = self.recipients.get(user_id, 0) + 1
+        return web.json_response({}, headers={'X-Line-Request-Id': f"fake-{self.stats['accepted']}"})
+
+    async def get_stats(self, request):
+        return web.json_response(dict(self.stats, recipients=len(self.recipients)))
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post('/v2/bot/message/multicast', self.multicast)
+        app.router.add_get('/_stats', self.get_stats)
+        return app
+
+def start_in_thread(api, host='127.0.0.1', port=8765):
+    """ 在背景執行緒跑假 API (給測試 / 量測腳本用)，回傳 stop() """
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(api.make_app())
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, host, port).start())
+    thread = threading.Thread(target=loop.run_forever, name="fake-line-api", daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+    return stop
+
+def run_bench(users, args):
+    """ 假 API 起在背景，推給 users 個人 (分成 3 種內容)，印出耗時與結果 """
+    import os
+    os.environ.setdefault('LINE_CHANNEL_ACCESS_TOKEN', 'bench')
+    from config import Config
+    from src import line_push
+
+    api = FakeLineAPI(latency=args.latency, rate=args.rate, fail_rate=args.fail_rate)
+    stop = start_in_thread(api, args.host, args.port)
+    Config.LINE_API_ENDPOINT = f"http://{args.host}:{args.port}"
+    try:
+        groups = [([line_push.text_message(f"內容 {g}")], [f"U{i:08d}" for i in range(g, users, 3)])
+                  for g in range(3)]
+        start = time.perf_counter()
+        results = line_push.deliver(groups)
+        elapsed = time.perf_counter() - start
+    finally:
+        stop()
+
+    failed = sum(len(r.batch.to) for r in results if not r.ok)
+    print(f"⏱️ {users} 人 / {len(results)} 批：{elapsed:.2f} 秒，失敗 {failed} 人")
+    print(f"📊 假 API 統計：{api.stats}，實際收到 {len(api.recipients)} 人")
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假的 LINE Messaging API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help="每次回應延遲秒數")
+    parser.add_argument('--rate', type=int, help="每秒最多幾次請求，超過回 429")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="隨機回 500 的比例")
+    parser.add_argument('--bench', type=int, metavar='USERS', help="不常駐，直接量測推給 USERS 人的耗時")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_bench(args.bench, args)
+        return
+    api = FakeLineAPI(latency=args.latency, rate=args.rate, fail_rate=args.fail_rate)
+    print(f"🧪 假 LINE API: http://{args.host}:{args.port} (設定 LINE_API_ENDPOINT 指過來)")
+    web.run_app(api.make_app(), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
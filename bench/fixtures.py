@@ -0,0 +1,64 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+# 基準測試用的 K 線資料
+# 1. 合成資料：固定亂數種子的幾何布朗運動，每次跑出來都一樣
+# 2. 錄製資料：bench/fixtures/*.csv (用 run_bench.py --record 2330 從 yfinance 存下來)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# 一年約 250 個交易日
+SIZES = {
+    '1y': 250,
+    '5y': 250 * 5,
+    '20y': 250 * 20,
+}
+
+def synthetic_ohlcv(n_bars, seed=0):
+    """ 產生跟 market_data.get_stock_data 回傳格式一樣的 DataFrame """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0004, 0.018, n_bars)))
+    open_ = close * (1 + rng.normal(0, 0.008, n_bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.008, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.008, n_bars)))
+    # 偶爾爆量，讓策略跟回測真的有訊號可以跑
+    volume = rng.lognormal(15, 0.4, n_bars) * np.where(rng.random(n_bars) < 0.05, 3, 1)
+
+    df = pd.DataFrame({
+        'Date': pd.bdate_range(end='2026-01-02', periods=n_bars),
+        'Open': open_,
+        'High': high,
+        'Low': low,
+        'Close': close,
+        'Volume': volume.round(),
+    })
+    df['MA5_Vol'] = df['Volume'].rolling(window=5).mean()
+    return df
+
+def synthetic_universe(n_tickers, n_bars, seed=0):
+    """ {ticker: df}，每檔用不同種子 """
+    return {f"{9000 + i}.TW": synthetic_ohlcv(n_bars, seed=seed + i) for i in range(n_tickers)}
+
+def recorded_fixtures():
+    """ 讀取錄製好的真實資料 {名稱: df} """
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.csv'))):
+        df = pd.read_csv(path, parse_dates=['Date'])
+        df['MA5_Vol'] = df['Volume'].rolling(window=5).mean()
+        fixtures[os.path.splitext(os.path.basename(path))[0]] = df
+    return fixtures
+
+def record_fixture(ticker):
+    """ 從 yfinance 下載一檔真實資料存成 CSV (需要網路，只在錄製時用) """
+    from src import market_data
+    df, valid_ticker = market_data.get_stock_data(ticker)
+    if df is None:
+        raise SystemExit(f"❌ 無法下載 {ticker}")
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    path = os.path.join(FIXTURE_DIR, f"{valid_ticker}.csv")
+    df[['Date', 'Open', 'High', 'Low', 'Close', 'Volume']].to_csv(path, index=False)
+    print(f"💾 已錄製 {valid_ticker} ({len(df)} 筆) -> {path}")
+    return path
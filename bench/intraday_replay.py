@@ -0,0 +1,146 @@
+"""
+盤中監控 (src/intraday.py) 的重播測試：用錄好的 (或合成的) 報價檔跑一整天，不用連網路
+
+用法 (在專案根目錄執行)：
+    python -m bench.intraday_replay                               # 合成 3000 檔 × 一整天 (每 60 秒一筆) 再重播
+    python -m bench.intraday_replay --tickers 5000 --interval 30
+    python -m bench.intraday_replay instance/intraday/quotes-2026-10-19.jsonl   # 重播錄下來的檔案
+                                                                  # (INTRADAY_RECORD_DIR 有設定才會錄)
+
+會檢查：
+- 盤中 RSI / MACD 柱狀跟「把今天當成一根 K 線丟進 strategy.calculate_rsi / macd」一樣 (合成資料)
+- 同一檔同一天只提醒一次
+並印出每筆報價的處理時間與狀態佔用的記憶體。
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from bench import fixtures
+from config import Config
+from src import intraday, strategy, trading_calendar
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+def generate(path, n_tickers, interval, seed=0, breakout_share=0.1):
+    """
+    合成一天的報價檔：日 K 用 fixtures 的合成資料，盤中價格隨機漫步，
+    累積量照 INTRADAY_VOLUME_PROFILE 走；breakout_share 比例的股票全天量是均量的 2.5 倍
+    回傳 {ticker: 日 K df} (一致性檢查用)
+    """
+    rng = np.random.default_rng(seed)
+    universe = fixtures.synthetic_universe(n_tickers, fixtures.SIZES['1y'], seed=seed)
+    last_date = max(pd.Timestamp(df['Date'].iloc[-1]) for df in universe.values()).date()
+    day = trading_calendar.next_trading_day(last_date)
+
+    baselines = {}
+    for ticker, df in universe.items():
+        baseline = intraday.baseline_from_bars(df, day)
+        if baseline is not None:
+            baselines[ticker] = baseline
+    tickers = list(baselines)
+
+    prev_close = np.array([baselines[t][0] for t in tickers])
+    avg_volume = np.array([baselines[t][1] for t in tickers])
+    day_volume = avg_volume * np.where(rng.random(len(tickers)) < breakout_share, 2.5, rng.uniform(0.5, 1.1, len(tickers)))
+    open_price = (prev_close * (1 + rng.normal(0, 0.01, len(tickers)))).round(2)
+    price = open_price.copy()
+
+    open_at, close_at = trading_calendar.session_bounds(day)
+    steps = int((close_at - open_at).total_seconds() // interval)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'baselines': baselines}) + "\n")
+        for step in range(1, steps + 1):
+            when = open_at + datetime.timedelta(seconds=step * interval)
+            price = (price * (1 + rng.normal(0.0002, 0.002, len(tickers)))).round(2)
+            volume = (day_volume * intraday.volume_fraction(step * interval / 60)).round(-3)
+            quotes = [[t, float(p), float(v), float(o), None, None]
+                      for t, p, v, o in zip(tickers, price, volume, open_price)]
+            f.write(json.dumps({'time': when.isoformat(), 'quotes': quotes}) + "\n")
+    return universe
+
+def replay(path):
+    source = intraday.ReplaySource(path)
+    monitor = intraday.IntradayMonitor(source)
+    tickers = None
+    alerts = []
+    polls = quotes = 0
+    elapsed = 0.0
+    tracemalloc.start()
+    while True:
+        if tickers is None:
+            # 錄製檔不一定有完整清單：第一輪用起始狀態裡的全部股票
+            tickers = list(source.baselines)
+        start = time.perf_counter()
+        result = monitor.poll(tickers)
+        elapsed += time.perf_counter() - start
+        if result is None:
+            break
+        polls += 1
+        quotes += len(monitor.states)
+        alerts += result
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return monitor, alerts, polls, quotes, elapsed, peak
+
+def check_indicators(monitor, universe, n=50):
+    """ 最後一輪的盤中 RSI / MACD 柱 vs 把今天接在日 K 後面用 pandas 重算 """
+    failures = []
+    for ticker, state in list(monitor.states.items())[:n]:
+        df = universe[ticker]
+        close = pd.concat([df['Close'].astype(float), pd.Series([state.price])], ignore_index=True)
+        expected_rsi = strategy.calculate_rsi(close).iloc[-1]
+        expected_hist = strategy.calculate_macd(close)[2].iloc[-1]
+        if not (np.isclose(state.rsi, expected_rsi) and np.isclose(state.macd_hist, expected_hist)):
+            failures.append(f"{ticker}: RSI {state.rsi} vs {expected_rsi}, MACD 柱 {state.macd_hist} vs {expected_hist}")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="盤中監控重播測試")
+    parser.add_argument('path', nargs='?', help="錄好的報價檔 (省略就合成一份)")
+    parser.add_argument('--tickers', type=int, default=3000)
+    parser.add_argument('--interval', type=int, default=60, help="合成資料每幾秒一筆報價")
+    args = parser.parse_args(argv)
+
+    universe = None
+    path = args.path
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, 'intraday_replay.jsonl')
+        start = time.perf_counter()
+        universe = generate(path, args.tickers, args.interval)
+        print(f"🧪 合成報價檔 {path} ({args.tickers} 檔，每 {args.interval} 秒一筆，"
+              f"{time.perf_counter() - start:.1f} 秒)")
+
+    monitor, alerts, polls, quotes, elapsed, peak = replay(path)
+    print(f"⏱️ 重播 {polls} 輪、{quotes} 筆報價：總共 {elapsed:.2f} 秒，"
+          f"每筆 {elapsed / max(quotes, 1) * 1e6:.1f} µs，每輪 {elapsed / max(polls, 1) * 1000:.1f} ms "
+          f"(間隔 {Config.INTRADAY_POLL_SECONDS} 秒)")
+    print(f"💾 追蹤 {len(monitor.states)} 檔，記憶體高峰 {peak / 1024 / 1024:.1f} MB (含讀檔緩衝)")
+
+    ok = True
+    keys = [(a['ticker'], a['kind']) for a in alerts]
+    if len(keys) != len(set(keys)):
+        ok = False
+        print("❌ 同一檔同一種提醒發了不只一次")
+    print(f"🚨 提醒 {len(alerts)} 則 (不重複)" + (f"，例如：\n{alerts[0]['text']}" if alerts else ""))
+
+    if universe is not None:
+        failures = check_indicators(monitor, universe)
+        if failures:
+            ok = False
+            print("❌ 盤中指標跟 pandas 不一致：")
+            for line in failures[:10]:
+                print(f"   {line}")
+        else:
+            print("✅ 盤中 RSI / MACD 柱跟 pandas 重算一致")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
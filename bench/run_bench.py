@@ -0,0 +1,201 @@
+"""
+離線基準測試：量測各分析模組與完整流程的耗時
+
+用法 (在專案根目錄執行)：
+    python -m bench.run_bench                              # 預設組合，結果寫到 bench/results/latest.json
+    python -m bench.run_bench --tickers 1,100,2000          # 加大股票數量
+    python -m bench.run_bench --baseline bench/results/baseline.json   # 跟基準比較，變慢就失敗
+    python -m bench.run_bench --save-baseline               # 把這次結果存成新的基準
+    python -m bench.run_bench --record 2330                 # 錄製真實資料到 bench/fixtures/ (需要網路)
+
+所有網路服務 (yfinance / FinMind / GoogleNews / Gemini) 都換成本地假資料，
+同一台機器重跑結果應該只差在雜訊範圍內。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# 這些環境變數要在 import app 之前設定好
+os.environ.setdefault('SCHEDULER_ENABLED', '0')
+os.environ.setdefault('LINE_CHANNEL_ACCESS_TOKEN', 'bench')
+os.environ.setdefault('LINE_CHANNEL_SECRET', 'bench')
+os.environ.setdefault('GOOGLE_API_KEY', 'bench')
+
+from bench import fixtures, stubs
+from src import strategy, backtest, ml_predict, chart
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+DEFAULT_OUT = os.path.join(RESULTS_DIR, 'latest.json')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+
+# 單一函式的量測對象
+FUNCTIONS = {
+    'strategy.check_volume_breakout': lambda df: strategy.check_volume_breakout(df),
+    'strategy.check_buy_signal': lambda df: strategy.check_buy_signal(df),
+    'backtest.run_backtest': lambda df: backtest.run_backtest(df),
+    'ml_predict.predict_next_day': lambda df: ml_predict.predict_next_day(df),
+    'chart.create_stock_chart': lambda df: chart.create_stock_chart(df, 'BENCH'),
+}
+
+def measure(func, repeat, warmup=1):
+    """ 跑 warmup 次暖身後量 repeat 次，回傳統計 (秒) """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {
+        "median_s": round(statistics.median(samples), 6),
+        "min_s": round(min(samples), 6),
+        "max_s": round(max(samples), 6),
+        "repeat": repeat,
+    }
+
+def pipeline(df):
+    """ 跟 app.analyze() 一樣的運算步驟 (不含網路與模板) """
+    strategy.check_volume_breakout(df)
+    strategy.check_buy_signal(df)
+    ml_predict.predict_next_day(df)
+    backtest.run_backtest(df)
+    chart.create_stock_chart(df, 'BENCH')
+
+def bench_functions(results, sizes, repeat):
+    datasets = {f"synthetic_{name}": fixtures.synthetic_ohlcv(fixtures.SIZES[name]) for name in sizes}
+    datasets.update({f"recorded_{name}": df for name, df in fixtures.recorded_fixtures().items()})
+
+    for data_name, df in datasets.items():
+        for func_name, func in FUNCTIONS.items():
+            case = f"{func_name}[{data_name}]"
+            results[case] = measure(lambda: func(df), repeat)
+            print(f"  {case:<60} {results[case]['median_s'] * 1000:10.2f} ms")
+
+def bench_universe(results, ticker_counts, size, repeat):
+    """ 完整流程跑 N 檔股票 (模擬早報 / 掃描全市場) """
+    for n in ticker_counts:
+        universe = fixtures.synthetic_universe(n, fixtures.SIZES[size])
+        # 股票數很多時只量一次，不然要跑很久
+        runs = repeat if n <= 100 else 1
+        case = f"pipeline[{n}_tickers_{size}]"
+        results[case] = measure(lambda: [pipeline(df) for df in universe.values()], runs, warmup=0)
+        print(f"  {case:<60} {results[case]['median_s'] * 1000:10.2f} ms")
+
+def bench_analyze_route(results, size, repeat):
+    """ 透過 Flask test client 打一次完整的 analyze() (含模板渲染) """
+    df = fixtures.synthetic_ohlcv(fixtures.SIZES[size])
+    with stubs.offline({'2330.TW': df}):
+        # 在 offline 裡才 import：app 啟動時的 create_all 也落在暫存資料庫
+        import app as web_app
+        client = web_app.app.test_client()
+        # 假資料不經過快取，所以每次都是完整分析 + 渲染
+        case = f"app.analyze[{size}]"
+        results[case] = measure(lambda: client.get('/stock/2330.TW'), repeat)
+        print(f"  {case:<60} {results[case]['median_s'] * 1000:10.2f} ms")
+
+        # 輸入版本固定：第一次渲染之後都是結果頁快取 / 304
+        from src import page_cache
+        versions = {'bars': 1, 'chips': 1, 'news': 1, 'sentiment': 0}
+        original = page_cache.input_versions
+        page_cache.input_versions = lambda ticker: versions
+        try:
+            tag = page_cache.etag('2330.TW', versions)
+            for case, headers in ((f"app.stock_page[{size}_cached]", {}),
+                                  (f"app.stock_page[{size}_304]", {'If-None-Match': f'"{tag}"'})):
+                results[case] = measure(lambda: client.get('/stock/2330.TW', headers=headers), repeat)
+                print(f"  {case:<60} {results[case]['median_s'] * 1000:10.2f} ms")
+        finally:
+            page_cache.input_versions = original
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, tolerance):
+    """ 跟基準比較，中位數變慢超過 tolerance (例如 0.25 = 25%) 就算退步 """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    print(f"\n📊 與基準比較 ({baseline_path})，容忍 +{tolerance:.0%}")
+    for case, stats in results.items():
+        if case not in baseline:
+            continue
+        before = baseline[case]['median_s']
+        after = stats['median_s']
+        ratio = after / before if before else 1.0
+        flag = "❌" if ratio > 1 + tolerance else "✅"
+        print(f"  {flag} {case:<58} {before * 1000:9.2f} -> {after * 1000:9.2f} ms ({ratio:5.2f}x)")
+        if ratio > 1 + tolerance:
+            regressions.append(case)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI 選股系統離線基準測試")
+    parser.add_argument('--sizes', default='1y,5y,20y', help="單一函式的資料長度 (1y/5y/20y)")
+    parser.add_argument('--tickers', default='1,100', help="完整流程的股票數量，例如 1,100,2000")
+    parser.add_argument('--universe-size', default='1y', help="完整流程每檔股票的資料長度")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', choices=['functions', 'pipeline', 'analyze'], help="只跑其中一組")
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--baseline', help="基準 JSON，有給就比較並在退步時回傳非 0")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save-baseline', action='store_true', help="把結果另存為 bench/results/baseline.json")
+    parser.add_argument('--record', help="錄製真實資料 (股票代號)，錄完就結束")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        fixtures.record_fixture(args.record)
+        return 0
+
+    sizes = [s for s in args.sizes.split(',') if s]
+    ticker_counts = [int(n) for n in args.tickers.split(',') if n]
+    results = {}
+
+    print("🏁 開始基準測試 (網路服務已替換為本地假資料)")
+    with stubs.offline({'BENCH': fixtures.synthetic_ohlcv(fixtures.SIZES['1y'])}):
+        if args.only in (None, 'functions'):
+            bench_functions(results, sizes, args.repeat)
+        if args.only in (None, 'pipeline'):
+            bench_universe(results, ticker_counts, args.universe_size, args.repeat)
+    if args.only in (None, 'analyze'):
+        bench_analyze_route(results, args.universe_size, args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 結果已存到 {args.out}")
+
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 已更新基準 {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n🚨 效能退步 {len(regressions)} 項：{', '.join(regressions)}")
+            return 1
+        print("\n✅ 沒有效能退步")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+from config import Config
+from src import cache, chips, market_data, llm, similarity, ml_predict
+
+# 基準測試時把所有網路服務換成本地假資料，量到的才是純運算時間
+
+FAKE_CHIPS = {
+    "foreign_total": 1234.5,
+    "trust_total": 56.7,
+    "dealer_total": -8.9,
+    "status_text": "外資買超，投信買超",
+}
+
+FAKE_NEWS = [
+    "台積電法說會釋利多 外資連續買超",
+    "半導體庫存調整近尾聲 營收可望回溫",
+    "美股科技股回檔 台股早盤震盪",
+]
+
+class _FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+class _FakeResponse:
+    text = "分數：0.3\n評論：基準測試用的假評論，技術面偏多，籌碼穩定。"
+    usage_metadata = None
+
+    def __iter__(self):
+        # 串流模式：一行一段
+        return iter([_FakeChunk(line) for line in self.text.splitlines(keepends=True)])
+
+class FakeGenerativeModel:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, prompt, **kwargs):
+        return _FakeResponse()
+
+def _reset_file_state():
+    """ 相似股索引 / 共用 ML 模型在記憶體裡的內容清掉 (下次用到會從目前設定的路徑重新讀) """
+    similarity._set([], [], [])
+    similarity._loaded_mtime = None
+    ml_predict._pooled = None
+    ml_predict._loaded_mtime = None
+
+@contextlib.contextmanager
+def _scratch_database(path):
+    """ 已經 import app 的話，把資料庫換成暫存檔 (訊號紀錄、快照不要寫進真的 instance/stocks.db) """
+    web_app = sys.modules.get('app')
+    if web_app is None:
+        yield
+        return
+    import sqlalchemy
+    with web_app.app.app_context():
+        engines = web_app.db.engines
+        original = engines[None]
+        web_app.db.session.remove()
+        engines[None] = sqlalchemy.create_engine(f"sqlite:///{path}")
+        web_app.db.create_all()
+    try:
+        yield
+    finally:
+        with web_app.app.app_context():
+            web_app.db.session.remove()
+            engines[None].dispose()
+            engines[None] = original
+
+@contextlib.contextmanager
+def offline(frames):
+    """
+    frames: {ticker: df}，get_stock_data 會從這裡拿資料 (找不到就用第一檔)
+    資料庫、相似股索引、ML 模型都寫到暫存資料夾，不會動到 instance/ 裡的東西
+    離開 with 區塊後全部還原
+    """
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    default_df = next(iter(frames.values()))
+
+    def fake_get_stock_data(ticker):
+        df = frames.get(ticker, default_df)
+        return df.copy(), ticker
+
+    patches = [
+        (market_data, 'get_stock_data', fake_get_stock_data),
+        (market_data, 'get_recent_news', lambda stock_name: list(FAKE_NEWS)),
+        (chips, 'get_institutional_chips', lambda stock_id: dict(FAKE_CHIPS)),
+        (llm.genai, 'GenerativeModel', FakeGenerativeModel),
+        (llm.genai, 'configure', lambda **kwargs: None),
+        (Config, 'SHARED_CACHE_PATH', None),
+        (Config, 'SIMILARITY_INDEX_PATH', os.path.join(workdir, 'similarity.npz')),
+        (Config, 'ML_MODEL_PATH', os.path.join(workdir, 'ml_model.pkl')),
+        # 在 with 區塊裡才 import app 的話，啟動時的 create_all 也寫到暫存檔
+        (Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{os.path.join(workdir, 'stocks.db')}"),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, value in patches:
+        setattr(obj, name, value)
+    cache.clear_memory()
+    llm.reset_models()
+    _reset_file_state()
+    try:
+        with _scratch_database(os.path.join(workdir, 'stocks.db')):
+            yield
+    finally:
+        for obj, name, value in originals:
+            setattr(obj, name, value)
+        cache.clear_memory()
+        llm.reset_models()
+        _reset_file_state()
+        shutil.rmtree(workdir, ignore_errors=True)
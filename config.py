@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
 class Config:
     # Flask 必要的加密金鑰
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-very-secret-key'
@@ -14,6 +16,14 @@ class Config:
     # LINE 設定
     LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
     LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
+    # [LINE 排程推播] 本地測試可以指到假的 API (python -m bench.fake_line_api)
+    LINE_API_ENDPOINT = os.getenv('LINE_API_ENDPOINT', 'https://api.line.me')
+    LINE_MULTICAST_LIMIT = 500      # multicast 一次最多幾位收件人 (LINE 官方上限)
+    LINE_PUSH_CONCURRENCY = 8       # 同時送出幾批
+    LINE_PUSH_TIMEOUT = 10          # 單次請求逾時 (秒)
+    LINE_PUSH_RETRIES = 3           # 429 / 5xx / 連線錯誤時，同一批最多重送幾次
+    LINE_PUSH_BACKOFF_BASE = 0.5    # 重送退避起始秒數 (會加隨機抖動)
+    LINE_PUSH_BACKOFF_MAX = 8
     
     # [資料庫設定] (如果你之後有要用資料庫)
     SQLALCHEMY_DATABASE_URI = 'sqlite:///stocks.db'
@@ -24,6 +34,24 @@ class Config:
     #GEMINI_MODEL_NAME = "gemini-2.5-flash-lite"  # 較小的模型，速度更快但可能效果稍差
     #GEMINI_MODEL_NAME = "gemini-3-flash-preview"  # 最新的 Gemini 3 模型，效果最好但速度較慢 
     
+    # [Gemini 額度] 依帳號方案設定 (多個 worker 會自動平分)
+    GEMINI_RPM = 10                 # 每分鐘請求數
+    GEMINI_TPM = 250000             # 每分鐘 token 數
+    GEMINI_EST_OUTPUT_TOKENS = 400  # 預估每次輸出 token (送出前先預扣，回來再多退少補)
+    # 排隊最多等幾秒，等不到就用上一次的結果 (互動請求不能讓使用者等太久)
+    LLM_MAX_WAIT = {'interactive': 15, 'background': 120}
+    # 網頁的 AI 總評改用串流 (先顯示其他分析結果，AI 評論邊產生邊出現)
+    AI_STREAMING = True
+    # [快速情緒評分] 本機詞庫評新聞標題 (src/fast_sentiment.py)，不用呼叫 LLM
+    # 'llm'    只用 Gemini (Gemini 忙碌 / 失敗時仍可用快速分數頂著，見 SENTIMENT_FAST_FALLBACK)
+    # 'tiered' 快取沒有 LLM 結果時先回快速分數，LLM 在背景算 (網頁串流時先顯示快速分數)
+    # 'fast'   只用快速分數 (完全不打 LLM)
+    SENTIMENT_MODE = os.getenv('SENTIMENT_MODE', 'tiered')
+    SENTIMENT_FAST_FALLBACK = True
+    SENTIMENT_BACKGROUND_WORKERS = 2   # 分層模式背景跑 LLM 的執行緒數
+    SENTIMENT_LEXICON_FILE = os.path.join(BASE_DIR, 'data', 'sentiment_lexicon.txt')
+    LLM_MAX_RETRIES = 2
+
     # [策略設定] 這裡定義什麼叫「爆量」
     # 1.5 代表成交量是過去 5 日均量的 1.5 倍
     VOL_MULTIPLIER = 1.5
@@ -34,4 +62,161 @@ class Config:
     STOP_LOSS_PCT = 0.05            # 停損 (5%)
     TAKE_PROFIT_PCT = 0.10          # 停利 (10%)
 
+    # [策略規則] 進場條件 (語法見 src/rules.py)：實戰訊號、回測、選股 (screener.py) 共用
+    # params 的值可以是數字，或 Config 的屬性名稱 (每次計算時才讀)
+    # 參數組合掃描：python screener.py --grid vol_multiplier=1.25,1.5,2 rsi_limit=75,82
+    DEFAULT_STRATEGY = 'dual_ma_slope'
+    STRATEGY_RULES = {
+        'dual_ma_slope': {
+            'label': "雙均線雙斜率共振",
+            'min_bars': 60,     # 要算 MA60
+            'params': {'vol_multiplier': 'BACKTEST_VOL_MULTIPLIER', 'rsi_limit': 'BACKTEST_RSI_LIMIT'},
+            'rules': [
+                # 雙均線 + 雙斜率：收盤在均線之上，且均線正在往上翹
+                {'expr': "close > ma(close, 20) and slope(ma(close, 20)) > 0 and "
+                         "close > ma(close, 60) and slope(ma(close, 60)) > 0",
+                 'pass': "趨勢多頭", 'fail': "趨勢未確認"},
+                # 爆量：5 日均量含今天 (跟 market_data 的 MA5_Vol 一樣)
+                {'expr': "volume > ma(volume, 5) * vol_multiplier", 'pass': "量能爆發", 'fail': "量能平平"},
+                {'expr': "close > open", 'pass': "收紅", 'fail': "收黑/平"},
+                {'expr': "rsi(close, 14) < rsi_limit", 'pass': "RSI安全", 'fail': "RSI過熱"},
+            ],
+        },
+    }
+
+    # [回測穩健度] 重新抽樣 / 挪動進場日 / 擾動參數，看回測結果的信賴區間 (見 src/robustness.py)
+    ROBUSTNESS_ON_PAGE = True       # 結果頁要不要顯示 (夜間批次算過的直接用，沒有才現算)
+    ROBUSTNESS_SIMULATIONS = {'bootstrap': 5000, 'entry_jitter': 2000, 'params': 100}
+    ROBUSTNESS_BATCH_SIZE = 1000    # 一批同時算幾個模擬 (記憶體 ≈ 批次 × 交易數 × 持有天數)
+    ROBUSTNESS_ENTRY_JITTER = 2     # 進場日前後最多挪幾個交易日
+    ROBUSTNESS_PARAM_JITTER = 0.2   # 停損 / 停利 / 持有天數 / 策略參數上下擾動 ±20%
+    ROBUSTNESS_CONFIDENCE = 0.90    # 信賴區間 (0.90 → 第 5 ~ 95 百分位)
+    ROBUSTNESS_MIN_TRADES = 3       # 交易次數太少的結果不做 (區間沒有意義)
+    ROBUSTNESS_WORKERS = None       # screener.py 全市場批次的 process 數 (None = CPU 核心數)
+    ROBUSTNESS_APP_WORKERS = 1      # 網頁 process 裡的盤後任務：1 = 直接在排程執行緒算，>1 用 spawn 開子 process (別吃光網頁主機的核心)
+    ROBUSTNESS_NIGHTLY_HOUR = 15    # 盤後幫自選股 + 熱門股先算好 (15:00，在快照之後)
+
+    # [相似股] 指紋索引 (見 src/similarity.py)：盤後重建，結果頁分析時順手更新那一檔
+    SIMILARITY_INDEX_PATH = os.path.join(BASE_DIR, 'instance', 'similarity.npz')
+    SIMILARITY_TOP_K = 5
+    SIMILARITY_NIGHTLY_HOUR = 15    # 盤後重建 (15:15，在穩健度分析之後)
+    SIMILARITY_AD_HOC_DAYS = 14     # 只在結果頁被查過的股票，幾天沒人看就不再每晚重抓 (自選股 / 熱門股不受影響)
+    SIMILARITY_AD_HOC_MAX = 300     # 每晚最多重抓幾檔這種股票 (最近看的優先)
+
+    # [ML 預測] 全市場共用一個模型，一次 predict_proba 算完所有股票 (見 src/ml_predict.py)
+    ML_MODEL_PATH = os.path.join(BASE_DIR, 'instance', 'ml_model.pkl')
+    ML_MODEL_MAX_AGE_DAYS = 7       # 模型訓練資料超過幾天就重新訓練
+    ML_MIN_POOL_TICKERS = 20        # 一次少於這麼多檔不訓練共用模型 (沒有模型時改用原本的單檔模型)
+    ML_TRAIN_BARS = 250             # 每檔取最近幾天當訓練資料
+    ML_MAX_TRAIN_ROWS = 200000      # 訓練資料上限 (超過就隨機抽樣，控制記憶體與訓練時間)
+    ML_TRAIN_HOUR = 14              # 盤後訓練 (14:20，在快照之前)
+
+    # [運算核心] RSI / MACD / 回測停損停利掃描的實作 (見 src/kernels.py)
+    # 'auto' (有 numba 用 numba，沒有用 numpy)、'numba'、'numpy'、'pandas' (原本的寫法)
+    KERNEL_BACKEND = os.getenv('KERNEL_BACKEND', 'auto')
+
+    # [盤中監控] 盤中定時抓自選股即時報價，推估全天量爆量就推播 LINE 提醒 (見 src/intraday.py)
+    INTRADAY_ENABLED = os.getenv('INTRADAY_ENABLED', '1') == '1'
+    INTRADAY_POLL_SECONDS = 60      # 多久抓一次報價
+    TWSE_MIS_URL = "https://mis.twse.com.tw/stock/api/getStockInfo.jsp"
+    INTRADAY_MIS_CHUNK = 50         # 一個請求查幾檔 (網址長度限制)
+    INTRADAY_MIN_MINUTES = 15       # 開盤前 15 分鐘量能推估太不準，不發提醒
+    INTRADAY_MIN_VOLUME_FRACTION = 0.05
+    # 盤中量能分布：(開盤後第幾分鐘, 累積成交量佔全天比例)；13:25 ~ 13:30 收盤集合競價約佔一成
+    INTRADAY_VOLUME_PROFILE = [
+        (0, 0.0), (5, 0.06), (15, 0.14), (30, 0.24), (60, 0.38), (90, 0.48), (120, 0.56),
+        (150, 0.63), (180, 0.70), (210, 0.77), (240, 0.84), (265, 0.90), (270, 1.0),
+    ]
+    # 錄下盤中報價 (每天一個檔，可以用 python -m bench.intraday_replay 重播)，None 不錄
+    INTRADAY_RECORD_DIR = os.getenv('INTRADAY_RECORD_DIR')
+
+    # [交易日曆] 台股開收盤時間 (台北時間) 與休市日檔案
+    MARKET_TIMEZONE = 'Asia/Taipei'
+    MARKET_OPEN_TIME = "09:00"
+    MARKET_CLOSE_TIME = "13:30"
+    HOLIDAY_FILE = os.path.join(BASE_DIR, 'data', 'tw_holidays.txt')
+
+    # [快取新鮮度] 每種資料「什麼時候可能有新東西」
+    # ready_time : 每個交易日資料定稿的時間 (之後才需要重抓)
+    # session_ttl: 盤中的快取秒數 (None = 盤中也不會變)
+    # off_ttl    : 沒有 ready_time 的資料，非盤中的快取秒數
+    CACHE_POLICIES = {
+        'bars':  {'ready_time': "14:00", 'session_ttl': 300},   # yfinance 盤後約 14:00 定稿
+        'chips': {'ready_time': "16:30", 'session_ttl': None},  # FinMind 法人資料約 16:00 後更新
+        'news':  {'ready_time': None, 'session_ttl': 900, 'off_ttl': 3 * 3600},
+        'sentiment': {'ready_time': None, 'session_ttl': None, 'off_ttl': 12 * 3600},  # key 已包含所有輸入
+        'llm_fallback': {'ready_time': None, 'session_ttl': None, 'off_ttl': 3 * 86400},  # 額度不足時的備用舊結果
+        'pages': {'ready_time': None, 'session_ttl': None, 'off_ttl': 86400},  # 結果頁 HTML (每檔一筆，值裡帶 ETag 版本)
+        'robustness': {'ready_time': None, 'session_ttl': None, 'off_ttl': 2 * 86400},  # key 含最後一根 K 線日期
+        'ml': {'ready_time': None, 'session_ttl': None, 'off_ttl': 2 * 86400},  # key 含最後一根 K 線日期與模型版本
+    }
+
+    # [多 worker 部署] gunicorn 開多個 worker 時共用的檔案
+    # 共用快取 (SQLite WAL)：每個 worker 都讀得到別人抓過的資料，設成 None 則只用記憶體
+    SHARED_CACHE_PATH = os.path.join(BASE_DIR, 'instance', 'cache.db')
+    # 每個 worker 記憶體快取最多幾筆 (LRU，K 線一筆可能上百 KB)
+    MEMORY_CACHE_MAX_ENTRIES = 1000
+    # 共用快取多久清一次依 CACHE_POLICIES 已過期的列 (秒)，不清的話檔案只會一直變大
+    SHARED_CACHE_SWEEP_SECONDS = 3600
+    # 排程主控鎖：只有拿到鎖的 worker 會跑排程 (避免早報重複推播)
+    SCHEDULER_LOCK_FILE = os.path.join(BASE_DIR, 'instance', 'scheduler.lock')
+    # 基準測試 / 批次腳本 import app 時不要啟動排程 (設 SCHEDULER_ENABLED=0)
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', '1') == '1'
+
+    # [自選股] 每個 worker 在記憶體裡最多快取幾位使用者的清單 (LRU)，改動時用共用版本號失效
+    WATCHLIST_CACHE_SIZE = 5000
+    # 記憶體裡的清單幾秒內不重新對共用版本號 (每次都對要開一次 cache.db)；別的 worker 改的最多晚這麼久看到
+    WATCHLIST_VERSION_TTL = 5
+
+    # [上游連線] 每個外部服務的併發上限、逾時、重試與斷路器設定
+    UPSTREAM_POOL_SIZE = 20        # aiohttp 連線池大小 (keep-alive)
+    UPSTREAM_KEEPALIVE = 30        # 閒置連線保留秒數
+    UPSTREAM_DEFAULT_POLICY = {
+        'concurrency': 4,          # 同時最多幾個請求
+        'timeout': 10,             # 單次請求逾時 (秒)
+        'retries': 2,              # 失敗後重試次數
+        'backoff_base': 0.5,       # 退避起始秒數 (會加隨機抖動)
+        'backoff_max': 8,
+        'failure_threshold': 5,    # 連續失敗幾次就斷路
+        'reset_timeout': 60,       # 斷路多久後再試
+    }
+    UPSTREAM_POLICIES = {
+        'finmind':    {'concurrency': 4, 'timeout': 10},
+        'yfinance':   {'concurrency': 6, 'timeout': 20, 'retries': 1},
+        'googlenews': {'concurrency': 2, 'timeout': 15, 'retries': 1},
+        'gemini':     {'concurrency': 4, 'timeout': 60, 'retries': 0},  # 重試交給 src/llm 調度器 (要重新排隊拿額度)
+        'twse_mis':   {'concurrency': 4, 'timeout': 5, 'retries': 1},   # 盤中報價 (下一輪很快就會再抓)
+    }
+
+    # [監控] 結果頁底部顯示各階段耗時 (也可以在網址加 ?timing=1 臨時打開)
+    SHOW_TIMINGS = False
+
+    # [效能剖析] 單一請求的 cProfile / 抽樣剖析 (Header X-Profile: 1 或網址 ?profile=1)
+    PROFILE_MODE = os.getenv('PROFILE_MODE', 'cprofile')      # 'cprofile' 或 'sampling' (負擔較低)
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # 0.01 = 隨機剖析 1% 的請求
+    PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')                 # 手動開啟與 /profiles 都要帶 token；沒設定就關閉 (404)
+    PROFILE_DIR = os.path.join(BASE_DIR, 'instance', 'profiles')
+    PROFILE_KEEP = 50
+
+    # [預熱排程] 在使用者進來之前先把快取暖好
+    # 熱門股：就算沒人加自選也一起預熱
+    POPULAR_TICKERS = ["2330.TW", "2317.TW", "2454.TW", "2308.TW", "2603.TW", "2881.TW", "0050.TW"]
+    # 分段任務：盤後先抓股價、法人資料出來後抓籌碼、開盤前抓新聞 + AI 評論
+    PREWARM_JOBS = [
+        {'name': 'after_close', 'hour': 14, 'minute': 5,  'stages': ['bars']},
+        {'name': 'chips',       'hour': 16, 'minute': 45, 'stages': ['chips']},
+        {'name': 'pre_open',    'hour': 8,  'minute': 15, 'stages': ['news', 'sentiment']},
+    ]
+    # 每次呼叫上游之間的間隔秒數 (遇到錯誤會自動加倍，最多 PREWARM_MAX_DELAY 秒)
+    PREWARM_PACING = {'bars': 0.5, 'chips': 1.0, 'news': 2.0, 'sentiment': 4.0}
+    PREWARM_MAX_DELAY = 60
+    # 記錄預熱進度，中斷後重跑會從上次停下的地方繼續
+    PREWARM_STATE_FILE = os.path.join(BASE_DIR, 'instance', 'prewarm_state.json')
+
+    # [批次分析] python main.py：報表與續跑進度 (checkpoint) 存放位置
+    BATCH_OUTPUT_DIR = os.path.join(BASE_DIR, 'data', 'reports')
+    BATCH_WORKERS = 8               # 同時分析幾檔 (實際打上游的併發仍受 UPSTREAM_POLICIES 限制)
+    BATCH_AI_THRESHOLD = 0.2        # AI 分數 >= 這個值才算「強力買進」(跟網頁偏多的標準一樣)
 
+    # [訊號紀錄] 盤後補上訊號出現後 1 / 5 / 20 個交易日的實際報酬
+    FORWARD_RETURN_LOOKBACK_DAYS = 60   # 超過這麼多天還補不齊 (例如下市) 就不再重試
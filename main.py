@@ -1,73 +1,278 @@
-import pandas as pd
-from datetime import datetime
-import config
-from src import market_data, strategy, sentiment
-
-def main():
-    print(f"🚀 AI 智能投資系統啟動... (模型: {config.AI_MODEL_NAME})")
-    print(f"📋 監控清單: {config.TARGET_STOCKS}")
-    print("-" * 50)
-
-    report_data = []
-
-    # 1. 遍歷每一支股票
-    for ticker in config.TARGET_STOCKS:
-        print(f"🔍 正在檢查 {ticker} ... ", end="")
-        
-        # A. 抓取股價
-        df = market_data.get_stock_data(ticker)
-        if df is None:
-            print("❌ 資料抓取失敗")
-            continue
-
-        # B. 技術面篩選 (量能突破)
-        is_breakout, tech_info = strategy.check_volume_breakout(df)
-        
-        if not is_breakout:
-            print("💤 無訊號 (跳過)")
-            continue # 如果沒突破，直接跳過，節省 AI 資源
-            
-        print("🔥 發現技術面突破！啟動 AI 分析...")
-
-        # C. 抓取新聞 & D. AI 情感分析
-        # 這裡簡單把 .TW 去掉當作關鍵字 (例如 2330.TW -> 2330)
-        stock_name = ticker.split(".")[0] 
-        news = market_data.get_recent_news(stock_name)
-        
-        ai_score, ai_comment = sentiment.analyze_sentiment(stock_name, news)
-        
-        # E. 綜合判斷
+"""
+批次分析 (無網頁)：掃描一批股票，量能突破的再交給 AI 評分，結果邊跑邊寫進報表
+
+用法：
+    python main.py                                  # 分析資料庫裡的自選股
+    python main.py --file data/tw_all.txt           # 一行一個代號 (# 開頭是註解，也可以用逗號分隔)
+    python main.py --tickers 2330,2317,2454
+    python main.py --file data/tw_all.txt --workers 16 --format parquet
+    python main.py --format csv                     # 預設 auto：有裝 pyarrow 寫 Parquet，沒有寫 CSV
+    python main.py --ai all                         # 每檔都跑 AI (預設只跑量能突破的)
+    python main.py --file data/tw_all.txt --ai fast # 全市場：每檔都用新聞關鍵字快速評分 (不打 LLM)
+
+中途中斷 (Ctrl+C、當機) 後用同一個 --run-id 再執行一次，已完成的股票會直接跳過；
+run-id 預設是今天日期，所以同一天重跑就是續跑，要從頭來加 --fresh。
+
+報表依交易日分區寫在 data/reports/date=YYYY-MM-DD/，讀取請用 src.reports.read_reports()，
+要接上訊號後的實際報酬用 src.reports.read_with_forward_returns()。
+"""
+import argparse
+import datetime
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 批次執行不要啟動網頁的排程器 (要在 import config 之前設定)
+os.environ.setdefault('SCHEDULER_ENABLED', '0')
+
+from config import Config
+from src import market_data, strategy, chips, sentiment, llm, trading_calendar, reports
+
+# ---------------------------------------------------------------
+#  輸入：檔案 / 命令列 / 自選股資料表
+# ---------------------------------------------------------------
+
+def _normalize(ticker):
+    ticker = ticker.strip().upper()
+    if ticker.isdigit():
+        ticker = f"{ticker}.TW"
+    return ticker
+
+def read_ticker_file(path):
+    tickers = []
+    with open(path, encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.split('#', 1)[0]
+            tickers += [t for t in line.replace(',', ' ').split() if t]
+    return tickers
+
+def watchlist_tickers():
+    # 用到才 import app (會連帶初始化 Flask 與資料庫)
+    import app as web_app
+    with web_app.app.app_context():
+        return web_app.all_watchlist_tickers()
+
+def collect_tickers(args):
+    tickers = []
+    for path in args.file or []:
+        tickers += read_ticker_file(path)
+    if args.tickers:
+        tickers += args.tickers.split(',')
+    if not tickers:
+        tickers = watchlist_tickers()
+
+    # 去掉重複，保留原本順序
+    seen = set()
+    result = []
+    for t in map(_normalize, tickers):
+        if t and t not in seen:
+            seen.add(t)
+            result.append(t)
+    return result
+
+# ---------------------------------------------------------------
+#  續跑進度：報表寫進檔案後才追加記錄，重跑時跳過
+# ---------------------------------------------------------------
+
+class Checkpoint:
+    def __init__(self, path, fresh=False):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fresh and os.path.exists(path):
+            os.remove(path)
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def mark_many(self, tickers):
+        self._file.write("".join(t + "\n" for t in tickers))
+        self._file.flush()
+        self.done.update(tickers)
+
+    def close(self):
+        self._file.close()
+
+# ---------------------------------------------------------------
+#  單檔分析 (在 worker 執行緒裡跑)
+# ---------------------------------------------------------------
+
+def analyze_ticker(ticker, ai_mode):
+    """ 回傳一列報表 (dict)；股價抓不到就丟例外，這檔不會記成完成，下次重跑會再試 """
+    df, valid_ticker = market_data.get_stock_data(ticker)
+    if df is None:
+        raise RuntimeError("股價資料抓取失敗")
+
+    is_breakout, tech_info = strategy.check_volume_breakout(df)
+    is_buy, signal_msg = strategy.check_buy_signal(df)
+
+    ai_score, ai_comment = None, None
+    final_signal = "無訊號"
+    if is_breakout:
         final_signal = "觀察"
-        if ai_score >= config.SENTIMENT_THRESHOLD:
+
+    # 沒突破就不跑 AI，節省額度 (--ai all 可以強制每檔都跑)
+    # --ai fast：每檔都用新聞關鍵字快速評分 (不打 LLM，全市場掃描用)
+    stock_name = valid_ticker.replace('.TWO', '').replace('.TW', '')
+    llm_scored = False
+    if ai_mode == 'fast':
+        ai_score, ai_comment = sentiment.quick_score(market_data.get_recent_news(stock_name))
+    elif ai_mode == 'all' or (ai_mode == 'breakout' and is_breakout):
+        chip_data = chips.get_institutional_chips(valid_ticker)
+        news = market_data.get_recent_news(stock_name)
+        ai_score, ai_comment = sentiment.analyze_sentiment(
+            stock_name, news, tech_info, chip_data, priority=llm.BACKGROUND
+        )
+        # LLM 失敗時拿到的是快速分數，不算 LLM 結果
+        llm_scored = sentiment.get_cached_sentiment(stock_name, news, tech_info, chip_data) is not None
+
+    if is_breakout and ai_score is not None:
+        if ai_score >= Config.BATCH_AI_THRESHOLD:
             final_signal = "強力買進 (Strong Buy)"
         elif ai_score <= -0.2:
             final_signal = "假突破疑慮 (Fakeout)"
-            
-        print(f"   🤖 AI 情緒分: {ai_score} | 評語: {ai_comment}")
-        print(f"   👉 最終建議: {final_signal}")
-
-        # F. 收集結果
-        report_data.append({
-            "Stock": ticker,
-            "Date": datetime.now().strftime("%Y-%m-%d"),
-            "Price": tech_info['price'],
-            "Change(%)": tech_info['change_pct'],
-            "Vol_Ratio": tech_info['vol_ratio'],
-            "AI_Score": ai_score,
-            "AI_Comment": ai_comment,
-            "Signal": final_signal
-        })
-        print("-" * 30)
-
-    # 2. 輸出報表
-    if report_data:
-        df_result = pd.DataFrame(report_data)
-        filename = f"data/report_{datetime.now().strftime('%Y%m%d')}.csv"
-        df_result.to_csv(filename, index=False, encoding="utf-8-sig")
-        print(f"\n✅ 分析完成！報表已儲存至: {filename}")
-        print(df_result[["Stock", "Price", "AI_Score", "Signal"]])
-    else:
-        print("\n🍂 今日無任何股票符合「量能突破」條件。")
+
+    return {
+        "Stock": valid_ticker,
+        "Date": df['Date'].iloc[-1].strftime("%Y-%m-%d"),
+        "Price": tech_info.get('price'),
+        "Change(%)": tech_info.get('change_pct'),
+        "Vol_Ratio": tech_info.get('vol_ratio'),
+        "RSI": tech_info.get('rsi'),
+        "MACD": tech_info.get('macd'),
+        "Breakout": bool(is_breakout),
+        "Strategy_Buy": bool(is_buy),
+        "AI_Score": ai_score,
+        "AI_Comment": ai_comment,
+        "Signal": final_signal,
+        # 不是報表欄位，只寫進訊號紀錄 (SignalLog)
+        "signal_msg": signal_msg,
+        "llm_scored": llm_scored,
+    }
+
+def _signal_record(row):
+    return {
+        'ticker': row['Stock'],
+        'trade_date': datetime.date.fromisoformat(row['Date']),
+        'close': row['Price'],
+        'vol_ratio': row['Vol_Ratio'],
+        'rsi': row['RSI'],
+        'is_breakout': row['Breakout'],
+        'is_buy': row['Strategy_Buy'],
+        'signal_msg': row['signal_msg'],
+        # 訊號紀錄的 AI 分數只記 LLM 的結果 (快速分數另外看報表)
+        'ai_score': row['AI_Score'] if row.get('llm_scored') else None,
+    }
+
+# ---------------------------------------------------------------
+#  主流程
+# ---------------------------------------------------------------
+
+def run(tickers, run_id, workers, ai_mode, fmt, output_dir, fresh=False, signal_log=True):
+    checkpoint = Checkpoint(os.path.join(output_dir, "_checkpoints", f"{run_id}.txt"), fresh=fresh)
+    if fresh:
+        reports.delete_run(output_dir, run_id)
+
+    web_app = None
+    if signal_log:
+        import app as web_app
+    pending_signals = []
+
+    def on_flush(keys):
+        # 報表真的寫進檔案 (flush) 之後才記成完成，當掉時還在緩衝區的股票下次會重跑
+        if web_app is not None and pending_signals:
+            with web_app.app.app_context():
+                web_app.record_signals(pending_signals, source='batch')
+            pending_signals.clear()
+        checkpoint.mark_many(keys)
+
+    report = reports.ReportSink(output_dir, run_id, fmt=fmt, on_flush=on_flush)
+
+    todo = [t for t in tickers if t not in checkpoint.done]
+    print(f"🚀 批次分析 {run_id}：共 {len(tickers)} 檔，已完成 {len(tickers) - len(todo)} 檔，"
+          f"本次要跑 {len(todo)} 檔 (workers={workers}, AI={ai_mode})")
+    print(f"📄 報表: {output_dir} (格式 {report.fmt}，依日期分區)")
+
+    stop = threading.Event()
+
+    def task(ticker):
+        if stop.is_set():
+            return None
+        return analyze_ticker(ticker, ai_mode)
+
+    done = failed = signals = 0
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {}
+    try:
+        futures = {executor.submit(task, t): t for t in todo}
+        # 結果只在主執行緒寫檔，不用另外上鎖
+        for future in as_completed(futures):
+            ticker = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {ticker} 失敗: {e}")
+                continue
+            if row is None:
+                continue
+
+            if web_app is not None:
+                pending_signals.append(_signal_record(row))
+            report.write(row, key=ticker)
+            done += 1
+            if row['Breakout']:
+                signals += 1
+                print(f"🔥 {row['Stock']} 量能突破 | AI {row['AI_Score']} | {row['Signal']}")
+
+            if done % 50 == 0:
+                rate = done / (time.perf_counter() - start)
+                print(f"📈 進度 {done + failed}/{len(todo)} (失敗 {failed})，{rate:.1f} 檔/秒")
+    except KeyboardInterrupt:
+        print("\n⏹️ 中斷！已完成的股票都記錄下來了，用同一個 --run-id 重跑即可續跑")
+        stop.set()
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        report.close()
+        checkpoint.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ 完成 {done} 檔、失敗 {failed} 檔、量能突破 {signals} 檔，耗時 {elapsed:.1f} 秒")
+    if failed:
+        print("💡 失敗的股票沒有記成完成，直接重跑同一個指令就會再試一次")
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI 選股系統批次分析")
+    parser.add_argument('--file', action='append', help="股票清單檔 (可以給多次)")
+    parser.add_argument('--tickers', help="用逗號分隔的股票代號，例如 2330,2317")
+    parser.add_argument('--workers', type=int, default=Config.BATCH_WORKERS)
+    parser.add_argument('--ai', choices=['breakout', 'all', 'fast', 'none'], default='breakout',
+                        help="哪些股票要跑 AI 評分 (預設只跑量能突破的；fast 是每檔都用快速評分)")
+    parser.add_argument('--format', choices=('auto',) + reports.FORMATS, default='auto',
+                        help="parquet / arrow 需要安裝 pyarrow (auto：有裝就用 parquet)")
+    parser.add_argument('--run-id', help="續跑用的批次名稱 (預設今天日期)")
+    parser.add_argument('--output-dir', default=Config.BATCH_OUTPUT_DIR)
+    parser.add_argument('--fresh', action='store_true', help="忽略之前的進度，從頭開始")
+    parser.add_argument('--no-signal-log', action='store_true', help="不要把訊號寫進資料庫的 SignalLog")
+    args = parser.parse_args(argv)
+
+    tickers = collect_tickers(args)
+    if not tickers:
+        print("🍂 沒有要分析的股票 (自選清單是空的，請用 --file 或 --tickers 指定)")
+        return 0
+
+    run_id = args.run_id or trading_calendar.today_tw().strftime('%Y%m%d')
+    failed = run(tickers, run_id, args.workers, args.ai, args.format, args.output_dir,
+                 fresh=args.fresh, signal_log=not args.no_signal_log)
+    return 1 if failed else 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
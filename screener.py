@@ -0,0 +1,179 @@
+"""
+選股 / 策略參數掃描：Config.STRATEGY_RULES 的規則在一批股票上一次算完 (不跑 AI)
+
+用法：
+    python screener.py --file data/tw_all.txt                     # 今天符合預設策略的股票
+    python screener.py --tickers 2330,2317,2454 --strategies dual_ma_slope
+    python screener.py --file data/tw_all.txt --grid vol_multiplier=1.25,1.5,2 rsi_limit=75,82 --backtest
+    python screener.py --file data/tw_all.txt --output data/screen.csv
+    python screener.py --file data/tw_all.txt --robustness --output data/robustness.csv   # 夜間跑：回測信賴區間
+    python screener.py --file data/tw_all.txt --sentiment         # 加上新聞關鍵字快速評分 (不打 LLM)
+    python screener.py --file data/tw_all.txt --build-index       # 順便把全市場加進相似股索引
+    python screener.py --file data/tw_all.txt --ml                # 加上 ML 明天上漲機率 (共用模型一次算完)
+
+--grid 會把策略的 params 展開成所有組合 (上例 3 × 2 = 6 個變體)，
+同一檔股票的所有變體共用指標 (例如 MA20 只算一次)，不用為每個變體另外寫迴圈。
+--robustness 每個策略再做幾千次模擬 (src/robustness.py)，用 process pool 分給每個 CPU 核心。
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('SCHEDULER_ENABLED', '0')
+
+import pandas as pd
+from config import Config
+from src import market_data, backtest, rules, robustness, sentiment, similarity, ml_predict
+from main import collect_tickers
+
+def parse_grid(items):
+    """ ['vol_multiplier=1.25,1.5', 'rsi_limit=75'] → {'vol_multiplier': [1.25, 1.5], 'rsi_limit': [75]} """
+    grid = {}
+    for item in items or []:
+        name, _, values = item.partition('=')
+        if not values:
+            raise SystemExit(f"❌ --grid 格式是 名稱=值1,值2：{item}")
+        numbers = [float(v) for v in values.split(',') if v.strip()]
+        grid[name.strip()] = [int(v) if v.is_integer() else v for v in numbers]
+    return grid
+
+def build_strategies(names, grid):
+    strategies = []
+    for name in names:
+        strategies += rules.variants(name, grid) if grid else [rules.get_strategy(name)]
+    return strategies
+
+def load_frames(tickers, workers):
+    frames = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for ticker, (df, valid_ticker) in zip(tickers, executor.map(market_data.get_stock_data, tickers)):
+            if df is None:
+                print(f"❌ {ticker} 股價資料抓取失敗")
+                continue
+            frames[valid_ticker] = df
+    return frames
+
+def run(frames, strategies, with_backtest=False):
+    """ 回傳每檔 × 每個策略一列：今天是否符合 (+ 回測結果) """
+    rows = []
+    for ticker, df in frames.items():
+        memo = {}  # 同一檔股票的所有策略共用
+        for strategy in strategies:
+            row = {'ticker': ticker, 'strategy': strategy.name,
+                   'signal': len(df) >= strategy.min_bars and bool(strategy.signal(df, memo).iloc[-1])}
+            if with_backtest:
+                result = backtest.run_backtest(df, strategy, memo)
+                row.update(trades=result['total_trades'], win_rate=result['win_rate'],
+                           total_return=result['total_return'])
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+def add_robustness(table, frames, strategies, workers):
+    """ 每檔 × 每個策略加上回測信賴區間 (總報酬 / 勝率 / 最大回撤的上下界、虧損機率) """
+    columns = {}
+    for strategy in strategies:
+        for ticker, result in robustness.run_universe(frames, strategy, workers).items():
+            if result is None:
+                continue
+            columns[(ticker, strategy.name)] = {
+                'return_low': result['total_return']['low'], 'return_high': result['total_return']['high'],
+                'win_rate_low': result['win_rate']['low'], 'win_rate_high': result['win_rate']['high'],
+                'drawdown_low': result['max_drawdown']['low'], 'drawdown_high': result['max_drawdown']['high'],
+                'loss_probability': result['loss_probability'],
+            }
+    extra = pd.DataFrame([columns.get((row.ticker, row.strategy), {}) for row in table.itertuples()],
+                         index=table.index)
+    return pd.concat([table, extra], axis=1)
+
+def add_sentiment(table, tickers, workers):
+    """ 每檔加上新聞標題的快速情緒分數 (src/fast_sentiment.py)；抓新聞走快取 / 上游併發限制 """
+    def score(ticker):
+        return sentiment.quick_score(market_data.get_recent_news(ticker.replace('.TWO', '').replace('.TW', '')))[0]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        scores = dict(zip(tickers, executor.map(score, tickers)))
+    table['sentiment'] = table['ticker'].map(scores)
+    return table
+
+def add_ml(table, frames):
+    """ 每檔加上 ML 明天上漲機率 (src/ml_predict.py：一次 predict_proba，跟早報 / 結果頁共用快取) """
+    probs = ml_predict.predict_batch(frames)
+    table['ml_prob'] = table['ticker'].map(probs)
+    return table
+
+def summarize(table, with_backtest):
+    print()
+    for name, group in table.groupby('strategy', sort=False):
+        matched = group.loc[group['signal'], 'ticker'].tolist()
+        line = f"🎯 {name}: 今天符合 {len(matched)} 檔"
+        if with_backtest:
+            trades = group['trades'].sum()
+            wins = (group['trades'] * group['win_rate'] / 100).sum()
+            win_rate = wins / trades * 100 if trades else 0
+            line += (f" | 回測 {trades} 筆交易，勝率 {win_rate:.1f}%，"
+                     f"平均報酬 {group['total_return'].mean():.1f}%")
+        if 'sentiment' in group and matched:
+            line += f" | 符合的股票新聞分數平均 {group.loc[group['signal'], 'sentiment'].mean():+.2f}"
+        if 'ml_prob' in group and matched:
+            line += f" | 符合的股票 ML 上漲機率平均 {group.loc[group['signal'], 'ml_prob'].mean():.1f}%"
+        if 'loss_probability' in group:
+            line += f" | 虧損機率中位數 {group['loss_probability'].median():.1f}%"
+        print(line)
+        if matched:
+            print("   " + ", ".join(matched[:20]) + (" ..." if len(matched) > 20 else ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI 選股系統：規則選股 / 策略參數掃描")
+    parser.add_argument('--file', action='append', help="股票清單檔 (可以給多次)")
+    parser.add_argument('--tickers', help="用逗號分隔的股票代號，例如 2330,2317")
+    parser.add_argument('--strategies', default=Config.DEFAULT_STRATEGY,
+                        help=f"用逗號分隔的策略名稱 (Config.STRATEGY_RULES：{', '.join(Config.STRATEGY_RULES)})")
+    parser.add_argument('--grid', nargs='*', help="參數組合，例如 vol_multiplier=1.25,1.5 rsi_limit=75,82")
+    parser.add_argument('--backtest', action='store_true', help="每個策略 (變體) 也跑回測")
+    parser.add_argument('--robustness', action='store_true', help="每個策略也做穩健度模擬 (回測信賴區間)")
+    parser.add_argument('--sentiment', action='store_true', help="加上新聞關鍵字快速評分 (不打 LLM)")
+    parser.add_argument('--ml', action='store_true', help="加上 ML 明天上漲機率 (共用模型批次預測)")
+    parser.add_argument('--build-index', action='store_true', help="抓到的股票順便更新相似股索引")
+    parser.add_argument('--workers', type=int, default=Config.BATCH_WORKERS)
+    parser.add_argument('--processes', type=int, default=Config.ROBUSTNESS_WORKERS,
+                        help="穩健度模擬的 process 數 (預設 CPU 核心數)")
+    parser.add_argument('--output', help="結果另存成 CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        strategies = build_strategies(args.strategies.split(','), parse_grid(args.grid))
+    except (rules.RuleError, KeyError) as e:
+        print(f"❌ 策略設定有誤: {e}")
+        return 1
+
+    tickers = collect_tickers(args)
+    if not tickers:
+        print("🍂 沒有要掃描的股票 (請用 --file 或 --tickers 指定)")
+        return 0
+
+    start = time.perf_counter()
+    frames = load_frames(tickers, args.workers)
+    loaded = time.perf_counter()
+    table = run(frames, strategies, args.backtest)
+    if args.robustness:
+        table = add_robustness(table, frames, strategies, args.processes)
+    if args.sentiment:
+        table = add_sentiment(table, list(frames), args.workers)
+    if args.ml:
+        table = add_ml(table, frames)
+    if args.build_index:
+        updated = similarity.rebuild(frames)
+        print(f"🧭 相似股索引更新 {updated} 檔 (共 {len(similarity.tickers())} 檔)")
+    print(f"\n✅ {len(frames)} 檔 × {len(strategies)} 個策略：抓資料 {loaded - start:.1f} 秒、"
+          f"計算 {time.perf_counter() - loaded:.1f} 秒")
+    summarize(table, args.backtest)
+
+    if args.output:
+        table.to_csv(args.output, index=False, encoding='utf-8-sig')
+        print(f"\n📄 結果已存到 {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,131 +1,145 @@
-import pandas as pd
-import numpy as np
 from config import Config
-from src.strategy import calculate_rsi
+from src import metrics, kernels, rules
 
-def run_backtest(df):
+_EXIT_NOTES = {
+    kernels.EXIT_HOLD: "持有到期",
+    kernels.EXIT_STOP: "停損出場",
+    kernels.EXIT_TAKE: "停利出場 🎉",
+}
+
+HOLDING_DAYS = 5       # 持有天數
+LOOKBACK_BARS = 250    # 回測最近一年 (約 250 個交易日)
+
+def entry_range(n_bars, holding_days=HOLDING_DAYS):
+    """ 可以進場的區間 [start, end)：前 60 天留給 MA60，最後 holding_days 天來不及出場 """
+    return max(60, n_bars - LOOKBACK_BARS), n_bars - holding_days
+
+def simulate(df, signal, holding_days=HOLDING_DAYS, stop_loss_pct=None, take_profit_pct=None):
     """
-    回測策略 (最終殺手鐧 - 雙斜率過濾)：
+    kernels 版的回測核心 (不組交易明細)：回傳 (entries, exit_idx, sell_price, returns, reason) 陣列
+    穩健度分析 (src/robustness.py) 換參數重跑幾百次也是呼叫這裡
+    """
+    stop_loss_pct = Config.STOP_LOSS_PCT if stop_loss_pct is None else stop_loss_pct
+    take_profit_pct = Config.TAKE_PROFIT_PCT if take_profit_pct is None else take_profit_pct
+    start, end = entry_range(len(df), holding_days)
+    rows, entries = kernels.select_entries(signal, start, end, holding_days)
+    exit_idx, sell_price, returns, reason = kernels.scan_exits(
+        df['High'].to_numpy(dtype=float), df['Low'].to_numpy(dtype=float), df['Close'].to_numpy(dtype=float),
+        rows, entries, stop_loss_pct, take_profit_pct, holding_days
+    )
+    return entries, exit_idx, sell_price, returns, reason
+
+def _kernel_trades(df, signal, holding_days, stop_loss_pct, take_profit_pct):
+    """ 跟 _loop_trades 一樣的規則，改成交給 kernels 挑進場點、掃停損停利 """
+    entries, exit_idx, sell_price, returns, reason = simulate(
+        df, signal, holding_days, stop_loss_pct, take_profit_pct)
+    close = df['Close'].to_numpy(dtype=float)
+    return [{
+        "buy_date": df.index[i],
+        "buy_price": close[i],
+        "sell_date": df.index[e],
+        "sell_price": p,
+        "return": r,
+        "note": _EXIT_NOTES[c],
+    } for i, e, p, r, c in zip(entries, exit_idx, sell_price, returns, reason)]
+
+def _loop_trades(df, signal, holding_days, stop_loss_pct, take_profit_pct):
+    """ 原本的逐日迴圈 (kernels 關閉時用)：有訊號就進場，持有 holding_days 天內碰到停損 / 停利就出場 """
+    start_idx, _ = entry_range(len(df), holding_days)
+    trades = []
+    i = start_idx
+    while i < len(df) - holding_days:
+        if not signal[i]:
+            i += 1
+            continue
+
+        today = df.iloc[i]
+        buy_price = today['Close']
+        buy_date = df.index[i]
+
+        # --- 2. 模擬持有 ---
+        sell_price = 0
+        sell_date = None
+        return_pct = 0
+        note = "持有到期"
+    
+        is_closed = False 
+    
+        for j in range(1, holding_days + 1):
+            future_day = df.iloc[i + j]
+        
+            # 停損
+            if future_day['Low'] <= (buy_price * (1 - stop_loss_pct)):
+                sell_price = buy_price * (1 - stop_loss_pct)
+                sell_date = df.index[i + j]
+                return_pct = -stop_loss_pct
+                note = "停損出場"
+                is_closed = True
+                break
+        
+            # 停利
+            if future_day['High'] >= (buy_price * (1 + take_profit_pct)):
+                sell_price = buy_price * (1 + take_profit_pct)
+                sell_date = df.index[i + j]
+                return_pct = take_profit_pct
+                note = "停利出場 🎉"
+                is_closed = True
+                break
+    
+        if not is_closed:
+            sell_day = df.iloc[i + holding_days]
+            sell_price = sell_day['Close']
+            sell_date = df.index[i + holding_days]
+            return_pct = (sell_price - buy_price) / buy_price
+    
+        trades.append({
+            "buy_date": buy_date,
+            "buy_price": buy_price,
+            "sell_date": sell_date,
+            "sell_price": sell_price,
+            "return": return_pct,
+            "note": note
+        })
+    
+        i += holding_days
+
+    return trades
+
+@metrics.timed('run_backtest')
+def run_backtest(df, strategy_name=None, memo=None):
+    """
+    回測策略 (預設「雙均線雙斜率共振」，規則在 Config.STRATEGY_RULES)：
     1. 【雙斜率共振】 月線(MA20) 與 季線(MA60) 都必須「趨勢向上(斜率>0)」才准買。
        這能完美過濾掉「空頭走勢中的反彈假突破」。
     2. 其他條件維持：爆量、收紅、RSI保護、停損停利。
+    strategy_name 可以是策略名稱或編譯好的 rules.Strategy (參數組合掃描用)
+    memo: 同一份 df 跑多個策略時傳同一個 dict，共同的指標只算一次
     """
-    df = df.copy()
-    
+    rule_set = strategy_name if isinstance(strategy_name, rules.Strategy) else rules.get_strategy(strategy_name)
+
     trades = [] 
-    holding_days = 5 
+    holding_days = HOLDING_DAYS
     
     # --- 策略參數 ---
     stop_loss_pct = Config.STOP_LOSS_PCT
     take_profit_pct = Config.TAKE_PROFIT_PCT
     
-    backtest_vol_multiplier = Config.BACKTEST_VOL_MULTIPLIER
-    rsi_limit = Config.BACKTEST_RSI_LIMIT
-    
-    # --- 1. 準備指標 ---
-    if 'MA5_Vol' not in df.columns:
-        df['MA5_Vol'] = df['Volume'].rolling(window=5).mean()
-        
-    df['MA20'] = df['Close'].rolling(window=20).mean()
-    df['MA60'] = df['Close'].rolling(window=60).mean()
-    df['RSI'] = calculate_rsi(df['Close'])
-    
-    # 計算斜率
-    df['MA20_Slope'] = df['MA20'].diff()
-    df['MA60_Slope'] = df['MA60'].diff() # [新增] 季線斜率
-
-    start_idx = max(60, len(df) - 250)
-    
-    i = start_idx
-    while i < len(df) - holding_days:
-        
-        today = df.iloc[i]
-        vol_ma5 = today['MA5_Vol']
-        rsi = today['RSI']
-        ma20_slope = today['MA20_Slope']
-        ma60_slope = today['MA60_Slope']
-        
-        # 防呆
-        if vol_ma5 == 0 or pd.isna(rsi) or pd.isna(ma20_slope) or pd.isna(ma60_slope):
-            i += 1
-            continue
+    # --- 1. 進場條件：整段 K 線一次算出每天是否符合全部規則 ---
+    signal = rule_set.signal(df, memo).to_numpy()
 
-        # --- 2. 進場條件 ---
-        
-        # A: 雙均線 + 雙斜率 (最強濾網)
-        # 只有當「中長期趨勢」都同步向上時，才視為安全進場點
-        condition_trend = (today['Close'] > today['MA20']) and \
-                          (ma20_slope > 0) and \
-                          (today['Close'] > today['MA60']) and \
-                          (ma60_slope > 0) 
-        
-        # B: 量能與型態
-        condition_vol = today['Volume'] > (vol_ma5 * backtest_vol_multiplier)
-        condition_red = today['Close'] > today['Open']
-        condition_rsi = rsi < rsi_limit
-        
-        # 綜合判斷
-        if condition_trend and condition_vol and condition_red and condition_rsi:
-            
-            buy_price = today['Close']
-            buy_date = df.index[i]
-            
-            # --- 3. 模擬持有 ---
-            sell_price = 0
-            sell_date = None
-            return_pct = 0
-            note = "持有到期"
-            
-            is_closed = False 
-            
-            for j in range(1, holding_days + 1):
-                future_day = df.iloc[i + j]
-                
-                # 停損
-                if future_day['Low'] <= (buy_price * (1 - stop_loss_pct)):
-                    sell_price = buy_price * (1 - stop_loss_pct)
-                    sell_date = df.index[i + j]
-                    return_pct = -stop_loss_pct
-                    note = "停損出場"
-                    is_closed = True
-                    break
-                
-                # 停利
-                if future_day['High'] >= (buy_price * (1 + take_profit_pct)):
-                    sell_price = buy_price * (1 + take_profit_pct)
-                    sell_date = df.index[i + j]
-                    return_pct = take_profit_pct
-                    note = "停利出場 🎉"
-                    is_closed = True
-                    break
-            
-            if not is_closed:
-                sell_day = df.iloc[i + holding_days]
-                sell_price = sell_day['Close']
-                sell_date = df.index[i + holding_days]
-                return_pct = (sell_price - buy_price) / buy_price
-            
-            trades.append({
-                "buy_date": buy_date,
-                "buy_price": buy_price,
-                "sell_date": sell_date,
-                "sell_price": sell_price,
-                "return": return_pct,
-                "note": note
-            })
-            
-            i += holding_days
-        else:
-            i += 1
+    if kernels.enabled():
+        trades = _kernel_trades(df, signal, holding_days, stop_loss_pct, take_profit_pct)
+    else:
+        trades = _loop_trades(df, signal, holding_days, stop_loss_pct, take_profit_pct)
 
-    # --- 4. 統計結果 ---
+    # --- 3. 統計結果 ---
     total_trades = len(trades)
     if total_trades == 0:
         return {
             "total_trades": 0,
             "win_rate": 0,
             "total_return": 0,
-            "strategy_name": "雙均線雙斜率共振"
+            "strategy_name": rule_set.label
         }
 
     win_count = sum(1 for t in trades if t['return'] > 0)
@@ -141,5 +155,5 @@ def run_backtest(df):
         "total_trades": total_trades,
         "win_rate": win_rate,
         "total_return": total_return_pct,
-        "strategy_name": "雙均線雙斜率共振"
+        "strategy_name": rule_set.label
     }
\ No newline at end of file
@@ -0,0 +1,297 @@
+import contextlib
+import datetime
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from config import Config
+from src import trading_calendar, metrics
+
+# 兩層快取：
+# 1. 記憶體 { (namespace, key): (value, fetched_at) }，同一個 worker 內最快
+#    LRU，最多 Config.MEMORY_CACHE_MAX_ENTRIES 筆
+# 2. SQLite (WAL 模式) 共用檔案，gunicorn 的每個 worker 都讀得到彼此抓過的資料
+#    每隔 Config.SHARED_CACHE_SWEEP_SECONDS 秒順手刪掉已經過期的列
+_store = OrderedDict()
+_lock = threading.Lock()
+_last_sweep = time.monotonic()
+
+# 同一個 key 同時只讓一個執行緒去抓上游，其他人等它抓完直接用
+# 鎖只在有人要抓的期間存在 { (namespace, key): [RLock, 使用中的人數] }，沒人用就拿掉，
+# 所以表不會越長越大，不同 key 也不會互相卡住；RLock 讓同一條執行緒巢狀拿鎖也不會卡死
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+_local = threading.local()
+
+def _db():
+    """ 每個執行緒一條 SQLite 連線 (sqlite3 連線不能跨執行緒共用) """
+    path = Config.SHARED_CACHE_PATH
+    if not path:
+        return None
+
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+def _is_fresh(namespace, fetched_at):
+    policy = Config.CACHE_POLICIES.get(namespace, {})
+    return not trading_calendar.needs_refresh(fetched_at, **policy)
+
+def _read_shared(namespace, key):
+    try:
+        conn = _db()
+        if conn is None:
+            return None
+        row = conn.execute(
+            "SELECT value, fetched_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"⚠️ [快取] 共用快取讀取失敗: {e}")
+        return None
+
+    if row is None:
+        return None
+    fetched_at = datetime.datetime.fromtimestamp(row[1], trading_calendar.TW_TZ)
+    return pickle.loads(row[0]), fetched_at
+
+def get(namespace, key, record=True):
+    """
+    取出快取，只有在資料「不可能過期」時才回傳 (hit, value)
+    過期判斷交給交易日曆 (見 Config.CACHE_POLICIES)
+    record=False 用在拿到鎖之後的二次確認，避免 miss 被重複計算
+    """
+    with _lock:
+        entry = _store.get((namespace, key))
+        if entry is not None:
+            _store.move_to_end((namespace, key))
+    if entry is not None and _is_fresh(namespace, entry[1]):
+        if record:
+            metrics.inc('cache_requests_total', namespace=namespace, result='hit')
+        return True, entry[0]
+
+    # 記憶體沒有 (或過期)，看看別的 worker 有沒有抓過比較新的
+    entry = _read_shared(namespace, key)
+    if entry is None or not _is_fresh(namespace, entry[1]):
+        if record:
+            metrics.inc('cache_requests_total', namespace=namespace, result='miss')
+        return False, None
+
+    _remember(namespace, key, entry)
+    if record:
+        metrics.inc('cache_requests_total', namespace=namespace, result='shared_hit')
+    return True, entry[0]
+
+def fetched_at(namespace, key):
+    """
+    快取還新鮮就回傳抓取時間 (當作這份資料的「版本」)，沒有或過期回傳 None
+    只看時間不取值，共用快取也不用 unpickle 整份資料
+    """
+    with _lock:
+        entry = _store.get((namespace, key))
+    if entry is not None and _is_fresh(namespace, entry[1]):
+        return entry[1]
+
+    try:
+        conn = _db()
+        if conn is None:
+            return None
+        row = conn.execute(
+            "SELECT fetched_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"⚠️ [快取] 共用快取讀取失敗: {e}")
+        return None
+    if row is None:
+        return None
+    fetched = datetime.datetime.fromtimestamp(row[0], trading_calendar.TW_TZ)
+    return fetched if _is_fresh(namespace, fetched) else None
+
+def _remember(namespace, key, entry):
+    """ 放進記憶體快取，超過上限就丟掉最久沒用到的 """
+    with _lock:
+        _store[(namespace, key)] = entry
+        _store.move_to_end((namespace, key))
+        while len(_store) > Config.MEMORY_CACHE_MAX_ENTRIES:
+            _store.popitem(last=False)
+
+def put(namespace, key, value):
+    global _last_sweep
+    fetched_at = trading_calendar.now_tw()
+    _remember(namespace, key, (value, fetched_at))
+
+    try:
+        conn = _db()
+        if conn is not None:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, fetched_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), fetched_at.timestamp())
+                )
+    except sqlite3.Error as e:
+        print(f"⚠️ [快取] 共用快取寫入失敗: {e}")
+
+    with _lock:
+        due = time.monotonic() - _last_sweep >= Config.SHARED_CACHE_SWEEP_SECONDS
+        if due:
+            _last_sweep = time.monotonic()
+    if due:
+        sweep()
+
+def _expired_before(policy, now):
+    """ 這個時間點以前抓的資料不管盤中盤後都一定過期了 (沒辦法判斷就回傳 None) """
+    if policy.get('ready_time'):
+        return trading_calendar.latest_release(policy['ready_time'], now)
+    ttls = [t for t in (policy.get('session_ttl'), policy.get('off_ttl')) if t is not None]
+    if ttls:
+        return now - datetime.timedelta(seconds=max(ttls))
+    return None
+
+def sweep():
+    """ 刪掉共用快取裡依 Config.CACHE_POLICIES 已經過期的列，回傳刪了幾筆 """
+    now = trading_calendar.now_tw()
+    deleted = 0
+    try:
+        conn = _db()
+        if conn is None:
+            return 0
+        with conn:
+            for namespace, policy in Config.CACHE_POLICIES.items():
+                cutoff = _expired_before(policy, now)
+                if cutoff is None:
+                    continue
+                deleted += conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND fetched_at < ?",
+                    (namespace, cutoff.timestamp())
+                ).rowcount
+    except sqlite3.Error as e:
+        print(f"⚠️ [快取] 共用快取清理失敗: {e}")
+    if deleted:
+        print(f"🧹 [快取] 共用快取清掉 {deleted} 筆過期資料")
+    return deleted
+
+def clear_memory(namespace=None):
+    """ 只清這個 process 的記憶體快取 """
+    with _lock:
+        if namespace is None:
+            _store.clear()
+        else:
+            for k in [k for k in _store if k[0] == namespace]:
+                del _store[k]
+
+def clear(namespace=None):
+    clear_memory(namespace)
+
+    conn = _db()
+    if conn is not None:
+        with conn:
+            if namespace is None:
+                conn.execute("DELETE FROM cache_entries")
+            else:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+@contextlib.contextmanager
+def key_lock(namespace, key):
+    """ 拿某個 key 的鎖 (同 worker 內避免多個請求同時抓同一檔)，只有抓同一個 key 的人會互相等 """
+    k = (namespace, key)
+    with _key_locks_guard:
+        entry = _key_locks.get(k)
+        if entry is None:
+            entry = _key_locks[k] = [threading.RLock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _key_locks[k]
+
+def cached(namespace, key_func=None, should_cache=None):
+    """
+    裝飾器：依交易日曆決定要不要重抓
+    key_func    : 從參數算出快取 key (預設用第一個參數)
+    should_cache: 判斷結果能不能存 (抓失敗的結果就不要存，下次再試)
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs) if key_func else str(args[0])
+            hit, value = get(namespace, key)
+            if hit:
+                return value
+
+            with key_lock(namespace, key):
+                # 排隊等鎖的期間，可能已經有人抓好了
+                hit, value = get(namespace, key, record=False)
+                if hit:
+                    return value
+
+                value = func(*args, **kwargs)
+                if should_cache is None or should_cache(value):
+                    put(namespace, key, value)
+                return value
+        return wrapper
+    return decorator
+
+# ---------------------------------------------------------------
+#  共用版本號：資料有變動就 +1，各 worker 比對版本決定記憶體裡的東西要不要丟掉
+# ---------------------------------------------------------------
+
+_versions = {}  # 沒有共用快取檔時的 process 內版本號
+
+def get_version(name):
+    try:
+        conn = _db()
+        if conn is not None:
+            row = conn.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+            return row[0] if row else 0
+    except sqlite3.Error as e:
+        print(f"⚠️ [快取] 版本號讀取失敗: {e}")
+        # 讀不到就當成有變動，寧可多查一次也不要拿舊資料
+        return None
+    with _lock:
+        return _versions.get(name, 0)
+
+def bump_version(name):
+    """ 資料寫入「之後」呼叫，讓所有 worker 下次讀取時重新載入 """
+    try:
+        conn = _db()
+        if conn is not None:
+            with conn:
+                conn.execute(
+                    "INSERT INTO versions (name, version) VALUES (?, 1) "
+                    "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+                    (name,)
+                )
+            return
+    except sqlite3.Error as e:
+        print(f"⚠️ [快取] 版本號更新失敗: {e}")
+    with _lock:
+        _versions[name] = _versions.get(name, 0) + 1
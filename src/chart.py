@@ -1,7 +1,11 @@
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots # 引入子圖功能
 import pandas as pd
+from src import metrics, lazy
 
+# plotly 很大，第一次畫圖才載入
+go = lazy.lazy_import('plotly.graph_objects')
+plotly_subplots = lazy.lazy_import('plotly.subplots') # 引入子圖功能
+
+@metrics.timed('create_stock_chart')
 def create_stock_chart(df, ticker):
     """
     繪製專業互動式 K 線圖
@@ -32,7 +36,7 @@ def create_stock_chart(df, ticker):
         df['MA60'] = df['Close'].rolling(window=60).mean()
 
     # --- 3. 建立雙層圖表 (上層股價，下層成交量) ---
-    fig = make_subplots(
+    fig = plotly_subplots.make_subplots(
         rows=2, cols=1, 
         shared_xaxes=True, # 共用時間軸 (放大縮小會同步)
         vertical_spacing=0.03, # 上下圖的間距
@@ -1,10 +1,17 @@
-import requests
 import pandas as pd
 import datetime
+from src import cache, trading_calendar, metrics, upstream
 
+EMPTY_STATUS_TEXT = "暫無法人數據"
+
+@metrics.timed('get_institutional_chips')
+@cache.cached('chips',
+              key_func=lambda stock_id: str(stock_id).replace(".TWO", "").replace(".TW", "").strip(),
+              should_cache=lambda summary: summary['status_text'] != EMPTY_STATUS_TEXT)
 def get_institutional_chips(stock_id):
     """
     直接使用 HTTP Request 抓取 FinMind API (修正代號清洗順序 Bug)
+    法人資料每天盤後才更新一次，當天已抓過就直接用快取
     """
     # 1. 清洗代號 (關鍵修正：先取代 .TWO，再取代 .TW)
     # 如果先取代 .TW，8436.TWO 會變成 8436O，導致查詢失敗
@@ -14,7 +21,7 @@ def get_institutional_chips(stock_id):
 
     try:
         # 設定日期範圍 (抓最近 30 天)
-        today = datetime.date.today()
+        today = trading_calendar.today_tw()
         start_date = (today - datetime.timedelta(days=30)).strftime('%Y-%m-%d')
         
         # 直接呼叫 API 網址
@@ -26,12 +33,12 @@ def get_institutional_chips(stock_id):
             "token": "" 
         }
         
-        # 發送請求
-        r = requests.get(url, params=params)
-        data = r.json()
+        # 發送請求 (經過共用連線池，含逾時、重試、斷路器)
+        data = upstream.get_json('finmind', url, params=params)
         
         # 檢查 API 回傳狀態
         if data.get('msg') != 'success':
+            metrics.inc('upstream_errors_total', provider='finmind')
             print(f"⚠️ API 回傳錯誤訊息: {data.get('msg')}")
             return default_empty_result()
             
@@ -99,5 +106,5 @@ def default_empty_result():
         "foreign_total": 0,
         "trust_total": 0,
         "dealer_total": 0,
-        "status_text": "暫無法人數據"
+        "status_text": EMPTY_STATUS_TEXT
     }
\ No newline at end of file
@@ -0,0 +1,103 @@
+import math
+import os
+from config import Config
+
+# 新聞標題快速情緒評分 (本機、純 CPU、不用呼叫 LLM)
+#
+# 詞庫 data/sentiment_lexicon.txt 開機時載入一次；每則標題由左到右做「最長詞優先」比對：
+#   情緒詞  加上權重 (正數偏多、負數偏空)
+#   否定詞  (不、未...) 後面 NEGATION_SPAN 個字內的下一個情緒詞正負號反過來
+#   加強詞  (大幅、連續...) 後面 NEGATION_SPAN 個字內的下一個情緒詞乘上倍數
+# 一則標題幾微秒，分數跟 Gemini 一樣落在 -1 ~ +1。
+#
+# 用途：
+#   1. Gemini 忙碌 / 失敗時的備用分數 (sentiment.analyze_sentiment)
+#   2. 分層模式 (Config.SENTIMENT_MODE = 'tiered')：先回快速分數，LLM 在背景算完再換掉
+#   3. 全市場掃描 (main.py --ai fast、screener.py --sentiment)：每檔都叫 LLM 太貴
+
+NEGATION_SPAN = 3   # 否定 / 加強詞往後影響幾個字
+
+_terms = {}         # 詞 → (種類, 數值)；種類是 'sentiment' / 'negation' / 'intensifier'
+_max_len = 0
+
+def load(path=None):
+    """ 讀詞庫 (改過檔案後呼叫可以重新載入) """
+    global _terms, _max_len
+    path = path or Config.SENTIMENT_LEXICON_FILE
+    terms = {}
+    section = 'sentiment'
+    with open(path, encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                section = line[1:-1].strip()
+                continue
+            parts = line.split()
+            if section == 'negation':
+                terms[parts[0]] = ('negation', -1.0)
+            elif len(parts) >= 2:
+                terms[parts[0]] = (section, float(parts[1]))
+    _terms = terms
+    _max_len = max(map(len, terms), default=0)
+    return len(terms)
+
+def _squash(raw):
+    """ 加總的權重壓到 -1 ~ +1 (一個「大漲」約 0.6，兩三個強烈詞就接近 ±1) """
+    return math.tanh(raw / 2)
+
+def score_headline(text):
+    """ 回傳 (分數 -1 ~ +1, [(命中的詞, 權重), ...]) """
+    raw = 0.0
+    hits = []
+    factor, factor_until = 1.0, -1
+    i, n = 0, len(text)
+    while i < n:
+        for size in range(min(_max_len, n - i), 0, -1):
+            term = _terms.get(text[i:i + size])
+            if term is not None:
+                break
+        else:
+            i += 1
+            continue
+
+        kind, value = term
+        word = text[i:i + size]
+        i += size
+        if kind == 'sentiment':
+            weight = value * (factor if i - size <= factor_until else 1.0)
+            raw += weight
+            hits.append((word, round(weight, 2)))
+            factor, factor_until = 1.0, -1
+        else:
+            # 否定 + 加強可以疊加 (例如「未大幅」)
+            factor = factor * value if i - size <= factor_until else value
+            factor_until = i + NEGATION_SPAN
+    return _squash(raw), hits
+
+def score_news(news_list):
+    """
+    一檔股票的新聞標題 → (分數, 說明)，格式跟 sentiment.analyze_sentiment 一樣
+    分數是有命中情緒詞的標題平均 (沒命中的標題不拉低分數)
+    """
+    if not _terms:
+        load()
+    scores = []
+    words = []
+    for headline in news_list or []:
+        score, hits = score_headline(headline)
+        if hits:
+            scores.append(score)
+            words += [word for word, _ in hits if word not in words]
+    if not scores:
+        return 0.0, "⚡ 快速評分：新聞標題沒有明顯的多空關鍵字"
+
+    score = round(sum(scores) / len(scores), 2)
+    positive = sum(1 for s in scores if s > 0)
+    negative = sum(1 for s in scores if s < 0)
+    return score, (f"⚡ 快速評分 (新聞關鍵字)：偏多 {positive} 則、偏空 {negative} 則"
+                   f"｜{'、'.join(words[:8])}")
+
+if os.path.exists(Config.SENTIMENT_LEXICON_FILE):
+    load()
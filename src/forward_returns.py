@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+# 訊號發出後的實際報酬 (向量化計算)
+# 以「訊號當天收盤價」為基準，往後第 N 個交易日的收盤漲跌幅 (%)
+# 例如 ret_5d = 5.2 代表訊號出現後 5 個交易日漲了 5.2%；資料還不夠 N 天就是 NaN
+
+HORIZONS = (1, 5, 20)
+
+def column(horizon):
+    return f"ret_{horizon}d"
+
+def trade_dates(df):
+    dates = pd.to_datetime(df['Date'])
+    if dates.dt.tz is not None:
+        # yfinance 給的是台北時區，去掉時區只留日期
+        dates = dates.dt.tz_localize(None)
+    return dates.dt.date
+
+def forward_return_table(bars_by_ticker, horizons=HORIZONS):
+    """
+    bars_by_ticker: {ticker: 股價 DataFrame (要有 Date、Close)}
+    回傳 DataFrame [ticker, trade_date, ret_1d, ret_5d, ...]，每檔每個交易日一列
+    """
+    frames = []
+    for ticker, df in bars_by_ticker.items():
+        if df is None or df.empty:
+            continue
+        close = df['Close'].to_numpy(dtype=float)
+        table = pd.DataFrame({'ticker': ticker, 'trade_date': trade_dates(df).to_numpy()})
+        for h in horizons:
+            fwd = np.full(len(close), np.nan)
+            if len(close) > h:
+                fwd[:-h] = (close[h:] / close[:-h] - 1) * 100
+            table[column(h)] = np.round(fwd, 2)
+        frames.append(table)
+
+    if not frames:
+        return pd.DataFrame(columns=['ticker', 'trade_date'] + [column(h) for h in horizons])
+    return pd.concat(frames, ignore_index=True)
+
+def attach_forward_returns(signals, bars_by_ticker, horizons=HORIZONS):
+    """
+    signals: DataFrame，至少要有 ticker、trade_date (datetime.date)
+    回傳同樣的列，加上各期報酬欄位 (一次 merge，不逐筆查)
+    """
+    table = forward_return_table(bars_by_ticker, horizons)
+    drop = [c for c in table.columns if c in signals.columns and c not in ('ticker', 'trade_date')]
+    return signals.drop(columns=drop).merge(table, on=['ticker', 'trade_date'], how='left')
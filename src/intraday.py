@@ -0,0 +1,321 @@
+import asyncio
+import bisect
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from src import upstream, metrics, trading_calendar
+
+# 盤中監控：每隔 INTRADAY_POLL_SECONDS 抓一次自選股的即時報價，盤中就能發出爆量提醒
+#
+# - 報價來源
+#     TwseMisSource  證交所 MIS 即時報價 (一次查 INTRADAY_MIS_CHUNK 檔，各批併發)
+#     ReplaySource   錄下來的報價檔 (JSONL)，測試 / 重現用；QuoteRecorder 負責錄
+# - 每檔股票一個 TickerState (__slots__，只存幾個數字，不存歷史報價)：
+#     開盤前由日 K (不含今天) 算好昨收、5 日均量、RSI / MACD 的 EMA 狀態，
+#     每筆報價只做一步 EMA 更新 (O(1))，結果跟把今天當成一根 K 線丟進 strategy.calculate_rsi / macd 一樣
+# - 爆量 = 以目前累積量依「盤中量能分布」推估全天量，超過 5 日均量 × Config.VOL_MULTIPLIER 且收紅
+#   (跟 strategy.check_volume_breakout 同一個標準，只是用推估量)
+# - 同一檔同一種提醒一天只發一次 (TickerState.alerted)，推播另外記在 DeliveryLog，重開機也不會重發
+#
+# 報價檔格式 (一行一個 JSON)：
+#   {"baselines": {"2330.TW": [昨收, 5日均量, ema_up, ema_down, ema_fast, ema_slow, ema_signal], ...}}
+#   {"time": "2026-10-19T09:05:00+08:00", "quotes": [["2330.TW", 價, 累積量(股), 開, 高, 低], ...]}
+
+ALERT_BREAKOUT = 1
+
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+_RSI_ALPHA = 1.0 / RSI_PERIOD               # ewm(com=period-1)
+_FAST_ALPHA = 2.0 / (MACD_FAST + 1)         # ewm(span=...)
+_SLOW_ALPHA = 2.0 / (MACD_SLOW + 1)
+_SIGNAL_ALPHA = 2.0 / (MACD_SIGNAL + 1)
+
+# ---------------------------------------------------------------
+#  起始狀態：日 K (不含今天) → 昨收、均量、EMA
+# ---------------------------------------------------------------
+
+def baseline_from_bars(df, day):
+    """ 回傳 [昨收, 5日均量, ema_up, ema_down, ema_fast, ema_slow, ema_signal]；資料不夠回傳 None """
+    from src import forward_returns
+    bars = df[forward_returns.trade_dates(df) < day]
+    if len(bars) < MACD_SLOW + MACD_SIGNAL:
+        return None
+    close = bars['Close'].astype(float)
+    delta = close.diff()
+    ema_up = delta.clip(lower=0).ewm(com=RSI_PERIOD - 1, adjust=False).mean().iloc[-1]
+    ema_down = (-delta.clip(upper=0)).ewm(com=RSI_PERIOD - 1, adjust=False).mean().iloc[-1]
+    ema_fast = close.ewm(span=MACD_FAST, adjust=False).mean()
+    ema_slow = close.ewm(span=MACD_SLOW, adjust=False).mean()
+    ema_signal = (ema_fast - ema_slow).ewm(span=MACD_SIGNAL, adjust=False).mean().iloc[-1]
+    avg_volume = bars['Volume'].iloc[-5:].mean()
+    values = [close.iloc[-1], avg_volume, ema_up, ema_down, ema_fast.iloc[-1], ema_slow.iloc[-1], ema_signal]
+    return [float(v) for v in values]
+
+def load_baseline(ticker, day):
+    """ 預設的起始狀態來源：market_data 的日 K (走快取) """
+    from src import market_data
+    df, _ = market_data.get_stock_data(ticker)
+    return baseline_from_bars(df, day) if df is not None else None
+
+# ---------------------------------------------------------------
+#  盤中量能分布：開盤後 N 分鐘通常已經成交全天的幾成
+# ---------------------------------------------------------------
+
+def volume_fraction(minutes):
+    """ 依 Config.INTRADAY_VOLUME_PROFILE 線性內插，回傳 0 ~ 1 """
+    profile = Config.INTRADAY_VOLUME_PROFILE
+    points = [m for m, _ in profile]
+    i = bisect.bisect_right(points, minutes)
+    if i == 0:
+        return profile[0][1]
+    if i == len(profile):
+        return profile[-1][1]
+    (m0, f0), (m1, f1) = profile[i - 1], profile[i]
+    return f0 + (f1 - f0) * (minutes - m0) / (m1 - m0)
+
+def minutes_since_open(when):
+    open_at, _ = trading_calendar.session_bounds(when.date())
+    return (trading_calendar.to_tw(when) - open_at).total_seconds() / 60
+
+# ---------------------------------------------------------------
+#  每檔股票的盤中狀態
+# ---------------------------------------------------------------
+
+class TickerState:
+    """ 一檔股票的盤中狀態；幾千檔同時追蹤也只佔幾百 KB """
+    __slots__ = ('prev_close', 'avg_volume', 'ema_up', 'ema_down', 'ema_fast', 'ema_slow', 'ema_signal',
+                 'price', 'volume', 'open', 'rsi', 'macd_hist', 'projected', 'alerted')
+
+    def __init__(self, baseline):
+        (self.prev_close, self.avg_volume, self.ema_up, self.ema_down,
+         self.ema_fast, self.ema_slow, self.ema_signal) = baseline
+        self.price = self.prev_close
+        self.volume = 0.0
+        self.open = None
+        self.rsi = None
+        self.macd_hist = None
+        self.projected = 0.0
+        self.alerted = 0
+
+    def update(self, price, volume, open_price, fraction):
+        """ 一筆報價：算出「如果現在收盤」的 RSI / MACD 柱狀與推估全天量 (EMA 狀態本身不動) """
+        self.price = price
+        self.volume = volume
+        if open_price:
+            self.open = open_price
+
+        delta = price - self.prev_close
+        ema_up = self.ema_up + _RSI_ALPHA * (max(delta, 0.0) - self.ema_up)
+        ema_down = self.ema_down + _RSI_ALPHA * (max(-delta, 0.0) - self.ema_down)
+        if ema_down > 0:
+            self.rsi = 100 - 100 / (1 + ema_up / ema_down)
+        else:
+            self.rsi = 100.0 if ema_up > 0 else None
+
+        ema_fast = self.ema_fast + _FAST_ALPHA * (price - self.ema_fast)
+        ema_slow = self.ema_slow + _SLOW_ALPHA * (price - self.ema_slow)
+        macd = ema_fast - ema_slow
+        self.macd_hist = macd - (self.ema_signal + _SIGNAL_ALPHA * (macd - self.ema_signal))
+
+        self.projected = volume / max(fraction, Config.INTRADAY_MIN_VOLUME_FRACTION)
+
+    def is_breakout(self):
+        return (self.avg_volume > 0 and self.open is not None
+                and self.projected > self.avg_volume * Config.VOL_MULTIPLIER
+                and self.price > self.open)
+
+def alert_text(ticker, state, when):
+    code = ticker.replace('.TWO', '').replace('.TW', '')
+    change = (state.price - state.prev_close) / state.prev_close * 100 if state.prev_close else 0
+    rsi = f"{state.rsi:.0f}" if state.rsi is not None else "-"
+    return (f"🚨 {code} 盤中爆量 ({when.strftime('%H:%M')})\n"
+            f"現價 {state.price:g} ({change:+.2f}%)｜預估量 {state.projected / state.avg_volume:.1f} 倍均量\n"
+            f"RSI {rsi}｜MACD 柱 {state.macd_hist:+.2f}")
+
+class IntradayMonitor:
+    """
+    用法：
+        monitor = IntradayMonitor(TwseMisSource())
+        alerts = monitor.poll(tickers)   # [{'ticker', 'kind', 'time', 'text'}, ...]；報價來源沒資料了回傳 None
+    """
+    def __init__(self, source, baseline_loader=None, recorder=None):
+        self.source = source
+        self.recorder = recorder
+        # 報價檔裡有起始狀態就用檔案的 (重播不用連網路)
+        replay_baselines = getattr(source, 'baselines', None)
+        if baseline_loader is None and replay_baselines is not None:
+            baseline_loader = lambda ticker, day: replay_baselines.get(ticker)
+        self.baseline_loader = baseline_loader or load_baseline
+        self.day = None
+        self.states = {}        # ticker → TickerState
+        self._missing = set()   # 今天抓不到起始狀態的股票 (不要每次都重抓)
+
+    def _start_day(self, day):
+        self.day = day
+        self.states.clear()
+        self._missing.clear()
+
+    def _load_states(self, tickers):
+        todo = [t for t in tickers if t not in self.states and t not in self._missing]
+        if not todo:
+            return
+        with ThreadPoolExecutor(max_workers=Config.BATCH_WORKERS) as executor:
+            baselines = list(executor.map(self._safe_baseline, todo))
+        loaded = {}
+        for ticker, baseline in zip(todo, baselines):
+            if baseline is None:
+                self._missing.add(ticker)
+            else:
+                self.states[ticker] = TickerState(baseline)
+                loaded[ticker] = baseline
+        if self.recorder is not None and loaded:
+            self.recorder.write_baselines(loaded)
+
+    def _safe_baseline(self, ticker):
+        try:
+            return self.baseline_loader(ticker, self.day)
+        except Exception as e:
+            print(f"⚠️ [盤中] {ticker} 起始狀態載入失敗: {e}")
+            return None
+
+    def poll(self, tickers):
+        start = time.perf_counter()
+        snapshot = self.source.fetch(tickers)
+        if snapshot is None:
+            return None
+        when, quotes = snapshot
+        when = trading_calendar.to_tw(when)
+        if when.date() != self.day:
+            self._start_day(when.date())
+        # 不再追蹤的股票丟掉，記憶體只跟目前的清單一樣大
+        wanted = set(tickers)
+        for ticker in [t for t in self.states if t not in wanted]:
+            del self.states[ticker]
+        self._load_states(tickers)
+        if self.recorder is not None:
+            self.recorder.write_quotes(when, quotes)
+
+        fraction = volume_fraction(minutes_since_open(when))
+        warmed_up = minutes_since_open(when) >= Config.INTRADAY_MIN_MINUTES
+        alerts = []
+        for ticker, price, volume, open_price, _high, _low in quotes:
+            state = self.states.get(ticker)
+            if state is None or not price:
+                continue
+            state.update(price, volume, open_price, fraction)
+            if warmed_up and not state.alerted & ALERT_BREAKOUT and state.is_breakout():
+                state.alerted |= ALERT_BREAKOUT
+                alerts.append({'ticker': ticker, 'kind': 'breakout', 'time': when,
+                               'text': alert_text(ticker, state, when)})
+
+        metrics.inc('intraday_quotes_total', len(quotes))
+        if alerts:
+            metrics.inc('intraday_alerts_total', len(alerts), kind='breakout')
+        metrics.observe('stage_latency_seconds', time.perf_counter() - start, stage='intraday_poll')
+        return alerts
+
+# ---------------------------------------------------------------
+#  報價來源
+# ---------------------------------------------------------------
+
+def _mis_channel(ticker):
+    """ 2330.TW → tse_2330.tw，6488.TWO → otc_6488.tw """
+    code = ticker.replace('.TWO', '').replace('.TW', '')
+    market = 'otc' if ticker.endswith('.TWO') else 'tse'
+    return f"{market}_{code}.tw"
+
+def _number(text):
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+class TwseMisSource:
+    """ 證交所 MIS 即時報價 (z = 最近成交價、v = 累積成交量 (張)、o/h/l = 開高低) """
+    def __init__(self, url=None, chunk=None):
+        self.url = url or Config.TWSE_MIS_URL
+        self.chunk = chunk or Config.INTRADAY_MIS_CHUNK
+        self._last_price = {}   # 這一輪剛好沒有成交 (z = '-') 時沿用上一個成交價
+
+    async def _fetch_all(self, chunks):
+        calls = [upstream.fetch_json('twse_mis', self.url, params={
+            'ex_ch': '|'.join(_mis_channel(t) for t in chunk), 'json': '1', 'delay': '0'})
+            for chunk in chunks]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    def fetch(self, tickers):
+        chunks = [tickers[i:i + self.chunk] for i in range(0, len(tickers), self.chunk)]
+        if not chunks:
+            return trading_calendar.now_tw(), []
+        by_channel = {_mis_channel(t): t for t in tickers}
+        responses = upstream.run_coroutine(self._fetch_all(chunks), upstream.call_budget('twse_mis'),
+                                           provider='twse_mis')
+        quotes = []
+        for response in responses:
+            if isinstance(response, Exception):
+                print(f"⚠️ [盤中] 報價抓取失敗: {response}")
+                continue
+            for item in response.get('msgArray', []):
+                ticker = by_channel.get(f"{item.get('ex')}_{item.get('c')}.tw")
+                if ticker is None:
+                    continue
+                price = _number(item.get('z')) or self._last_price.get(ticker)
+                volume = _number(item.get('v'))
+                if price is None or volume is None:
+                    continue
+                self._last_price[ticker] = price
+                quotes.append((ticker, price, volume * 1000, _number(item.get('o')),
+                               _number(item.get('h')), _number(item.get('l'))))
+        return trading_calendar.now_tw(), quotes
+
+class ReplaySource:
+    """ 重播錄好的報價檔：每次 fetch() 回傳下一個時間點的報價，播完回傳 None (邊讀邊播，不整檔載入) """
+    def __init__(self, path):
+        self.path = path
+        self.baselines = {}
+        self._file = open(path, encoding='utf-8')
+        self._pending = None
+        self._read_ahead()
+
+    def _read_ahead(self):
+        """ 先讀完下一筆報價之前的起始狀態 (起始狀態要比報價早到) """
+        self._pending = None
+        for line in self._file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'baselines' in record:
+                self.baselines.update(record['baselines'])
+                continue
+            self._pending = record
+            return
+
+    def fetch(self, tickers):
+        record = self._pending
+        if record is None:
+            self._file.close()
+            return None
+        self._read_ahead()
+        wanted = set(tickers)
+        when = datetime.datetime.fromisoformat(record['time'])
+        return when, [tuple(q) for q in record['quotes'] if q[0] in wanted]
+
+class QuoteRecorder:
+    """ 把盤中抓到的報價 (含起始狀態) 錄成 ReplaySource 讀得懂的檔案 """
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write_baselines(self, baselines):
+        self._file.write(json.dumps({'baselines': baselines}) + "\n")
+
+    def write_quotes(self, when, quotes):
+        self._file.write(json.dumps({'time': when.isoformat(), 'quotes': [list(q) for q in quotes]}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
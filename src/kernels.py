@@ -0,0 +1,341 @@
+import os
+import numpy as np
+from config import Config
+
+# 數值運算核心：RSI / MACD (指數移動平均) 與回測的停損停利掃描
+# 輸入都是 2-D 陣列 (股票 × 日期)，一次算完整個市場；單一股票就是 1 × N
+#
+# 三種實作 (Config.KERNEL_BACKEND 或環境變數 KERNEL_BACKEND，執行中也可以 set_backend() 切換)：
+#   'numba'  : 有安裝 numba 時編譯成機器碼，每檔股票單次掃描就算完 RSI + MACD
+#   'numpy'  : 沒有 numba 的退路，沿著日期走、每一步對「所有股票」做向量運算 (股票越多越划算)
+#   'pandas' : 不用這個模組，走原本 strategy.py / backtest.py 的寫法 (對照組)
+#   'auto'   : 有 numba 用 numba，沒有用 numpy
+#
+# 指數移動平均完全照 pandas ewm(adjust=False) 的算法 (含中間缺值的權重)，
+# 結果跟原本的 calculate_rsi / calculate_macd 逐位元相同，見 bench/bench_kernels.py --check
+
+BACKENDS = ('auto', 'numba', 'numpy', 'pandas')
+
+_backend = None
+_numba_kernels = None
+
+# 出場原因代碼 (scan_exits 回傳)
+EXIT_HOLD = 0        # 持有到期
+EXIT_STOP = 1        # 停損
+EXIT_TAKE = 2        # 停利
+
+def numba_available():
+    try:
+        import numba
+        return True
+    except ImportError:
+        return False
+
+def set_backend(name):
+    """ 切換實作；'auto' 依有沒有安裝 numba 決定 """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"未知的 KERNEL_BACKEND: {name} (可用 {', '.join(BACKENDS)})")
+    if name == 'auto':
+        name = 'numba' if numba_available() else 'numpy'
+    elif name == 'numba' and not numba_available():
+        print("⚠️ [運算核心] 沒有安裝 numba，改用 numpy")
+        name = 'numpy'
+    _backend = name
+    return name
+
+def backend():
+    if _backend is None:
+        set_backend(os.getenv('KERNEL_BACKEND', Config.KERNEL_BACKEND))
+    return _backend
+
+def enabled():
+    """ 回測 / 指標要不要走這個模組 ('pandas' 代表用原本的寫法) """
+    return backend() != 'pandas'
+
+def use_for_series():
+    """
+    單一股票 (1 × N) 的 RSI / MACD 要不要走這裡：只有 numba 比 pandas 快
+    numpy 版每個日期一次向量運算，股票只有一檔時反而比 pandas 內建的 C 迴圈慢
+    """
+    return backend() == 'numba'
+
+def _as_2d(values):
+    arr = np.asarray(values, dtype=np.float64)
+    if arr.ndim == 1:
+        arr = arr[None, :]
+    return np.ascontiguousarray(arr)
+
+def _span_alpha(span):
+    return 2.0 / (1.0 + span)
+
+def _com_alpha(com):
+    return 1.0 / (1.0 + com)
+
+# ---------------------------------------------------------------
+#  NumPy 版：沿著日期走，每一步同時更新所有股票
+# ---------------------------------------------------------------
+
+def _ewm_numpy(x, alpha):
+    """ pandas ewm(adjust=False, ignore_na=False).mean() 的逐列版本 """
+    n_rows, n_cols = x.shape
+    out = np.empty_like(x)
+    if n_cols == 0:
+        return out
+    decay = 1.0 - alpha
+    weighted = x[:, 0].copy()
+    old_wt = np.ones(n_rows)
+    out[:, 0] = weighted
+    for t in range(1, n_cols):
+        cur = x[:, t]
+        is_obs = cur == cur
+        started = weighted == weighted
+        old_wt = np.where(started, old_wt * decay, old_wt)
+        update = started & is_obs & (weighted != cur)
+        blended = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(update, blended, weighted)
+        old_wt = np.where(started & is_obs, 1.0, old_wt)
+        weighted = np.where(~started & is_obs, cur, weighted)
+        out[:, t] = weighted
+    return out
+
+def _diff(x):
+    delta = np.full_like(x, np.nan)
+    delta[:, 1:] = x[:, 1:] - x[:, :-1]
+    return delta
+
+def _rsi_from_ewm(ema_up, ema_down):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = ema_up / ema_down
+        return 100 - (100 / (1 + rs))
+
+def _rsi_numpy(close, period):
+    delta = _diff(close)
+    up = np.where(delta > 0, delta, np.where(delta == delta, 0.0, np.nan))
+    down = -1 * np.where(delta < 0, delta, np.where(delta == delta, 0.0, np.nan))
+    alpha = _com_alpha(period - 1)
+    return _rsi_from_ewm(_ewm_numpy(up, alpha), _ewm_numpy(down, alpha))
+
+def _macd_numpy(close, fast, slow, signal):
+    macd_line = _ewm_numpy(close, _span_alpha(fast)) - _ewm_numpy(close, _span_alpha(slow))
+    signal_line = _ewm_numpy(macd_line, _span_alpha(signal))
+    return macd_line, signal_line, macd_line - signal_line
+
+def _exits_numpy(high, low, close, rows, entries, stop_loss_pct, take_profit_pct, holding_days):
+    offsets = np.arange(1, holding_days + 1)
+    window = entries[:, None] + offsets
+    buy_price = close[rows, entries]
+    stop_price = buy_price * (1 - stop_loss_pct)
+    take_price = buy_price * (1 + take_profit_pct)
+
+    stop_hit = low[rows[:, None], window] <= stop_price[:, None]
+    take_hit = high[rows[:, None], window] >= take_price[:, None]
+    first_stop = np.where(stop_hit.any(axis=1), stop_hit.argmax(axis=1), holding_days)
+    first_take = np.where(take_hit.any(axis=1), take_hit.argmax(axis=1), holding_days)
+
+    # 同一天同時碰到：原本的寫法先檢查停損
+    is_stop = (first_stop < holding_days) & (first_stop <= first_take)
+    is_take = ~is_stop & (first_take < holding_days)
+    reason = np.where(is_stop, EXIT_STOP, np.where(is_take, EXIT_TAKE, EXIT_HOLD))
+    exit_offset = np.where(is_stop, first_stop + 1, np.where(is_take, first_take + 1, holding_days))
+    exit_idx = entries + exit_offset
+
+    hold_price = close[rows, entries + holding_days]
+    sell_price = np.where(is_stop, stop_price, np.where(is_take, take_price, hold_price))
+    returns = np.where(is_stop, -stop_loss_pct, np.where(is_take, take_profit_pct,
+                                                         (hold_price - buy_price) / buy_price))
+    return exit_idx, sell_price, returns, reason
+
+# ---------------------------------------------------------------
+#  Numba 版：一檔股票一個迴圈，RSI + MACD 五條 EMA 同一次掃描算完
+#  (下面是純 Python 寫法，第一次用到才交給 numba 編譯)
+# ---------------------------------------------------------------
+
+def _ewm_step(weighted, old_wt, cur, alpha):
+    """ 跟 _ewm_numpy 同一套規則的單步更新，回傳 (weighted, old_wt) """
+    if weighted == weighted:
+        old_wt *= 1.0 - alpha
+        if cur == cur:
+            if weighted != cur:
+                weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+            old_wt = 1.0
+    elif cur == cur:
+        weighted = cur
+    return weighted, old_wt
+
+def _indicators_loop(close, rsi_alpha, fast_alpha, slow_alpha, signal_alpha,
+                     rsi_out, macd_out, signal_out):
+    n_rows, n_cols = close.shape
+    for r in range(n_rows):
+        up = np.nan
+        up_wt = 1.0
+        down = np.nan
+        down_wt = 1.0
+        fast = np.nan
+        fast_wt = 1.0
+        slow = np.nan
+        slow_wt = 1.0
+        sig = np.nan
+        sig_wt = 1.0
+        for t in range(n_cols):
+            price = close[r, t]
+            if t == 0:
+                delta = np.nan
+            else:
+                delta = price - close[r, t - 1]
+            if delta == delta:
+                gain = delta if delta > 0 else 0.0
+                loss = -1 * (delta if delta < 0 else 0.0)
+            else:
+                gain = np.nan
+                loss = np.nan
+            if t == 0:
+                up, down = gain, loss
+            else:
+                up, up_wt = _ewm_step(up, up_wt, gain, rsi_alpha)
+                down, down_wt = _ewm_step(down, down_wt, loss, rsi_alpha)
+            rsi_out[r, t] = 100 - (100 / (1 + up / down)) if down != 0 else (
+                np.nan if up != up or up == 0 else 100.0)
+
+            if t == 0:
+                fast, slow = price, price
+            else:
+                fast, fast_wt = _ewm_step(fast, fast_wt, price, fast_alpha)
+                slow, slow_wt = _ewm_step(slow, slow_wt, price, slow_alpha)
+            line = fast - slow
+            if t == 0:
+                sig = line
+            else:
+                sig, sig_wt = _ewm_step(sig, sig_wt, line, signal_alpha)
+            macd_out[r, t] = line
+            signal_out[r, t] = sig
+
+def _exits_loop(high, low, close, rows, entries, stop_loss_pct, take_profit_pct, holding_days,
+                exit_idx, sell_price, returns, reason):
+    for k in range(entries.shape[0]):
+        r = rows[k]
+        i = entries[k]
+        buy_price = close[r, i]
+        stop_price = buy_price * (1 - stop_loss_pct)
+        take_price = buy_price * (1 + take_profit_pct)
+        exit_idx[k] = i + holding_days
+        sell_price[k] = close[r, i + holding_days]
+        returns[k] = (sell_price[k] - buy_price) / buy_price
+        reason[k] = 0
+        for j in range(1, holding_days + 1):
+            if low[r, i + j] <= stop_price:
+                exit_idx[k] = i + j
+                sell_price[k] = stop_price
+                returns[k] = -stop_loss_pct
+                reason[k] = 1
+                break
+            if high[r, i + j] >= take_price:
+                exit_idx[k] = i + j
+                sell_price[k] = take_price
+                returns[k] = take_profit_pct
+                reason[k] = 2
+                break
+
+def _select_entries_loop(signal, start, end, holding_days, rows_out, entries_out):
+    count = 0
+    for r in range(signal.shape[0]):
+        i = start
+        while i < end:
+            if signal[r, i]:
+                rows_out[count] = r
+                entries_out[count] = i
+                count += 1
+                i += holding_days
+            else:
+                i += 1
+    return count
+
+def _numba():
+    """ 第一次用到才 import numba 並編譯 (cache=True：編譯結果存檔，下次開機直接用) """
+    global _numba_kernels
+    if _numba_kernels is None:
+        import numba
+        global _ewm_step
+        _ewm_step = numba.njit(cache=True)(_ewm_step)
+        _numba_kernels = {
+            'indicators': numba.njit(cache=True)(_indicators_loop),
+            'exits': numba.njit(cache=True)(_exits_loop),
+            'entries': numba.njit(cache=True)(_select_entries_loop),
+        }
+    return _numba_kernels
+
+# ---------------------------------------------------------------
+#  對外介面
+# ---------------------------------------------------------------
+
+def indicators(close, period=14, fast=12, slow=26, signal=9):
+    """
+    一次算 RSI 與 MACD：close 是 (股票 × 日期) 收盤價，回傳同形狀的
+    {'rsi', 'macd', 'signal', 'hist'}；股票上市較晚的前面補 NaN 即可
+    """
+    close = _as_2d(close)
+    if backend() == 'numba':
+        rsi_out = np.empty_like(close)
+        macd_out = np.empty_like(close)
+        signal_out = np.empty_like(close)
+        _numba()['indicators'](close, _com_alpha(period - 1), _span_alpha(fast), _span_alpha(slow),
+                               _span_alpha(signal), rsi_out, macd_out, signal_out)
+        return {'rsi': rsi_out, 'macd': macd_out, 'signal': signal_out, 'hist': macd_out - signal_out}
+
+    macd_line, signal_line, hist = _macd_numpy(close, fast, slow, signal)
+    return {'rsi': _rsi_numpy(close, period), 'macd': macd_line, 'signal': signal_line, 'hist': hist}
+
+def rsi(close, period=14):
+    if backend() == 'numba':
+        return indicators(close, period=period)['rsi']
+    return _rsi_numpy(_as_2d(close), period)
+
+def macd(close, fast=12, slow=26, signal=9):
+    if backend() == 'numba':
+        result = indicators(close, fast=fast, slow=slow, signal=signal)
+        return result['macd'], result['signal'], result['hist']
+    return _macd_numpy(_as_2d(close), fast, slow, signal)
+
+def select_entries(signal, start, end, holding_days):
+    """
+    回測的進場點：每檔股票從 start 走到 end (不含)，遇到訊號就進場並跳過 holding_days 天
+    signal: (股票 × 日期) bool；回傳 (rows, entries) 兩個 int 陣列
+    """
+    signal = np.ascontiguousarray(np.asarray(signal, dtype=np.bool_).reshape(-1, np.shape(signal)[-1]))
+    capacity = max(signal[:, start:end].sum(), 0)
+    rows = np.empty(capacity, dtype=np.int64)
+    entries = np.empty(capacity, dtype=np.int64)
+    if backend() == 'numba':
+        count = _numba()['entries'](signal, start, end, holding_days, rows, entries)
+    else:
+        # 候選點通常很少，逐一挑就好；主要成本在 scan_exits
+        count = 0
+        for r in range(signal.shape[0]):
+            next_allowed = start
+            for i in np.flatnonzero(signal[r, start:end]) + start:
+                if i >= next_allowed:
+                    rows[count] = r
+                    entries[count] = i
+                    count += 1
+                    next_allowed = i + holding_days
+    return rows[:count], entries[:count]
+
+def scan_exits(high, low, close, rows, entries, stop_loss_pct, take_profit_pct, holding_days):
+    """
+    停損停利掃描：每筆交易在 entries 當天收盤買進，之後 holding_days 天內
+    先碰到停損 (最低價) 就停損、碰到停利 (最高價) 就停利，都沒有就到期用收盤價賣出
+    回傳 (exit_idx, sell_price, returns, reason)，reason 見 EXIT_*
+    """
+    high, low, close = _as_2d(high), _as_2d(low), _as_2d(close)
+    rows = np.asarray(rows, dtype=np.int64)
+    entries = np.asarray(entries, dtype=np.int64)
+    if backend() == 'numba':
+        n = entries.shape[0]
+        exit_idx = np.empty(n, dtype=np.int64)
+        sell_price = np.empty(n)
+        returns = np.empty(n)
+        reason = np.empty(n, dtype=np.int64)
+        _numba()['exits'](high, low, close, rows, entries, stop_loss_pct, take_profit_pct, holding_days,
+                          exit_idx, sell_price, returns, reason)
+        return exit_idx, sell_price, returns, reason
+    return _exits_numpy(high, low, close, rows, entries, stop_loss_pct, take_profit_pct, holding_days)
@@ -0,0 +1,77 @@
+import importlib
+import threading
+import time
+from src import metrics
+
+# 延遲載入：sklearn、plotly、yfinance、Gemini SDK、LINE SDK 這些大套件
+# 等到真的有路由 / 階段用到才 import，worker 開機只要載入 Flask 本身
+#
+# 用法：
+#   go = lazy.lazy_import('plotly.graph_objects')   # 第一次用 go.Figure 才 import
+#   line_bot_api = lazy.LazyObject(lambda: LineBotApi(token))
+
+_lock = threading.RLock()
+
+def _timed_import(name):
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    seconds = time.perf_counter() - start
+    metrics.set_gauge('lazy_import_seconds', round(seconds, 4), module=name)
+    if seconds >= 0.05:
+        print(f"📦 [延遲載入] {name} ({seconds * 1000:.0f} ms)")
+    return module
+
+class LazyModule:
+    """ 模組代理：第一次取屬性時才真的 import，之後直接轉給真正的模組 """
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with _lock:
+                module = self._module
+                if module is None:
+                    module = _timed_import(self._name)
+                    object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        # 測試 / 基準測試替換模組內的函式 (例如 genai.GenerativeModel) 要改到真正的模組上
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_import(name):
+    return LazyModule(name)
+
+def is_loaded(proxy):
+    return proxy._module is not None
+
+class LazyObject:
+    """ 物件代理：第一次用到才呼叫 factory() 建立 (例如 LINE SDK 的 client / handler) """
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_obj', None)
+
+    def _get(self):
+        obj = self._obj
+        if obj is None:
+            with _lock:
+                obj = self._obj
+                if obj is None:
+                    obj = self._factory()
+                    object.__setattr__(self, '_obj', obj)
+        return obj
+
+    def __getattr__(self, attr):
+        return getattr(self._get(), attr)
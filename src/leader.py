@@ -0,0 +1,83 @@
+import contextlib
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 本機開發
+    fcntl = None
+    import msvcrt
+
+# 拿到鎖之後檔案要一直開著，process 結束時作業系統會自動釋放
+_lock_file = None
+
+def try_acquire(path):
+    """
+    嘗試拿「排程主控權」檔案鎖 (不會卡住)
+    gunicorn 多個 worker 同時啟動時，只有一個拿得到，其他回傳 False
+    """
+    global _lock_file
+    if _lock_file is not None:
+        return True
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, 'a+')
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return False
+
+    # 寫入 PID 方便除錯 (看是哪個 worker 在跑排程)
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    _lock_file = f
+    return True
+
+def is_leader():
+    return _lock_file is not None
+
+def run_when_leader(path, on_elected, retry_seconds=60):
+    """
+    拿到鎖就立刻執行 on_elected()；拿不到就每 retry_seconds 秒再試一次
+    (原本的主控 worker 掛掉被重開時，其他 worker 可以接手)
+    """
+    if try_acquire(path):
+        print(f"👑 [排程] PID {os.getpid()} 取得主控權")
+        on_elected()
+        return
+
+    def retry():
+        run_when_leader(path, on_elected, retry_seconds)
+
+    timer = threading.Timer(retry_seconds, retry)
+    timer.daemon = True
+    timer.start()
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    跨 process 的互斥鎖 (會等到拿到為止)：多個 worker 要改同一個檔案時用
+    例：with leader.file_lock(index_path + '.lock'): 讀 → 改 → 寫
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
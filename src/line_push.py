@@ -0,0 +1,149 @@
+import asyncio
+import random
+import time
+import uuid
+import aiohttp
+from config import Config
+from src import metrics, upstream
+
+# LINE 排程推播 (multicast 分批送)
+# - 內容相同的使用者合成一組，每組切成最多 LINE_MULTICAST_LIMIT (500) 人一批
+# - 各批次併發送出 (最多 LINE_PUSH_CONCURRENCY 批同時在路上)，總耗時跟「批次數」成正比，不是使用者數
+# - 429：依 Retry-After 讓「所有批次」一起暫停，不要越打越多
+# - 5xx / 連線錯誤：只重送失敗的那一批，帶同一個 X-Line-Retry-Key，LINE 會自動去重
+# - 其他 4xx：請求本身有問題 (例如訊息格式)，不重試，直接記失敗
+#
+# 用法：
+#   groups = [([message_dict], [user_id, ...]), ...]
+#   results = line_push.deliver(groups)   # [BatchResult, ...]
+#
+# 本地測試：python -m bench.fake_line_api 起一個假的 LINE API，
+# 再設定 LINE_API_ENDPOINT=http://127.0.0.1:8765
+
+MULTICAST_PATH = "/v2/bot/message/multicast"
+
+class Batch:
+    def __init__(self, messages, to):
+        self.messages = messages
+        self.to = to
+        # 同一批重送時沿用同一個 key，LINE 收過就回 409，不會重複推播
+        self.retry_key = str(uuid.uuid4())
+
+class BatchResult:
+    def __init__(self, batch, status, attempts, error=None, request_id=None):
+        self.batch = batch
+        self.status = status          # 'sent' / 'failed'
+        self.attempts = attempts
+        self.error = error
+        self.request_id = request_id
+
+    @property
+    def ok(self):
+        return self.status == 'sent'
+
+def text_message(text):
+    return {"type": "text", "text": text}
+
+def plan_batches(groups, limit=None):
+    """ groups: [(messages, [user_ids])]，切成每批最多 limit 人 """
+    limit = limit or Config.LINE_MULTICAST_LIMIT
+    batches = []
+    for messages, user_ids in groups:
+        user_ids = list(dict.fromkeys(user_ids))  # 同一個人不要收兩次
+        for i in range(0, len(user_ids), limit):
+            batches.append(Batch(messages, user_ids[i:i + limit]))
+    return batches
+
+class _RateLimit:
+    """ 整次推播共用：任何一批收到 429，所有批次都等到 Retry-After 之後再送 """
+    def __init__(self):
+        self.until = 0.0
+
+    def pause(self, seconds):
+        self.until = max(self.until, time.monotonic() + seconds)
+
+    async def wait(self):
+        delay = self.until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def _retry_after(resp, attempt):
+    try:
+        return max(float(resp.headers.get('Retry-After')), 0.0)
+    except (TypeError, ValueError):
+        return _backoff(attempt)
+
+def _backoff(attempt):
+    cap = min(Config.LINE_PUSH_BACKOFF_MAX, Config.LINE_PUSH_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, cap)
+
+async def _send_batch(session, batch, token, semaphore, rate_limit):
+    url = Config.LINE_API_ENDPOINT.rstrip('/') + MULTICAST_PATH
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "X-Line-Retry-Key": batch.retry_key,
+    }
+    payload = {"to": batch.to, "messages": batch.messages}
+    timeout = aiohttp.ClientTimeout(total=Config.LINE_PUSH_TIMEOUT)
+
+    error = None
+    attempts = 0
+    for attempt in range(Config.LINE_PUSH_RETRIES + 1):
+        attempts = attempt + 1
+        async with semaphore:
+            await rate_limit.wait()
+            start = time.perf_counter()
+            try:
+                async with session.post(url, json=payload, headers=headers, timeout=timeout) as resp:
+                    request_id = resp.headers.get('X-Line-Request-Id')
+                    metrics.observe('upstream_latency_seconds', time.perf_counter() - start, provider='line')
+                    # 409 + 同一個 retry key：上一次其實已經送達
+                    if resp.status == 200 or resp.status == 409:
+                        return BatchResult(batch, 'sent', attempts, request_id=request_id)
+                    body = (await resp.text())[:200]
+                    error = f"HTTP {resp.status} {body}"
+                    if resp.status == 429:
+                        wait = _retry_after(resp, attempt)
+                        rate_limit.pause(wait)
+                        metrics.inc('line_push_rate_limited_total')
+                        print(f"⏳ [LINE] 觸發流量限制，全部批次暫停 {wait:.1f} 秒")
+                        continue
+                    if resp.status < 500:
+                        return BatchResult(batch, 'failed', attempts, error, request_id)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+        metrics.inc('upstream_retries_total', provider='line')
+        await asyncio.sleep(_backoff(attempt))
+
+    metrics.inc('upstream_errors_total', provider='line')
+    return BatchResult(batch, 'failed', attempts, error)
+
+async def _deliver(batches, token):
+    session = await upstream.client_session()
+    semaphore = asyncio.Semaphore(Config.LINE_PUSH_CONCURRENCY)
+    rate_limit = _RateLimit()
+    return await asyncio.gather(*[_send_batch(session, b, token, semaphore, rate_limit) for b in batches])
+
+def deliver(groups, token=None):
+    """
+    同步呼叫：把 groups 切批後併發送出，回傳每一批的 BatchResult
+    (失敗的批次已經在裡面重試過了；呼叫端只要記錄結果)
+    """
+    batches = plan_batches(groups)
+    if not batches:
+        return []
+    token = token or Config.LINE_CHANNEL_ACCESS_TOKEN
+
+    start = time.perf_counter()
+    # 最壞情況：每一輪併發都把重試與退避用完
+    rounds = -(-len(batches) // Config.LINE_PUSH_CONCURRENCY)
+    budget = rounds * (Config.LINE_PUSH_RETRIES + 1) * (Config.LINE_PUSH_TIMEOUT + Config.LINE_PUSH_BACKOFF_MAX) + 30
+    results = upstream.run_coroutine(_deliver(batches, token), budget, provider='line')
+
+    for result in results:
+        metrics.inc('line_push_recipients_total', len(result.batch.to), status=result.status)
+    sent = sum(len(r.batch.to) for r in results if r.ok)
+    total = sum(len(b.to) for b in batches)
+    print(f"📨 [LINE] {len(batches)} 批 / {total} 人，成功 {sent} 人，耗時 {time.perf_counter() - start:.1f} 秒")
+    return results
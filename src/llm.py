@@ -0,0 +1,282 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from flask import current_app, has_app_context
+from config import Config
+from src import cache, metrics, upstream, lazy
+
+# Gemini SDK 載入要半秒以上，第一次建立模型才載入
+genai = lazy.lazy_import('google.generativeai')
+
+# Gemini 呼叫的中央調度器
+# - 令牌桶 (token bucket)：每分鐘請求數 (RPM) 與 token 數 (TPM) 兩種額度
+# - 優先順序：LINE / 網頁互動 (INTERACTIVE) 永遠排在預熱、早報 (BACKGROUND) 前面
+# - 最多等 max_wait 秒；等不到就丟 LLMFallback (帶著這檔股票上一次的 AI 結果)，沒有舊結果才丟 LLMBusyError
+# - 模型連線池：每個 process 只 configure 一次，同樣 (模型, 參數) 的 GenerativeModel 重複使用
+
+INTERACTIVE = 0
+BACKGROUND = 1
+_PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+class LLMBusyError(Exception):
+    """ 額度用完且在等待時間內等不到，也沒有舊結果可以用 """
+
+class LLMFallback(Exception):
+    """ 額度不足 / 斷路中，拿這檔股票上一次的結果頂替；text 是舊的回應，不能當成這次的新結果存起來 """
+    def __init__(self, text):
+        super().__init__("AI 額度不足，使用上一次的結果")
+        self.text = text
+
+class TokenBucket:
+    """ 容量 capacity，每秒補 rate 個；可以透支 (實際用量比預估多時) """
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, amount):
+        self._refill()
+        return self.tokens >= amount
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+    def seconds_until(self, amount):
+        """ 還要等幾秒才會有 amount 個 """
+        self._refill()
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def drain(self):
+        self.tokens = min(self.tokens, 0)
+        self.updated = time.monotonic()
+
+class Dispatcher:
+    def __init__(self, rpm, tpm):
+        # gunicorn 多個 worker 各有一個調度器，額度平均分給每個 worker
+        workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+        rpm = max(1, rpm // workers)
+        tpm = max(1, tpm // workers)
+        self.requests = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+
+    def _update_depth(self):
+        for priority, name in _PRIORITY_NAMES.items():
+            depth = sum(1 for p, _ in self._queue if p == priority)
+            metrics.set_gauge('llm_queue_depth', depth, priority=name)
+
+    def acquire(self, priority, est_tokens, max_wait):
+        """ 排隊拿額度，輪到自己且兩種額度都夠才放行；超過 max_wait 回傳 False """
+        # 單次請求比每分鐘額度還大時也要放得進去，不然會永遠等不到
+        est_tokens = min(est_tokens, self.tokens.capacity)
+        ticket = (priority, next(self._seq))
+        deadline = time.monotonic() + max_wait
+        start = time.monotonic()
+
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._update_depth()
+            try:
+                while True:
+                    if self._queue[0] == ticket and self.requests.available(1) and self.tokens.available(est_tokens):
+                        self.requests.take(1)
+                        self.tokens.take(est_tokens)
+                        metrics.observe('llm_wait_seconds', time.monotonic() - start, priority=_PRIORITY_NAMES[priority])
+                        return True
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    refill = max(self.requests.seconds_until(1), self.tokens.seconds_until(est_tokens))
+                    self._cond.wait(min(remaining, max(refill, 0.05)))
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._update_depth()
+                self._cond.notify_all()
+
+    def settle(self, est_tokens, actual_tokens):
+        """ 回報實際用量，多用的從額度扣掉、少用的還回去 """
+        with self._cond:
+            self.tokens.take(actual_tokens - min(est_tokens, self.tokens.capacity))
+            self._cond.notify_all()
+
+    def penalize(self):
+        """ 被 Gemini 回 429 (額度用完)：把桶子清空，大家一起等補充 """
+        with self._cond:
+            self.requests.drain()
+            self.tokens.drain()
+            self._cond.notify_all()
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(Config.GEMINI_RPM, Config.GEMINI_TPM)
+        return _dispatcher
+
+def estimate_tokens(prompt):
+    """ 粗估 token：中文大約一字一個，再加上預期輸出長度 """
+    return len(prompt) + Config.GEMINI_EST_OUTPUT_TOKENS
+
+def _is_quota_error(error):
+    original = error.__cause__ or error
+    text = str(original)
+    return type(original).__name__ in ('ResourceExhausted', 'TooManyRequests') or '429' in text or 'quota' in text.lower()
+
+def _fallback(fallback_key, priority):
+    if fallback_key:
+        hit, text = cache.get('llm_fallback', fallback_key)
+        if hit:
+            metrics.inc('llm_fallback_total', priority=_PRIORITY_NAMES[priority])
+            print(f"♻️ [LLM] 額度不足，改用 {fallback_key} 上一次的結果")
+            raise LLMFallback(text)
+    raise LLMBusyError("AI 額度已滿，請稍後再試")
+
+def submit(func, prompt, priority=INTERACTIVE, fallback_key=None, max_wait=None):
+    """
+    透過調度器呼叫 Gemini，回傳回應文字
+    func        : 實際呼叫 (回傳 generate_content 的 response)
+    fallback_key: 額度不足時丟 LLMFallback，帶著這個 key 上一次的成功結果 (例如 "sentiment:2330")
+    """
+    if max_wait is None:
+        max_wait = Config.LLM_MAX_WAIT[_PRIORITY_NAMES[priority]]
+    d = dispatcher()
+    est_tokens = estimate_tokens(prompt)
+    deadline = time.monotonic() + max_wait
+    attempts = 0
+    settings = upstream.policy('gemini')
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not d.acquire(priority, est_tokens, remaining):
+            metrics.inc('llm_rejected_total', priority=_PRIORITY_NAMES[priority])
+            return _fallback(fallback_key, priority)
+
+        try:
+            response = upstream.call('gemini', func)
+        except upstream.CircuitOpenError:
+            return _fallback(fallback_key, priority)
+        except upstream.UpstreamError as e:
+            attempts += 1
+            if attempts > Config.LLM_MAX_RETRIES:
+                raise
+            if _is_quota_error(e):
+                # 額度被打爆：清空桶子，在剩下的等待時間內重新排隊 (不用固定 sleep)
+                metrics.inc('llm_quota_errors_total')
+                d.penalize()
+            else:
+                # 其他錯誤 (Gemini 掛掉、逾時)：退避一下再重試，不要連續打
+                time.sleep(max(0, min(upstream.backoff(attempts, settings), deadline - time.monotonic())))
+            continue
+
+        usage = getattr(response, 'usage_metadata', None)
+        actual = getattr(usage, 'total_token_count', None)
+        if actual:
+            d.settle(est_tokens, actual)
+
+        text = response.text.strip()
+        if fallback_key:
+            cache.put('llm_fallback', fallback_key, text)
+        return text
+
+# ---------------------------------------------------------------
+#  模型連線池
+# ---------------------------------------------------------------
+
+_models = {}
+_models_lock = threading.Lock()
+_configured_key = None
+
+def api_key():
+    """ 優先讀 Flask 設定，沒有 app context (批次腳本) 就讀 Config / 環境變數 """
+    if has_app_context() and current_app.config.get('GOOGLE_API_KEY'):
+        return current_app.config.get('GOOGLE_API_KEY')
+    return Config.GOOGLE_API_KEY or os.getenv('GOOGLE_API_KEY')
+
+def default_model_name():
+    if has_app_context():
+        return current_app.config.get('GEMINI_MODEL_NAME')
+    return Config.GEMINI_MODEL_NAME
+
+def get_model(model_name=None, generation_config=None):
+    """ 取得 (或建立) 共用的 GenerativeModel，key = (模型名稱, 生成參數) """
+    global _configured_key
+    model_name = model_name or default_model_name()
+    key = (model_name, json.dumps(generation_config or {}, sort_keys=True))
+
+    with _models_lock:
+        if _configured_key != api_key():
+            # 第一次使用 (或 API Key 換了) 才 configure，順便清掉舊的模型
+            genai.configure(api_key=api_key())
+            _configured_key = api_key()
+            _models.clear()
+        if key not in _models:
+            _models[key] = genai.GenerativeModel(model_name, generation_config=generation_config)
+        return _models[key]
+
+def reset_models():
+    """ 清空連線池 (下次使用重新 configure)，測試替換 SDK 時用 """
+    global _configured_key
+    with _models_lock:
+        _models.clear()
+        _configured_key = None
+
+def generate(prompt, model_name=None, generation_config=None, priority=INTERACTIVE, fallback_key=None):
+    """ 用共用模型產生文字 (經過調度器排隊) """
+    model = get_model(model_name, generation_config)
+    request_options = {'timeout': upstream.timeout('gemini')}
+    return submit(lambda: model.generate_content(prompt, request_options=request_options),
+                  prompt, priority, fallback_key)
+
+def stream(prompt, model_name=None, generation_config=None, priority=INTERACTIVE):
+    """
+    串流產生：一段一段 yield 文字，網頁可以邊收邊顯示
+    額度一樣要先排隊拿；被 Gemini 回 429 / 斷路中丟 LLMBusyError (讓呼叫端拿舊結果頂著)，
+    其他錯誤和串流中途出錯會直接往外丟
+    """
+    model = get_model(model_name, generation_config)
+    d = dispatcher()
+    est_tokens = estimate_tokens(prompt)
+    if not d.acquire(priority, est_tokens, Config.LLM_MAX_WAIT[_PRIORITY_NAMES[priority]]):
+        metrics.inc('llm_rejected_total', priority=_PRIORITY_NAMES[priority])
+        raise LLMBusyError("AI 額度已滿，請稍後再試")
+
+    try:
+        response = upstream.call('gemini', model.generate_content, prompt, stream=True,
+                                 request_options={'timeout': upstream.timeout('gemini')})
+    except upstream.CircuitOpenError as e:
+        raise LLMBusyError("AI 額度已滿，請稍後再試") from e
+    except upstream.UpstreamError as e:
+        if not _is_quota_error(e):
+            raise
+        # 跟 submit 一樣清空桶子，其他排隊的請求也一起等補充
+        metrics.inc('llm_quota_errors_total')
+        d.penalize()
+        raise LLMBusyError("AI 額度已滿，請稍後再試") from e
+    for chunk in response:
+        text = getattr(chunk, 'text', '')
+        if text:
+            yield text
+
+    usage = getattr(response, 'usage_metadata', None)
+    actual = getattr(usage, 'total_token_count', None)
+    if actual:
+        d.settle(est_tokens, actual)
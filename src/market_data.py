@@ -1,8 +1,37 @@
-import yfinance as yf
 import pandas as pd
-from GoogleNews import GoogleNews
+from src import cache, metrics, upstream, lazy
 
+# yfinance / GoogleNews 第一次抓資料才載入
+yf = lazy.lazy_import('yfinance')
+google_news = lazy.lazy_import('GoogleNews')
+
+def _clean_ticker(ticker_input):
+    return str(ticker_input).strip().upper().replace(".TWO", "").replace(".TW", "")
+
+@metrics.timed('get_stock_data')
 def get_stock_data(ticker_input):
+    """
+    抓取台股資料 (有快取版)
+    收盤定稿後、休市日都直接用快取，只有資料「可能有變」才去 yfinance 重抓
+    回傳 copy，呼叫端怎麼改 df 都不會弄髒快取
+    """
+    key = _clean_ticker(ticker_input)
+    hit, value = cache.get('bars', key)
+    if not hit:
+        with cache.key_lock('bars', key):
+            hit, value = cache.get('bars', key, record=False)
+            if not hit:
+                value = _download_stock_data(ticker_input)
+                if value[0] is None:
+                    return None, None
+                cache.put('bars', key, value)
+    if hit:
+        print(f"⚡ [快取] {key} 股價資料仍是最新，不重抓")
+
+    df, successful_ticker = value
+    return df.copy(), successful_ticker
+
+def _download_stock_data(ticker_input):
     """
     抓取台股資料 (超強容錯版：自動修正 .TW/.TWO)
     """
@@ -34,7 +63,8 @@ def get_stock_data(ticker_input):
             print(f"🔍 正在下載: {ticker} ...")
             
             stock = yf.Ticker(ticker)
-            temp_df = stock.history(period="1y")
+            temp_df = upstream.call('yfinance', stock.history, period="1y",
+                                    timeout=upstream.timeout('yfinance'))
 
             # 檢查資料有效性
             if not temp_df.empty and len(temp_df) > 0:
@@ -45,6 +75,9 @@ def get_stock_data(ticker_input):
             else:
                 print(f"⚠️ {ticker} 無資料，嘗試下一個...")
 
+        except upstream.CircuitOpenError as e:
+            print(f"❌ {e}")
+            break
         except Exception as e:
             print(f"❌ 下載 {ticker} 發生錯誤: {e}")
             continue
@@ -70,15 +103,19 @@ def get_stock_data(ticker_input):
     # 回傳資料表與「正確的代號」(例如使用者輸入 8436.TW，這裡會回傳 8436.TWO)
     return df, successful_ticker
 
+@metrics.timed('get_recent_news')
+@cache.cached('news',
+              key_func=lambda stock_name: _clean_ticker(stock_name),
+              should_cache=lambda headlines: headlines != ["新聞系統暫時異常"])
 def get_recent_news(stock_name):
     """
-    抓取新聞 (維持不變)
+    抓取新聞 (盤中 15 分鐘、盤後 3 小時內重複查詢直接用快取)
     """
     try:
-        googlenews = GoogleNews(lang='zh-TW', region='TW')
+        googlenews = google_news.GoogleNews(lang='zh-TW', region='TW')
         googlenews.set_period('7d')
         clean_name = stock_name.replace('.TW', '').replace('.TWO', '')
-        googlenews.search(clean_name)
+        upstream.call_with_timeout('googlenews', googlenews.search, clean_name)
         result = googlenews.result()
         headlines = [item['title'] for item in result[:10]]
         if not headlines:
@@ -0,0 +1,130 @@
+import contextvars
+import threading
+import time
+from functools import wraps
+
+# 輕量監控：計數器 + 延遲直方圖，輸出 Prometheus 文字格式 (/metrics)
+# 注意：數據存在各自 process 的記憶體，多 worker 時每個 worker 各算各的
+
+# 延遲直方圖的區間 (秒)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}    # { (name, labels): value }
+_gauges = {}      # { (name, labels): value }
+_histograms = {}  # { (name, labels): [每個 bucket 的次數..., +Inf 次數, 總和] }
+
+_HELP = {
+    'stage_latency_seconds': "各分析階段耗時 (秒)",
+    'stage_calls_total': "各分析階段呼叫次數",
+    'stage_errors_total': "各分析階段丟出例外的次數",
+    'cache_requests_total': "快取查詢次數 (result=hit/shared_hit/miss)",
+    'request_latency_seconds': "整個請求耗時 (秒)",
+    'upstream_errors_total': "上游服務 (yfinance / FinMind / GoogleNews / Gemini) 錯誤次數",
+    'page_cache_requests_total': "結果頁快取 (result=hit/not_modified/miss)",
+    'lazy_import_seconds': "延遲載入的套件實際 import 耗時 (秒)",
+    'line_push_recipients_total': "LINE 排程推播人數 (status=sent/failed)",
+    'line_push_rate_limited_total': "LINE 推播收到 429 流量限制的次數",
+    'intraday_quotes_total': "盤中監控處理的報價筆數",
+    'intraday_alerts_total': "盤中提醒次數 (kind=breakout)",
+}
+
+# 目前這個請求的各階段耗時 [(stage, seconds), ...]，給結果頁顯示
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        k = _key(name, labels)
+        _counters[k] = _counters.get(k, 0) + amount
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, seconds, **labels):
+    with _lock:
+        k = _key(name, labels)
+        hist = _histograms.get(k)
+        if hist is None:
+            hist = _histograms[k] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[len(BUCKETS)] += 1
+        hist[-1] += seconds
+
+def start_request():
+    """ 在每個請求開頭呼叫，之後 timed() 量到的時間都會記進這次請求 """
+    _request_timings.set([])
+
+def request_timings():
+    return list(_request_timings.get() or [])
+
+def record_stage(stage, seconds):
+    observe('stage_latency_seconds', seconds, stage=stage)
+    inc('stage_calls_total', stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, round(seconds * 1000, 1)))
+
+def timed(stage):
+    """ 裝飾器：量測函式耗時、呼叫次數、例外次數 """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                inc('stage_errors_total', stage=stage)
+                raise
+            finally:
+                record_stage(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"'.replace('\n', ' ') for k, v in items)
+    return "{" + body + "}"
+
+def render_prometheus():
+    """ 輸出 Prometheus text exposition format """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name in seen:
+            return
+        seen.add(name)
+        if name in _HELP:
+            lines.append(f"# HELP {name} {_HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, 'counter')
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, 'gauge')
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), hist in sorted(histograms.items()):
+        header(name, 'histogram')
+        for i, bound in enumerate(BUCKETS):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {hist[i]}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist[len(BUCKETS)]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {round(hist[-1], 6)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist[len(BUCKETS)]}")
+
+    return "\n".join(lines) + "\n"
@@ -1,8 +1,35 @@
+import datetime
+import os
+import pickle
+import threading
+import time
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
 #from sklearn.model_selection import GridSearchCV # [新增] 自動調參工具
+from config import Config
 from src.strategy import calculate_rsi, calculate_macd
+from src import metrics, lazy, cache, trading_calendar
+
+# sklearn 載入要 1 秒左右，第一次預測才載入
+sklearn_ensemble = lazy.lazy_import('sklearn.ensemble')
+
+# 兩種模型：
+# 1. 單檔模型 (_fit_predict)：每次預測用這檔自己的歷史訓練一棵森林，一檔要幾百毫秒
+# 2. 共用模型 (predict_batch)：全市場的特徵疊成一張表訓練一次 (存在 Config.ML_MODEL_PATH)，
+#    之後幾千檔的最後一天疊成一個矩陣，一次 predict_proba 算完
+# 預測結果依 (股票, 最後一根 K 線, 模型版本) 存進快取，早報快照、選股、結果頁共用同一個數字。
+# 還沒有共用模型 (剛部署、股票太少不能訓練) 時才退回單檔模型。
+
+MIN_BARS = 100
+
+# 單檔模型的特徵
+FEATURE_COLS = [
+    'RSI', 'MACD_Hist', 'Bias_20', 'Vol_Change',
+    'Return_Lag1', 'Return_Lag2', # 昨天的漲幅、前天的漲幅
+    'Vol_Change_Lag1', 'RSI_Lag1' # 昨天的量、昨天的RSI
+]
+# 共用模型：MACD 柱換成除以股價的版本，不同價位的股票才能放在一起
+POOLED_FEATURE_COLS = [col if col != 'MACD_Hist' else 'MACD_Hist_Pct' for col in FEATURE_COLS]
 
 def prepare_features(df):
     """
@@ -43,13 +70,73 @@ def prepare_features(df):
     
     return df
 
-def predict_next_day(df):
+def _group_ewm(series, key, **kwargs):
+    """ 每檔各自的 EMA (groupby 一次算完所有股票，結果依原本的列順序排回來) """
+    ewm = series.groupby(key, sort=False).ewm(adjust=False, **kwargs).mean()
+    return ewm.reset_index(level=0, drop=True).sort_index()
+
+def prepare_features_batch(frames):
+    """
+    多檔一起做特徵：frames = {ticker: K 線 df} → 疊成一張表 (多一欄 Ticker)
+    每個指標都是 groupby 一次算完，數字跟逐檔呼叫 prepare_features 一樣；
+    另外多一欄 MACD_Hist_Pct (MACD 柱 / 股價) 給共用模型用
+    """
+    if not frames:
+        return pd.DataFrame(columns=['Ticker', 'Date', 'Close', 'Target'] + FEATURE_COLS + ['MACD_Hist_Pct'])
+    data = pd.concat(
+        [df[['Date', 'Close', 'Volume']].assign(Ticker=ticker) for ticker, df in frames.items()],
+        ignore_index=True,
+    )
+    data['Close'] = data['Close'].astype(float)
+    data['Volume'] = data['Volume'].astype(float)
+    key = data['Ticker']
+    grouped = data.groupby(key, sort=False)
+
+    # --- 1. 基礎技術指標 (公式同 strategy.calculate_rsi / calculate_macd) ---
+    delta = grouped['Close'].diff()
+    ema_up = _group_ewm(delta.clip(lower=0), key, com=13)
+    ema_down = _group_ewm(-delta.clip(upper=0), key, com=13)
+    data['RSI'] = 100 - (100 / (1 + ema_up / ema_down))
+    macd = _group_ewm(data['Close'], key, span=12) - _group_ewm(data['Close'], key, span=26)
+    data['MACD_Hist'] = macd - _group_ewm(macd, key, span=9)
+    data['MACD_Hist_Pct'] = data['MACD_Hist'] / data['Close']
+
+    ma20 = grouped['Close'].rolling(window=20).mean().reset_index(level=0, drop=True).sort_index()
+    data['Bias_20'] = (data['Close'] - ma20) / ma20.replace(0, np.nan)
+    data['Vol_Change'] = grouped['Volume'].pct_change()
+
+    # --- 2. 歷史特徵 (Lag Features) ---
+    data['Return'] = grouped['Close'].pct_change()
+    lagged = data[['Return', 'Vol_Change', 'RSI']].groupby(key, sort=False)
+    data['Return_Lag1'] = lagged['Return'].shift(1)
+    data['Return_Lag2'] = lagged['Return'].shift(2)
+    data['Vol_Change_Lag1'] = lagged['Vol_Change'].shift(1)
+    data['RSI_Lag1'] = lagged['RSI'].shift(1)
+
+    # --- 3. 預測目標 ---
+    data['Target'] = (grouped['Close'].shift(-1) > data['Close']).astype(int)
+
+    # --- 4. 清洗資料 ---
+    data.replace([np.inf, -np.inf], np.nan, inplace=True)
+    return data.dropna(subset=['Return'] + FEATURE_COLS).reset_index(drop=True)
+
+def _new_model():
+    # 不再使用 GridSearch 亂槍打鳥，直接指定一組穩定的參數
+    return sklearn_ensemble.RandomForestClassifier(
+        n_estimators=30,     # 樹種 30 棵就好 (原本可能預設 100)
+        max_depth=5,         # 樹高限制 5 層 (避免過度擬合 + 省記憶體)
+        min_samples_split=5, # 稍微保守一點的分裂
+        n_jobs=1,            # 【救命關鍵】強制單核心！絕對不能用 -1
+        random_state=42
+    )
+
+def _fit_predict(df):
     """
-    ☁️ 雲端輕量版預測：專為 Render 免費版優化
+    ☁️ 雲端輕量版預測 (單檔模型)：專為 Render 免費版優化
     移除 GridSearchCV 與多執行緒，確保不會因記憶體不足而當機。
     """
     # 1. 資料長度檢查
-    if len(df) < 100:
+    if len(df) < MIN_BARS:
         return None
 
     try:
@@ -61,11 +148,7 @@ def predict_next_day(df):
             return None
         
         # 2. 定義特徵欄位 (保留你原本的設計)
-        feature_cols = [
-            'RSI', 'MACD_Hist', 'Bias_20', 'Vol_Change',
-            'Return_Lag1', 'Return_Lag2', # 昨天的漲幅、前天的漲幅
-            'Vol_Change_Lag1', 'RSI_Lag1' # 昨天的量、昨天的RSI
-        ]
+        feature_cols = FEATURE_COLS
         
         # 檢查是否所有欄位都存在
         missing_cols = [col for col in feature_cols if col not in data.columns]
@@ -85,14 +168,7 @@ def predict_next_day(df):
         # 🔥【關鍵修改】雲端生存模式
         # ======================================================
         
-        # 不再使用 GridSearch 亂槍打鳥，直接指定一組穩定的參數
-        model = RandomForestClassifier(
-            n_estimators=30,     # 樹種 30 棵就好 (原本可能預設 100)
-            max_depth=5,         # 樹高限制 5 層 (避免過度擬合 + 省記憶體)
-            min_samples_split=5, # 稍微保守一點的分裂
-            n_jobs=1,            # 【救命關鍵】強制單核心！絕對不能用 -1
-            random_state=42
-        )
+        model = _new_model()
         
         # 直接訓練一次 (原本要訓練 54 次)
         model.fit(X_train, y_train)
@@ -109,4 +185,174 @@ def predict_next_day(df):
     except Exception as e:
         print(f"❌ ML 預測失敗 (記憶體保護模式): {e}")
         # 回傳 None 讓外層去處理 (例如顯示「資料不足」)
-        return None
\ No newline at end of file
+        return None
+
+# ---------------------------------------------------------------
+#  共用模型：訓練 / 存檔 (寫到暫存檔再改名) / 多個 worker 各自讀檔
+# ---------------------------------------------------------------
+
+_lock = threading.Lock()
+_train_lock = threading.Lock()
+_pooled = None          # {'model', 'version', 'trained_on', 'data_until', 'tickers', 'rows'}
+_loaded_mtime = None
+
+def _reload_if_changed():
+    """ 檔案被別的 worker / 盤後訓練改過就重新載入 (只看修改時間) """
+    global _pooled, _loaded_mtime
+    path = Config.ML_MODEL_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return
+    if mtime == _loaded_mtime:
+        return
+    try:
+        with open(path, 'rb') as f:
+            _pooled = pickle.load(f)
+        _loaded_mtime = mtime
+    except Exception as e:
+        print(f"⚠️ [ML] 共用模型讀取失敗: {e}")
+
+def _save(pooled):
+    global _loaded_mtime
+    path = Config.ML_MODEL_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(pooled, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    _loaded_mtime = os.path.getmtime(path)
+
+def pooled_model():
+    """ 目前的共用模型 (dict)；還沒訓練過回傳 None """
+    with _lock:
+        _reload_if_changed()
+        return _pooled
+
+def is_stale(pooled):
+    if pooled is None:
+        return True
+    trained_on = datetime.date.fromisoformat(pooled['trained_on'])
+    return (trading_calendar.today_tw() - trained_on).days > Config.ML_MODEL_MAX_AGE_DAYS
+
+@metrics.timed('ml_train')
+def train_pooled(frames, features=None):
+    """
+    用 frames 每檔最近 ML_TRAIN_BARS 天訓練共用模型並存檔
+    股票少於 ML_MIN_POOL_TICKERS 檔回傳 None (資料太少，不如各自用單檔模型)
+    """
+    global _pooled
+    if len(frames) < Config.ML_MIN_POOL_TICKERS:
+        return None
+    data = features if features is not None else prepare_features_batch(frames)
+    # 每檔最後一天的「明天」還沒發生，Target 不準，不拿來訓練
+    train = data[data.duplicated('Ticker', keep='last')]
+    train = train.groupby('Ticker', sort=False).tail(Config.ML_TRAIN_BARS)
+    if len(train) > Config.ML_MAX_TRAIN_ROWS:
+        train = train.sample(n=Config.ML_MAX_TRAIN_ROWS, random_state=42)
+    if train['Target'].nunique() < 2:
+        return None
+
+    model = _new_model()
+    model.fit(train[POOLED_FEATURE_COLS], train['Target'])
+    pooled = {
+        'model': model,
+        'version': str(int(time.time())),
+        'trained_on': trading_calendar.today_tw().isoformat(),
+        'data_until': str(data['Date'].max())[:10],
+        'tickers': int(data['Ticker'].nunique()),
+        'rows': len(train),
+    }
+    with _lock:
+        _pooled = pooled
+        _save(pooled)
+    print(f"🤖 [ML] 共用模型訓練完成：{pooled['tickers']} 檔、{pooled['rows']} 筆 (資料到 {pooled['data_until']})")
+    return pooled
+
+# ---------------------------------------------------------------
+#  預測
+# ---------------------------------------------------------------
+
+def _cache_key(ticker, df, version):
+    code = str(ticker).upper().replace(".TWO", "").replace(".TW", "")
+    last_date = df['Date'].iloc[-1] if 'Date' in df else df.index[-1]
+    return f"{code}:{last_date}:{len(df)}:{version}"
+
+def _predict_pooled(pooled, frames, features=None):
+    """ 每檔取最後一天疊成一個矩陣，一次 predict_proba；回傳 {ticker: 上漲機率 %} """
+    data = features if features is not None else prepare_features_batch(frames)
+    data = data[data['Ticker'].isin(list(frames))]
+    if data.empty:
+        return {}
+    latest = data.drop_duplicates('Ticker', keep='last')
+    model = pooled['model']
+    up = list(model.classes_).index(1)
+    probs = model.predict_proba(latest[POOLED_FEATURE_COLS])[:, up]
+    return {ticker: round(float(p) * 100, 1) for ticker, p in zip(latest['Ticker'], probs)}
+
+@metrics.timed('ml_predict_batch')
+def predict_batch(frames, train=True):
+    """
+    多檔一起預測：frames = {ticker: K 線 df} → {ticker: 明天上漲機率 % (資料不足是 None)}
+    1. 快取有的直接用 (同一檔、同一根 K 線、同一個模型只算一次)
+    2. 共用模型太舊 (或還沒有) 而且這次股票夠多 (train=True)：順便用這批重新訓練
+    3. 沒算過的一起做特徵，共用模型一次 predict_proba；沒有共用模型才逐檔用單檔模型
+    """
+    results = {ticker: None for ticker in frames}
+    frames = {t: df for t, df in frames.items() if df is not None and len(df) >= MIN_BARS}
+
+    pooled = pooled_model()
+    features = None
+    if train and is_stale(pooled) and len(frames) >= Config.ML_MIN_POOL_TICKERS:
+        with _train_lock:
+            # 排隊等鎖的期間，可能已經有人訓練好了
+            pooled = pooled_model()
+            if is_stale(pooled):
+                features = prepare_features_batch(frames)
+                pooled = train_pooled(frames, features) or pooled
+    version = pooled['version'] if pooled is not None else 'single'
+
+    keys, todo = {}, {}
+    for ticker, df in frames.items():
+        keys[ticker] = _cache_key(ticker, df, version)
+        hit, value = cache.get('ml', keys[ticker])
+        if hit:
+            results[ticker] = value
+        else:
+            todo[ticker] = df
+    if not todo:
+        return results
+
+    if pooled is None:
+        computed = {ticker: _fit_predict(df) for ticker, df in todo.items()}
+    else:
+        try:
+            computed = _predict_pooled(pooled, todo, features)
+        except Exception as e:
+            print(f"❌ ML 批次預測失敗: {e}")
+            computed = {}
+    for ticker in todo:
+        value = computed.get(ticker)
+        results[ticker] = value
+        if value is not None:
+            cache.put('ml', keys[ticker], value)
+    return results
+
+@metrics.timed('predict_next_day')
+def predict_next_day(df, ticker=None):
+    """
+    單檔預測 (結果頁 / 盤後快照)：有給 ticker 就跟 predict_batch 共用快取與共用模型
+    沒給 ticker 不走快取；還沒有共用模型時用單檔模型
+    """
+    if ticker is not None:
+        return predict_batch({ticker: df}, train=False)[ticker]
+    pooled = pooled_model()
+    if pooled is None:
+        return _fit_predict(df)
+    if len(df) < MIN_BARS:
+        return None
+    try:
+        return _predict_pooled(pooled, {'': df}).get('')
+    except Exception as e:
+        print(f"❌ ML 預測失敗: {e}")
+        return None
@@ -0,0 +1,65 @@
+import hashlib
+import os
+from src import cache
+
+# 結果頁快取：整頁 HTML (含 Plotly 圖) 依「輸入資料的版本」存起來
+#
+# 一頁的內容只由這幾份資料決定：
+#   bars / chips / news  → 快取裡的抓取時間 (重抓才會變)
+#   sentiment            → AI 結果寫入時 +1 的版本號
+# 版本都沒變，就直接回傳上次渲染好的 HTML；瀏覽器帶 If-None-Match 來還可以直接回 304。
+# 任何一份輸入過期 (快取裡沒有新鮮的) 就回傳 None，呼叫端照常重新分析。
+# 快取 key 是股票代號、值是 (ETag, HTML)：新版本直接蓋掉舊的，每檔只留一頁。
+
+INPUTS = ('bars', 'chips', 'news')
+
+# 模板改版 (重新部署) 後舊的 HTML 要作廢
+_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates', 'result.html')
+try:
+    _TEMPLATE_STAMP = str(os.path.getmtime(_TEMPLATE_PATH))
+except OSError:
+    _TEMPLATE_STAMP = ""
+
+def stock_code(ticker):
+    """ 跟 market_data / chips / news 的快取 key 一樣：去掉 .TW / .TWO """
+    return str(ticker).strip().upper().replace(".TWO", "").replace(".TW", "")
+
+def sentiment_version_name(stock_name):
+    return f"sentiment:{stock_code(stock_name)}"
+
+def input_versions(ticker):
+    """ 回傳 {輸入: 版本}；有任何一份沒有新鮮的快取就回傳 None """
+    code = stock_code(ticker)
+    versions = {}
+    for namespace in INPUTS:
+        fetched = cache.fetched_at(namespace, code)
+        if fetched is None:
+            return None
+        versions[namespace] = fetched
+    sentiment_version = cache.get_version(sentiment_version_name(code))
+    if sentiment_version is None:
+        return None
+    versions['sentiment'] = sentiment_version
+    return versions
+
+def etag(ticker, versions):
+    parts = [str(ticker).upper(), _TEMPLATE_STAMP]
+    for name in sorted(versions):
+        value = versions[name]
+        parts.append(f"{name}={value.timestamp() if hasattr(value, 'timestamp') else value}")
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:20]
+
+def last_modified(versions):
+    """ 最後一次抓到新資料的時間 (給 Last-Modified 標頭) """
+    times = [versions[name] for name in INPUTS if hasattr(versions.get(name), 'timestamp')]
+    return max(times) if times else None
+
+def get(ticker, tag):
+    """ 存的那一頁版本跟 tag 一樣才回傳 HTML """
+    hit, entry = cache.get('pages', stock_code(ticker))
+    if not hit or entry[0] != tag:
+        return None
+    return entry[1]
+
+def put(ticker, tag, html):
+    cache.put('pages', stock_code(ticker), (tag, html))
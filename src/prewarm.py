@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+from config import Config
+from src import market_data, chips, sentiment, strategy, trading_calendar, llm
+
+# 同一個 process 裡同時只跑一個預熱任務 (排程重疊時後來的直接跳過)
+_running = threading.Lock()
+
+def _load_state():
+    try:
+        with open(Config.PREWARM_STATE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_state(state):
+    # 先寫暫存檔再換名，避免寫到一半被中斷留下壞掉的 JSON
+    os.makedirs(os.path.dirname(Config.PREWARM_STATE_FILE), exist_ok=True)
+    tmp_path = Config.PREWARM_STATE_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, Config.PREWARM_STATE_FILE)
+
+def _run_key(job_name):
+    return f"{job_name}:{trading_calendar.today_tw().isoformat()}"
+
+class Pacer:
+    """
+    簡單的節流器：每次呼叫上游前先等 delay 秒
+    失敗 (多半是被限流) 就把間隔加倍，成功再慢慢降回原本的速度
+    """
+    def __init__(self, base_delay, max_delay):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = base_delay
+
+    def wait(self):
+        if self.delay > 0:
+            time.sleep(self.delay)
+
+    def success(self):
+        self.delay = max(self.base_delay, self.delay / 2)
+
+    def failure(self):
+        self.delay = min(self.max_delay, max(self.delay * 2, 1))
+
+def _warm_bars(ticker):
+    df, _ = market_data.get_stock_data(ticker)
+    if df is None:
+        raise RuntimeError("股價下載失敗")
+
+def _warm_chips(ticker):
+    chips.get_institutional_chips(ticker)
+
+def _warm_news(ticker):
+    stock_name = ticker.replace('.TWO', '').replace('.TW', '')
+    if market_data.get_recent_news(stock_name) == ["新聞系統暫時異常"]:
+        raise RuntimeError("新聞抓取失敗")
+
+def _warm_sentiment(ticker):
+    # 跟網頁 analyze() 用一模一樣的輸入，這樣 Prompt 相同才吃得到快取
+    df, valid_ticker = market_data.get_stock_data(ticker)
+    if df is None:
+        raise RuntimeError("股價下載失敗")
+    _, tech_info = strategy.check_volume_breakout(df)
+    chip_data = chips.get_institutional_chips(valid_ticker)
+    stock_name = valid_ticker.replace('.TWO', '').replace('.TW', '')
+    news = market_data.get_recent_news(stock_name)
+    score, comment = sentiment.analyze_sentiment(stock_name, news, tech_info, chip_data, priority=llm.BACKGROUND)
+    # 失敗、快速分數頂替、額度不足拿上一次的舊結果，都不會存進這次輸入的快取：沒存到就不算預熱完成
+    if sentiment.get_cached_sentiment(stock_name, news, tech_info, chip_data) is None:
+        raise RuntimeError(comment.splitlines()[0] if comment else "AI 分析沒有結果")
+
+STAGES = {
+    'bars': _warm_bars,
+    'chips': _warm_chips,
+    'news': _warm_news,
+    'sentiment': _warm_sentiment,
+}
+
+def run_job(job_name, stages, tickers):
+    """
+    依序執行各階段預熱 (需在 Flask app_context 內呼叫，sentiment 會讀 current_app)
+    進度寫在 PREWARM_STATE_FILE，同一天重跑會跳過已完成的股票
+    """
+    if not _running.acquire(blocking=False):
+        print(f"⏭️ [預熱] 已有任務在跑，跳過 {job_name}")
+        return
+
+    try:
+        key = _run_key(job_name)
+        state = _load_state()
+        # 只保留今天的紀錄，舊的直接丟掉
+        today = trading_calendar.today_tw().isoformat()
+        state = {k: v for k, v in state.items() if k.endswith(today)}
+        run = state.setdefault(key, {"stages": {}, "finished": False})
+
+        if run["finished"]:
+            print(f"✅ [預熱] {job_name} 今天已完成")
+            return
+
+        print(f"🔥 [預熱] 開始 {job_name}: {stages} x {len(tickers)} 檔")
+        for stage in stages:
+            done = set(run["stages"].setdefault(stage, []))
+            pacer = Pacer(Config.PREWARM_PACING.get(stage, 1.0), Config.PREWARM_MAX_DELAY)
+
+            for ticker in tickers:
+                if ticker in done:
+                    continue
+                pacer.wait()
+                try:
+                    STAGES[stage](ticker)
+                    pacer.success()
+                except Exception as e:
+                    pacer.failure()
+                    print(f"⚠️ [預熱] {stage} {ticker} 失敗: {e} (間隔調為 {pacer.delay}s)")
+                    continue
+
+                run["stages"][stage].append(ticker)
+                _save_state(state)
+
+        # 有失敗的股票就不標記完成，下次重跑只補做失敗的那幾檔
+        run["finished"] = all(set(tickers) <= set(run["stages"][stage]) for stage in stages)
+        _save_state(state)
+        print(f"✅ [預熱] {job_name} 結束 (全部完成: {run['finished']})")
+    finally:
+        _running.release()
+
+def unfinished_jobs():
+    """ 今天已經開始但還沒跑完的任務名稱 (例如重新部署被中斷) """
+    today = trading_calendar.today_tw().isoformat()
+    return [
+        key.split(':')[0] for key, run in _load_state().items()
+        if key.endswith(today) and not run.get("finished")
+    ]
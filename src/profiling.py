@@ -0,0 +1,145 @@
+import collections
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from config import Config
+from src import metrics
+
+# 單一請求的效能剖析 (預設關閉)
+# 開啟方式：Header「X-Profile: 1」、網址加 ?profile=1 (都要帶 PROFILE_TOKEN)，或設定 PROFILE_SAMPLE_RATE 隨機抽樣
+# 結果存在 PROFILE_DIR：<名稱>.prof / .txt (剖析結果) + <名稱>.json (股票代號、各階段耗時)
+
+_NAME_RE = re.compile(r'^[\w.\-]+$')
+
+def should_profile(req):
+    """ 判斷這次請求要不要剖析 (手動開啟要帶 PROFILE_TOKEN；沒設定 token 就只有隨機抽樣) """
+    token = Config.PROFILE_TOKEN
+    token_ok = bool(token) and (req.args.get('token') == token or req.headers.get('X-Profile-Token') == token)
+
+    if req.headers.get('X-Profile') == '1' or req.args.get('profile') == '1':
+        return token_ok
+    return Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE
+
+class SamplingProfiler:
+    """
+    低負擔的抽樣剖析：另開一條執行緒，每隔 interval 秒看一下目標執行緒在跑哪裡
+    輸出 collapsed stack 格式 (可以直接丟給 flamegraph.pl / speedscope)
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def run_profiled(func, *args, label="request", **kwargs):
+    """ 執行 func 並把剖析結果存檔，回傳 func 的回傳值 """
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    safe_label = re.sub(r'[^\w.\-]', '_', str(label))
+    name = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{safe_label}"
+    base_path = os.path.join(Config.PROFILE_DIR, name)
+    mode = Config.PROFILE_MODE
+
+    start = time.perf_counter()
+    if mode == 'sampling':
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.stop()
+        profiler.dump(base_path + ".txt")
+        summary = [f"{stack.rsplit(';', 1)[-1]} {count}" for stack, count in profiler.stacks.most_common(20)]
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.disable()
+        profiler.dump_stats(base_path + ".prof")
+
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(40)
+        with open(base_path + ".txt", 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+        summary = None
+
+    duration_ms = round((time.perf_counter() - start) * 1000, 1)
+    meta = {
+        "name": name,
+        "label": label,
+        "mode": mode,
+        "created_at": datetime.datetime.now().isoformat(timespec='seconds'),
+        "duration_ms": duration_ms,
+        "stages": metrics.request_timings(),
+        "top_samples": summary,
+    }
+    with open(base_path + ".json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    metrics.inc('profiles_captured_total', mode=mode)
+    print(f"🔬 [剖析] {label} 耗時 {duration_ms} ms，已存為 {name}")
+    _cleanup()
+    return result
+
+def _cleanup():
+    """ 只保留最新 PROFILE_KEEP 筆 """
+    for meta in list_profiles()[Config.PROFILE_KEEP:]:
+        for ext in ('.json', '.prof', '.txt'):
+            path = os.path.join(Config.PROFILE_DIR, meta['name'] + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+def list_profiles():
+    """ 所有剖析紀錄 (新到舊) """
+    if not os.path.isdir(Config.PROFILE_DIR):
+        return []
+    items = []
+    for filename in sorted(os.listdir(Config.PROFILE_DIR), reverse=True):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(Config.PROFILE_DIR, filename), encoding='utf-8') as f:
+                items.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return items
+
+def profile_file(name, ext):
+    """ 回傳某筆剖析檔案的路徑 (檢查名稱，避免路徑穿越)，不存在回傳 None """
+    if ext not in ('.prof', '.txt', '.json') or not _NAME_RE.match(name):
+        return None
+    path = os.path.join(Config.PROFILE_DIR, name + ext)
+    return path if os.path.exists(path) else None
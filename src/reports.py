@@ -0,0 +1,243 @@
+import csv
+import glob
+import os
+import re
+import time
+import pandas as pd
+
+# 批次報表：邊跑邊寫 + 依日期分區，重讀時只讀需要的日期與欄位
+#
+# 目錄結構 (Hive 風格，pyarrow / DuckDB / Spark 都看得懂)：
+#   data/reports/date=2026-10-16/part-20261019-0000.parquet
+#   data/reports/date=2026-10-16/part-20261019-0001.parquet
+#   data/reports/date=2026-10-17/part-20261019.csv
+#
+# - parquet / arrow：需要 pyarrow (requirements.txt 有列，沒裝時退回 csv)。每累積 batch_size 筆 (或 flush_interval 秒)
+#   就寫出一個完整的檔案 (一個 row group)，寫完立刻可讀，當掉只會少掉還在緩衝區的幾筆
+# - csv：同一次執行同一個日期寫在同一個檔案，flush 時追加
+# - flush 完成才呼叫 on_flush(keys)，批次程式在這時候才記「完成」，續跑不會漏資料
+
+COLUMNS = [
+    "Stock", "Date", "Price", "Change(%)", "Vol_Ratio", "RSI", "MACD",
+    "Breakout", "Strategy_Buy", "AI_Score", "AI_Comment", "Signal",
+]
+
+FORMATS = ('parquet', 'arrow', 'csv')
+_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow', 'csv': '.csv'}
+_PARTITION_RE = re.compile(r'^date=(\d{4}-\d{2}-\d{2})$')
+
+def arrow_available():
+    try:
+        import pyarrow.parquet
+        return True
+    except ImportError:
+        return False
+
+def resolve_format(fmt):
+    """ 'auto'：有 pyarrow 用 parquet，沒有用 csv；指定 parquet / arrow 但沒裝也退回 csv """
+    if fmt == 'auto':
+        return 'parquet' if arrow_available() else 'csv'
+    if fmt in ('parquet', 'arrow') and not arrow_available():
+        print(f"⚠️ [報表] 沒有安裝 pyarrow，{fmt} 改輸出 CSV")
+        return 'csv'
+    return fmt
+
+def _schema(pa, columns):
+    types = {
+        "Price": pa.float64(), "Change(%)": pa.float64(), "Vol_Ratio": pa.float64(),
+        "RSI": pa.float64(), "MACD": pa.float64(), "AI_Score": pa.float64(),
+        "Breakout": pa.bool_(), "Strategy_Buy": pa.bool_(),
+    }
+    return pa.schema([(c, types.get(c, pa.string())) for c in columns])
+
+def partition_dir(root, date):
+    return os.path.join(root, f"date={date}")
+
+class ReportSink:
+    """
+    用法：
+        sink = ReportSink(root, run_id, fmt='parquet', on_flush=checkpoint.mark_many)
+        sink.write(row, key=ticker)
+        ...
+        sink.close()
+    """
+    def __init__(self, root, run_id, fmt='auto', columns=COLUMNS, batch_size=500,
+                 flush_interval=30, on_flush=None):
+        self.root = root
+        self.run_id = run_id
+        self.fmt = resolve_format(fmt)
+        self.columns = columns
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.rows_written = 0
+        self._buffer = {}  # { date: [row, ...] }
+        self._keys = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        os.makedirs(root, exist_ok=True)
+
+    def write(self, row, key=None):
+        self._buffer.setdefault(row['Date'], []).append(row)
+        self._keys.append(key if key is not None else row['Stock'])
+        self._buffered += 1
+        if self._buffered >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        for date, rows in self._buffer.items():
+            os.makedirs(partition_dir(self.root, date), exist_ok=True)
+            if self.fmt == 'csv':
+                self._append_csv(date, rows)
+            else:
+                self._write_arrow_file(date, rows)
+        self.rows_written += self._buffered
+
+        keys = self._keys
+        self._buffer = {}
+        self._keys = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        if keys and self.on_flush:
+            self.on_flush(keys)
+
+    def _append_csv(self, date, rows):
+        path = os.path.join(partition_dir(self.root, date), f"part-{self.run_id}.csv")
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        # utf-8-sig：Excel 打開中文才不會亂碼 (只在檔頭寫一次 BOM)
+        with open(path, 'a', newline='', encoding='utf-8-sig' if is_new else 'utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns, extrasaction='ignore')
+            if is_new:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def _write_arrow_file(self, date, rows):
+        import pyarrow as pa
+        table = pa.Table.from_pylist(
+            [{c: row.get(c) for c in self.columns} for row in rows],
+            schema=_schema(pa, self.columns),
+        )
+        path = self._next_part_path(date)
+        # 先寫暫存檔再換名：讀取端永遠不會讀到寫一半的檔案
+        tmp_path = path + ".tmp"
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, tmp_path, compression='zstd')
+        else:
+            with pa.OSFile(tmp_path, 'wb') as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def _next_part_path(self, date):
+        ext = _EXTENSIONS[self.fmt]
+        pattern = os.path.join(partition_dir(self.root, date), f"part-{self.run_id}-*{ext}")
+        seq = len(glob.glob(pattern))
+        while True:
+            path = os.path.join(partition_dir(self.root, date), f"part-{self.run_id}-{seq:04d}{ext}")
+            if not os.path.exists(path):
+                return path
+            seq += 1
+
+    def close(self):
+        self.flush()
+
+def delete_run(root, run_id):
+    """ 刪掉某次執行寫出的所有檔案 (--fresh 重跑用) """
+    for pattern in (f"part-{run_id}.csv", f"part-{run_id}-*"):
+        for path in glob.glob(os.path.join(root, "date=*", pattern)):
+            os.remove(path)
+
+# ---------------------------------------------------------------
+#  讀取
+# ---------------------------------------------------------------
+
+def list_dates(root):
+    """ 有報表的日期 (由舊到新) """
+    if not os.path.isdir(root):
+        return []
+    dates = []
+    for name in os.listdir(root):
+        match = _PARTITION_RE.match(name)
+        if match:
+            dates.append(match.group(1))
+    return sorted(dates)
+
+def _existing(columns, available):
+    """ 舊的分區檔可能少了後來才加的欄位：只讀檔案裡有的，缺的 concat 時補 NaN """
+    return [c for c in columns if c in available] if columns else None
+
+def _read_file(path, columns, tickers):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        columns = _existing(columns, pq.read_schema(path).names)
+        filters = [('Stock', 'in', list(tickers))] if tickers else None
+        df = pd.read_parquet(path, columns=columns, filters=filters)
+    elif path.endswith('.arrow'):
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        columns = _existing(columns, table.column_names)
+        df = table.select(columns).to_pandas() if columns else table.to_pandas()
+    else:
+        usecols = (lambda c: c in columns) if columns else None
+        df = pd.read_csv(path, usecols=usecols, encoding='utf-8-sig', dtype={'Stock': str, 'Date': str})
+    if tickers:
+        df = df[df['Stock'].isin(tickers)]
+    return df
+
+def iter_reports(root, start=None, end=None, tickers=None, columns=None):
+    """
+    一次 yield 一個日期的 DataFrame (只讀日期範圍內的分區、只讀需要的欄位)
+    start / end : 'YYYY-MM-DD' 或 date，包含兩端
+    tickers     : 只要這些股票 (例如 ['2330.TW'])
+    """
+    start = str(start) if start else None
+    end = str(end) if end else None
+    tickers = set(tickers) if tickers else None
+    if columns:
+        # 去重複要用到代號與日期
+        columns = list(dict.fromkeys(['Stock', 'Date'] + list(columns)))
+
+    for date in list_dates(root):
+        if (start and date < start) or (end and date > end):
+            continue
+        # 依修改時間排序：同一檔同一天出現多次 (重跑) 以最後寫的為準
+        paths = sorted(
+            (p for p in glob.glob(os.path.join(partition_dir(root, date), "part-*"))
+             if os.path.splitext(p)[1] in _EXTENSIONS.values()),
+            key=os.path.getmtime,
+        )
+        frames = [_read_file(p, columns, tickers) for p in paths]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            continue
+        df = pd.concat(frames, ignore_index=True)
+        df['Date'] = df['Date'].astype(str)
+        yield df.drop_duplicates(['Stock', 'Date'], keep='last').reset_index(drop=True)
+
+def read_reports(root, start=None, end=None, tickers=None, columns=None):
+    """ 合併 iter_reports 的結果；沒有資料回傳空的 DataFrame """
+    frames = list(iter_reports(root, start, end, tickers, columns))
+    if not frames:
+        return pd.DataFrame(columns=columns or COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def read_with_forward_returns(root, bars_by_ticker, start=None, end=None, tickers=None, columns=None,
+                              horizons=None):
+    """
+    讀報表並接上訊號後的實際報酬 (ret_1d、ret_5d ...)，拿來回頭檢查訊號準不準
+    bars_by_ticker: {代號: 股價 DataFrame (要有 Date、Close)}，代號跟報表的 Stock 欄一樣 (例如 2330.TW)
+    """
+    from src import forward_returns
+    horizons = horizons or forward_returns.HORIZONS
+
+    df = read_reports(root, start, end, tickers, columns)
+    keys = pd.DataFrame({
+        'ticker': df['Stock'].astype(str),
+        'trade_date': pd.to_datetime(df['Date']).dt.date,
+    })
+    merged = forward_returns.attach_forward_returns(keys, bars_by_ticker, horizons)
+    returns = [forward_returns.column(h) for h in horizons]
+    # attach_forward_returns 是 left merge，列的順序跟 df 一樣
+    return pd.concat([df.drop(columns=[c for c in returns if c in df.columns]),
+                      merged[returns]], axis=1)
@@ -0,0 +1,180 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config import Config
+from src import backtest, cache, metrics, rules
+
+# 回測穩健度：同一份回測換個抽樣 / 進場日 / 參數再算幾千次，看報酬、勝率、最大回撤的信賴區間
+#
+# 三種模擬 (每一批都是 numpy 一次算完，不是一個模擬一個迴圈)：
+#   bootstrap     交易報酬「放回抽樣」(筆數不變)：交易順序與運氣
+#   entry_jitter  每筆進場日前後隨機挪 ±ROBUSTNESS_ENTRY_JITTER 天，停損停利重新掃一次
+#   params        停損 / 停利 / 持有天數 / 策略參數各自 ±ROBUSTNESS_PARAM_JITTER，整段重跑回測
+#
+# 單一股票 (結果頁) 在同一個 process 裡算；全市場 (夜間批次、screener.py --robustness)
+# 用 process pool，一檔一個工作。結果依 (股票, 策略, 最後一根 K 線日期) 存在 'robustness' 快取，
+# 盤後算好的結果頁直接拿來用。
+
+def _path_stats(returns):
+    """ returns: (模擬 × 交易) → (總報酬 %, 勝率 %, 最大回撤 %) 各一個長度 = 模擬數的陣列 """
+    equity = np.cumprod(1 + returns, axis=1)
+    peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=1)  # 起始資金 1 也算高點
+    drawdown = 1 - equity / peak
+    return (equity[:, -1] - 1) * 100, (returns > 0).mean(axis=1) * 100, drawdown.max(axis=1) * 100
+
+def _batches(n_sims, batch_size):
+    for start in range(0, n_sims, batch_size):
+        yield min(batch_size, n_sims - start)
+
+def _bootstrap(returns, n_sims, rng, batch_size):
+    for size in _batches(n_sims, batch_size):
+        picks = rng.integers(0, len(returns), (size, len(returns)))
+        yield _path_stats(returns[picks])
+
+def _entry_jitter(df, entries, n_sims, rng, batch_size, jitter):
+    holding_days = backtest.HOLDING_DAYS
+    high = df['High'].to_numpy(dtype=float)
+    low = df['Low'].to_numpy(dtype=float)
+    close = df['Close'].to_numpy(dtype=float)
+    last_entry = len(df) - holding_days - 1
+    for size in _batches(n_sims, batch_size):
+        shifted = entries[None, :] + rng.integers(-jitter, jitter + 1, (size, len(entries)))
+        shifted = np.clip(shifted, 0, last_entry).ravel()
+        _, _, returns, _ = backtest.kernels.scan_exits(
+            high, low, close, np.zeros_like(shifted), shifted,
+            Config.STOP_LOSS_PCT, Config.TAKE_PROFIT_PCT, holding_days)
+        yield _path_stats(returns.reshape(size, len(entries)))
+
+def _params(df, rule_set, memo, n_sims, rng, spread):
+    """ 參數組合每個都要重跑訊號，一次一組；共同的指標 (均線、RSI...) 靠 memo 只算一次 """
+    base = rule_set.resolved_params()
+    holding = backtest.HOLDING_DAYS
+    holding_choices = np.arange(max(1, int(round(holding * (1 - spread)))), int(round(holding * (1 + spread))) + 1)
+    totals, wins, drawdowns = [], [], []
+    for _ in range(n_sims):
+        factors = rng.uniform(1 - spread, 1 + spread, len(base) + 2)
+        params = {}
+        for (name, value), factor in zip(base.items(), factors):
+            params[name] = max(1, int(round(value * factor))) if isinstance(value, int) else value * factor
+        signal = rule_set.with_params(params).signal(df, memo).to_numpy()
+        _, _, _, returns, _ = backtest.simulate(
+            df, signal, int(rng.choice(holding_choices)),
+            Config.STOP_LOSS_PCT * factors[-2], Config.TAKE_PROFIT_PCT * factors[-1])
+        if len(returns) == 0:
+            # 這組參數一筆交易都沒有：報酬、回撤算 0，勝率不算
+            totals.append(0.0)
+            drawdowns.append(0.0)
+            continue
+        total, win, drawdown = _path_stats(returns[None, :])
+        totals.append(total[0])
+        wins.append(win[0])
+        drawdowns.append(drawdown[0])
+    return np.array(totals), np.array(wins), np.array(drawdowns)
+
+def _interval(values, confidence):
+    if len(values) == 0:
+        return None
+    tail = (1 - confidence) / 2 * 100
+    low, median, high = np.percentile(values, [tail, 50, 100 - tail])
+    return {'low': round(float(low), 1), 'median': round(float(median), 1), 'high': round(float(high), 1)}
+
+def _summarize(batches, confidence):
+    """ batches: [(總報酬, 勝率, 最大回撤), ...] 每批三個陣列 """
+    totals, wins, drawdowns = (np.concatenate([b[k] for b in batches]) if batches else np.empty(0)
+                               for k in range(3))
+    return {
+        'simulations': len(totals),
+        'total_return': _interval(totals, confidence),
+        'win_rate': _interval(wins, confidence),
+        'max_drawdown': _interval(drawdowns, confidence),
+        'loss_probability': round(float((totals < 0).mean() * 100), 1) if len(totals) else None,
+    }
+
+@metrics.timed('robustness')
+def analyze(df, strategy_name=None, simulations=None, seed=0):
+    """
+    回傳 {'trades', 'confidence', 'simulations', 'total_return': {'low', 'median', 'high'},
+          'win_rate': {...}, 'max_drawdown': {...}, 'loss_probability', 'methods': {方法: 同樣的統計}}
+    交易次數少於 Config.ROBUSTNESS_MIN_TRADES 回傳 None
+    seed 固定 → 同一份資料結果一樣 (結果頁快取、ETag 才不會每次都變)
+    """
+    rule_set = strategy_name if isinstance(strategy_name, rules.Strategy) else rules.get_strategy(strategy_name)
+    simulations = {**Config.ROBUSTNESS_SIMULATIONS, **(simulations or {})}
+    confidence = Config.ROBUSTNESS_CONFIDENCE
+    batch_size = Config.ROBUSTNESS_BATCH_SIZE
+    if len(df) < rule_set.min_bars + backtest.HOLDING_DAYS:
+        return None
+
+    memo = {}
+    signal = rule_set.signal(df, memo).to_numpy()
+    entries, _, _, returns, _ = backtest.simulate(df, signal)
+    if len(returns) < Config.ROBUSTNESS_MIN_TRADES:
+        return None
+
+    rng = np.random.default_rng(seed)
+    methods = {}
+    if simulations.get('bootstrap'):
+        methods['bootstrap'] = list(_bootstrap(returns, simulations['bootstrap'], rng, batch_size))
+    if simulations.get('entry_jitter'):
+        methods['entry_jitter'] = list(_entry_jitter(df, entries, simulations['entry_jitter'], rng,
+                                                     batch_size, Config.ROBUSTNESS_ENTRY_JITTER))
+    if simulations.get('params'):
+        methods['params'] = [_params(df, rule_set, memo, simulations['params'], rng, Config.ROBUSTNESS_PARAM_JITTER)]
+
+    per_method = {name: _summarize(batches, confidence) for name, batches in methods.items()}
+    combined = _summarize([b for batches in methods.values() for b in batches], confidence)
+    total, win, drawdown = _path_stats(returns[None, :])
+    return {
+        'trades': len(returns),
+        'confidence': round(confidence * 100),
+        'actual': {'total_return': round(float(total[0]), 1), 'win_rate': round(float(win[0]), 1),
+                   'max_drawdown': round(float(drawdown[0]), 1)},
+        **combined,
+        'methods': per_method,
+    }
+
+def _cache_key(ticker, df, rule_set):
+    code = str(ticker).upper().replace(".TWO", "").replace(".TW", "")
+    last_date = df['Date'].iloc[-1] if 'Date' in df else df.index[-1]
+    return f"{code}:{rule_set.name}:{last_date}:{len(df)}"
+
+def get_or_analyze(df, ticker, strategy_name=None):
+    """ 結果頁用：盤後批次算過 (同一根 K 線) 就直接拿，沒有才現算並存起來 """
+    rule_set = strategy_name if isinstance(strategy_name, rules.Strategy) else rules.get_strategy(strategy_name)
+    key = _cache_key(ticker, df, rule_set)
+    hit, result = cache.get('robustness', key)
+    if hit:
+        return result
+    result = analyze(df, rule_set)
+    cache.put('robustness', key, result)
+    return result
+
+def _analyze_one(item):
+    ticker, df, rule_set, simulations = item
+    try:
+        return ticker, analyze(df, rule_set, simulations)
+    except Exception as e:
+        print(f"❌ {ticker} 穩健度分析失敗: {e}")
+        return ticker, None
+
+def run_universe(frames, strategy_name=None, workers=None, simulations=None, start_method=None):
+    """
+    全市場批次：frames = {ticker: K 線 df}，回傳 {ticker: analyze() 的結果}
+    一檔一個工作丟給 process pool (numpy 運算吃 CPU，thread 會卡在 GIL)，結果順便寫進快取
+    start_method: 子 process 的啟動方式；從多執行緒的網頁 process 呼叫要用 'spawn'
+                  (fork 會把別的執行緒拿著的鎖一起複製過去，子 process 可能卡死)
+    """
+    rule_set = strategy_name if isinstance(strategy_name, rules.Strategy) else rules.get_strategy(strategy_name)
+    workers = workers or Config.ROBUSTNESS_WORKERS or os.cpu_count() or 1
+    items = [(ticker, df, rule_set, simulations) for ticker, df in frames.items()]
+    if workers <= 1 or len(items) <= 1:
+        results = dict(map(_analyze_one, items))
+    else:
+        mp_context = multiprocessing.get_context(start_method) if start_method else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+            results = dict(executor.map(_analyze_one, items, chunksize=max(1, len(items) // (workers * 4))))
+    if not simulations:  # 預設次數的結果才跟結果頁共用
+        for ticker, df in frames.items():
+            cache.put('robustness', _cache_key(ticker, df, rule_set), results.get(ticker))
+    return results
@@ -0,0 +1,270 @@
+import ast
+import itertools
+import pandas as pd
+from config import Config
+from src import strategy as indicators
+
+# 策略規則語言：進場條件寫成字串，編譯一次，整段 K 線一次算出每天符不符合 (布林遮罩)
+#
+# 例：
+#   "close > ma(close, 20) and slope(ma(close, 20)) > 0"
+#   "volume > ma(volume, 5) * vol_multiplier"
+#   "rsi(close, 14) < rsi_limit"
+#
+# 可以用的名稱：
+#   欄位   open / high / low / close / volume
+#   參數   策略 params 裡的名稱 (數字，或是 Config 的屬性名稱 → 每次計算時才讀，改 Config 立刻生效)
+#   Config 全大寫名稱直接讀 Config，例如 BACKTEST_RSI_LIMIT
+# 可以用的函式：見 _FUNCTIONS；運算：+ - * /、比較、and / or / not
+#
+# 只接受上面這些語法 (不是 eval)，設定檔寫錯在編譯時就會報錯。
+# 同一個子運算式 (例如 ma(close, 20)) 在同一份 K 線上只會算一次，
+# 多個策略 / 參數組合一起算 (screener.py 傳同一個 memo) 時也共用。
+#
+# 策略定義在 Config.STRATEGY_RULES，live 訊號 (strategy.check_buy_signal)、
+# 回測 (backtest.run_backtest)、選股 (screener.py) 都用同一份編譯結果。
+
+class RuleError(ValueError):
+    """ 規則寫錯 (語法、未知名稱、參數個數不對) """
+
+_COLUMNS = {'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}
+
+def _window(n):
+    return int(n)
+
+# 名稱: (最少參數, 最多參數, 函式)；第一個參數是序列，其他是常數 (數字 / 參數)
+_FUNCTIONS = {
+    'ma':         (2, 2, lambda x, n: x.rolling(window=_window(n)).mean()),
+    'ema':        (2, 2, lambda x, n: x.ewm(span=_window(n), adjust=False).mean()),
+    'highest':    (2, 2, lambda x, n: x.rolling(window=_window(n)).max()),
+    'lowest':     (2, 2, lambda x, n: x.rolling(window=_window(n)).min()),
+    'shift':      (2, 2, lambda x, n: x.shift(_window(n))),
+    'slope':      (1, 2, lambda x, n=1: x.diff(_window(n))),
+    'pct_change': (1, 2, lambda x, n=1: x.pct_change(_window(n))),
+    'rsi':        (1, 2, lambda x, n=14: indicators.calculate_rsi(x, _window(n))),
+    'macd':       (1, 1, lambda x: indicators.calculate_macd(x)[0]),
+    'macd_signal': (1, 1, lambda x: indicators.calculate_macd(x)[1]),
+    'macd_hist':  (1, 1, lambda x: indicators.calculate_macd(x)[2]),
+    'abs':        (1, 1, lambda x: x.abs()),
+}
+
+_BINARY = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/'}
+_COMPARE = {ast.Gt: '>', ast.GtE: '>=', ast.Lt: '<', ast.LtE: '<=', ast.Eq: '==', ast.NotEq: '!='}
+
+# ---------------------------------------------------------------
+#  編譯：字串 → 巢狀 tuple (可以當 dict key，相同的子運算式自然就是同一個 key)
+# ---------------------------------------------------------------
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+def _compile_node(node, params, source):
+    if isinstance(node, ast.BoolOp):
+        op = 'and' if isinstance(node.op, ast.And) else 'or'
+        return (op,) + tuple(_compile_node(v, params, source) for v in node.values)
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand, params, source)
+        if isinstance(node.op, ast.Not):
+            return ('not', operand)
+        if isinstance(node.op, ast.USub):
+            return ('const', -operand[1]) if operand[0] == 'const' else ('neg', operand)
+        if isinstance(node.op, ast.UAdd):
+            return operand
+
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        return (_BINARY[type(node.op)], _compile_node(node.left, params, source),
+                _compile_node(node.right, params, source))
+
+    elif isinstance(node, ast.Compare):
+        # a < b < c 拆成 (a < b) and (b < c)
+        parts = []
+        left = _compile_node(node.left, params, source)
+        for op, comparator in zip(node.ops, node.comparators):
+            if type(op) not in _COMPARE:
+                break
+            right = _compile_node(comparator, params, source)
+            parts.append((_COMPARE[type(op)], left, right))
+            left = right
+        else:
+            return parts[0] if len(parts) == 1 else ('and',) + tuple(parts)
+
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+            and not isinstance(node.value, bool):
+        return ('const', _number(node.value))
+
+    elif isinstance(node, ast.Name):
+        return _compile_name(node.id, params, source)
+
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        name = node.func.id
+        if name not in _FUNCTIONS:
+            raise RuleError(f"未知的函式 {name}()：{source}")
+        min_args, max_args, _ = _FUNCTIONS[name]
+        if not min_args <= len(node.args) <= max_args:
+            raise RuleError(f"{name}() 需要 {min_args}~{max_args} 個參數：{source}")
+        args = [_compile_node(arg, params, source) for arg in node.args]
+        for arg in args[1:]:
+            if arg[0] not in ('const', 'config'):
+                raise RuleError(f"{name}() 的週期要是數字或參數：{source}")
+        return ('call', name) + tuple(args)
+
+    raise RuleError(f"不支援的語法「{ast.dump(node)[:40]}」：{source}")
+
+def _compile_name(name, params, source):
+    if name in _COLUMNS:
+        return ('column', _COLUMNS[name])
+    if name in params:
+        value = params[name]
+        if isinstance(value, str):
+            return _compile_name(value, {}, source)
+        return ('const', _number(value))
+    if name.isupper() and hasattr(Config, name):
+        return ('config', name)
+    raise RuleError(f"未知的名稱 {name}：{source}")
+
+def compile_expr(source, params=None):
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError as e:
+        raise RuleError(f"規則語法錯誤：{source} ({e.msg})") from None
+    return _compile_node(tree.body, params or {}, source)
+
+# ---------------------------------------------------------------
+#  計算：整段 K 線一次算 (pandas 向量運算)，memo 讓相同子運算式只算一次
+# ---------------------------------------------------------------
+
+def _evaluate(node, df, memo):
+    if node in memo:
+        return memo[node]
+
+    kind = node[0]
+    if kind == 'const':
+        value = node[1]
+    elif kind == 'config':
+        value = getattr(Config, node[1])
+    elif kind == 'column':
+        value = df[node[1]]
+    elif kind == 'call':
+        func = _FUNCTIONS[node[1]][2]
+        value = func(*[_evaluate(arg, df, memo) for arg in node[2:]])
+    elif kind == 'and':
+        value = _as_mask(_evaluate(node[1], df, memo), df)
+        for child in node[2:]:
+            value = value & _as_mask(_evaluate(child, df, memo), df)
+    elif kind == 'or':
+        value = _as_mask(_evaluate(node[1], df, memo), df)
+        for child in node[2:]:
+            value = value | _as_mask(_evaluate(child, df, memo), df)
+    elif kind == 'not':
+        value = ~_as_mask(_evaluate(node[1], df, memo), df)
+    elif kind == 'neg':
+        value = -_evaluate(node[1], df, memo)
+    else:
+        left = _evaluate(node[1], df, memo)
+        right = _evaluate(node[2], df, memo)
+        value = {
+            '+': lambda: left + right, '-': lambda: left - right,
+            '*': lambda: left * right, '/': lambda: left / right,
+            '>': lambda: left > right, '>=': lambda: left >= right,
+            '<': lambda: left < right, '<=': lambda: left <= right,
+            '==': lambda: left == right, '!=': lambda: left != right,
+        }[kind]()
+
+    memo[node] = value
+    return value
+
+def _as_mask(value, df):
+    """ 比較結果轉成布林 Series (NaN 一律當成不符合) """
+    if isinstance(value, pd.Series):
+        if value.dtype != bool:
+            value = value.fillna(False).astype(bool)
+        return value
+    return pd.Series(bool(value), index=df.index)
+
+class Strategy:
+    """ 編譯好的策略：多條規則全部成立才進場 """
+    def __init__(self, name, label, rules, min_bars=0, params=None, spec=None):
+        self.name = name
+        self.label = label
+        self.rules = rules          # [(node, 成立說明, 不成立說明)]
+        self.min_bars = min_bars
+        self.params = params or {}
+        self.spec = spec or {}      # 原始設定 (換參數重新編譯用，見 with_params)
+
+    def rule_masks(self, df, memo=None):
+        """ 每條規則各自的布林遮罩 (跟 df 同樣長度) """
+        memo = {} if memo is None else memo
+        return [_as_mask(_evaluate(node, df, memo), df) for node, _, _ in self.rules]
+
+    def signal(self, df, memo=None):
+        """ 每天是否符合全部規則 """
+        masks = self.rule_masks(df, memo)
+        if not masks:
+            return pd.Series(False, index=df.index)
+        result = masks[0]
+        for mask in masks[1:]:
+            result = result & mask
+        return result
+
+    def evaluate_last(self, df, memo=None):
+        """ 最後一天 (今天) 的結果：(是否進場, [(是否成立, 說明), ...]) """
+        checks = []
+        for (node, passed, failed), mask in zip(self.rules, self.rule_masks(df, memo)):
+            ok = bool(mask.iloc[-1]) if len(mask) else False
+            checks.append((ok, passed if ok else failed))
+        return all(ok for ok, _ in checks) and bool(checks), checks
+
+    def resolved_params(self):
+        """ params 的實際數值 (寫成 Config 屬性名稱的換成現在的值) """
+        return {k: getattr(Config, v) if isinstance(v, str) else v for k, v in self.params.items()}
+
+    def with_params(self, params, name=None):
+        """ 同一份規則換一組參數重新編譯 """
+        return compile_strategy(self.spec, name or self.name, {**self.params, **params})
+
+def compile_strategy(spec, name=None, params=None):
+    """
+    spec: {'label', 'rules': [{'expr', 'pass', 'fail'}, ...], 'params', 'min_bars'}
+    params 會蓋掉 spec 裡的預設參數 (參數組合掃描用)
+    """
+    merged = dict(spec.get('params', {}))
+    merged.update(params or {})
+    rules = []
+    for rule in spec.get('rules', []):
+        if isinstance(rule, str):
+            rule = {'expr': rule}
+        node = compile_expr(rule['expr'], merged)
+        rules.append((node, rule.get('pass', rule['expr']), rule.get('fail', f"未符合 {rule['expr']}")))
+    label = spec.get('label', name)
+    return Strategy(name, label, rules, spec.get('min_bars', 0), merged, spec)
+
+_compiled = {}
+
+def get_strategy(name=None):
+    """ Config.STRATEGY_RULES 裡的策略 (編譯一次就重複使用)；name 省略用 Config.DEFAULT_STRATEGY """
+    name = name or Config.DEFAULT_STRATEGY
+    if name not in _compiled:
+        if name not in Config.STRATEGY_RULES:
+            raise RuleError(f"找不到策略 {name} (Config.STRATEGY_RULES)")
+        _compiled[name] = compile_strategy(Config.STRATEGY_RULES[name], name)
+    return _compiled[name]
+
+def reload():
+    """ 改過 Config.STRATEGY_RULES 之後呼叫，下次重新編譯 """
+    _compiled.clear()
+
+def variants(name, grid):
+    """
+    參數組合：variants('dual_ma_slope', {'vol_multiplier': [1.25, 1.5, 2], 'rsi_limit': [75, 82]})
+    回傳 6 個編譯好的 Strategy，名稱像 dual_ma_slope[vol_multiplier=1.5,rsi_limit=75]
+    """
+    spec = Config.STRATEGY_RULES[name]
+    keys = list(grid)
+    result = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(zip(keys, values))
+        suffix = ",".join(f"{k}={v}" for k, v in params.items())
+        result.append(compile_strategy(spec, f"{name}[{suffix}]", params))
+    return result
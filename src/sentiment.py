@@ -1,29 +1,26 @@
-import google.generativeai as genai
 import re
-import os
-import time
-from dotenv import load_dotenv
-from flask import current_app
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from src import cache, metrics, llm, page_cache, fast_sentiment
 
-def analyze_sentiment(stock_name, news_list, tech_data, chip_data=None):
-    """
-    綜合分析：新聞 + 籌碼 + 技術指標
-    策略：改用「純文字解析」模式，解決 JSON 格式導致的字數限制與報錯問題。
-    """
-    # 1. 獲取 API Key
-    api_key = current_app.config.get('GOOGLE_API_KEY')
-    if not api_key:
-        load_dotenv()
-        api_key = os.getenv('GOOGLE_API_KEY')
+# 生成參數
+# 這裡我們只設定溫度 (0.1 保持理性)，但不設定 max_output_tokens
+# 讓模型自己決定要講多少字，這樣就不會被腰斬了！
+GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.95,
+    "top_k": 40
+}
 
-    if not api_key:
-        return 0, "系統錯誤：未設定 API Key"
+# 額度不足時拿上一次的結果頂替，評論前面加上這行讓使用者知道可能已過時
+STALE_LABEL = "♻️ AI 額度不足，以下是上一次的分析結果 (可能已過時)"
 
+def _build_prompt(stock_name, news_list, tech_data, chip_data=None):
+    """ 回傳 (model_name, prompt, cache_key) """
     # 使用你指定的 gemini-2.5-flash
-    model_name = current_app.config.get('GEMINI_MODEL_NAME')
-    
-
-    genai.configure(api_key=api_key)
+    model_name = llm.default_model_name()
 
     # 2. 準備數據
     news_text = "\n".join(news_list) if news_list else "近期無重大新聞"
@@ -57,51 +54,166 @@ def analyze_sentiment(stock_name, news_list, tech_data, chip_data=None):
     評論：[請填寫100字以內的完整繁體中文分析]
     """
 
+    # 同樣的模型 + 同樣的 Prompt (新聞、籌碼、技術數據都沒變) 就直接用上次的結果
+    cache_key = hashlib.sha1(f"{model_name}\n{prompt}".encode('utf-8')).hexdigest()
+    return model_name, prompt, cache_key
+
+def parse_response(text):
+    """ 5. 純文字解析邏輯 (比 JSON 強壯100倍)，回傳 (score, comment) """
+    final_score = 0
+    final_comment = "AI 未提供評論"
+
+    # 找分數 (支援 "分數：" 或 "分數:")
+    score_match = re.search(r"分數[:：]\s*([-+]?\d*\.?\d+)", text)
+    if score_match:
+        try:
+            final_score = float(score_match.group(1))
+        except: pass
+
+    # 找評論 (抓取 "評論：" 後面的所有文字)
+    comment_match = re.search(r"評論[:：]\s*(.*)", text, re.DOTALL)
+    if comment_match:
+        final_comment = comment_match.group(1).strip()
+
+    # 如果還是沒抓到，就直接回傳整段文字，至少讓使用者看得到東西
+    if final_comment == "AI 未提供評論" and len(text) > 5:
+        final_comment = text
+
+    return final_score, final_comment
+
+def get_cached_sentiment(stock_name, news_list, tech_data, chip_data=None):
+    """ 只查快取不呼叫 AI，沒有就回傳 None (網頁用來決定要不要改走串流) """
+    _, _, cache_key = _build_prompt(stock_name, news_list, tech_data, chip_data)
+    hit, cached_result = cache.get('sentiment', cache_key)
+    return cached_result if hit else None
+
+def _failed(news_list, message):
+    """ LLM 沒有結果：有開 SENTIMENT_FAST_FALLBACK 就用新聞關鍵字快速分數頂著，不要直接給 0 分 """
+    if not Config.SENTIMENT_FAST_FALLBACK:
+        return 0, message
+    score, comment = fast_sentiment.score_news(news_list)
+    return score, f"{message}\n{comment}"
+
+def _call_llm(stock_name, news_list, model_name, prompt, cache_key, priority):
     print(f"🧐 [Sentiment] 正在分析 {stock_name} (Model={model_name})")
 
-    # 4. 設定參數
-    # 這裡我們只設定溫度 (0.1 保持理性)，但不設定 max_output_tokens
-    # 讓模型自己決定要講多少字，這樣就不會被腰斬了！
-    my_config = {
-        "temperature": 0.1, 
-        "top_p": 0.95,
-        "top_k": 40
-    }
-
-    max_retries = 3
-    for attempt in range(max_retries):
+    try:
+        # 共用的模型連線 + 調度器：額度不夠會排隊 (互動優先)，等太久就拿這檔股票上一次的結果
+        text = llm.generate(prompt, model_name, GENERATION_CONFIG,
+                            priority=priority, fallback_key=f"sentiment:{stock_name}")
+    except llm.LLMFallback as e:
+        # 舊結果只拿來顯示：不存成這次輸入的快取、不更新頁面版本 (也就不會記成訊號紀錄的 AI 分數)
+        score, comment = parse_response(e.text)
+        return score, f"{STALE_LABEL}\n{comment}"
+    except llm.LLMBusyError:
+        return _failed(news_list, "AI 系統忙碌中，請稍後再試")
+    except Exception as e:
+        print(f"⚠️ [Sentiment] 錯誤: {e}")
+        return _failed(news_list, f"分析失敗: {str(e)}")
+
+    result = parse_response(text)
+    cache.put('sentiment', cache_key, result)
+    # 結果頁快取看這個版本號決定要不要重新渲染
+    cache.bump_version(page_cache.sentiment_version_name(stock_name))
+    return result
+
+# 分層模式：背景補算 LLM 結果 (同一份輸入同時只會有一個在跑)
+_background = None
+_in_flight = set()
+_background_lock = threading.Lock()
+
+def _submit_background(stock_name, news_list, model_name, prompt, cache_key):
+    global _background
+    with _background_lock:
+        if cache_key in _in_flight:
+            return
+        _in_flight.add(cache_key)
+        if _background is None:
+            _background = ThreadPoolExecutor(max_workers=Config.SENTIMENT_BACKGROUND_WORKERS,
+                                             thread_name_prefix='sentiment')
+
+    def task():
         try:
-            model = genai.GenerativeModel(model_name)
-            
-            response = model.generate_content(prompt, generation_config=my_config)
-            text = response.text.strip()
-            
-            # 5. 純文字解析邏輯 (比 JSON 強壯100倍)
-            final_score = 0
-            final_comment = "AI 未提供評論"
-            
-            # 找分數 (支援 "分數：" 或 "分數:")
-            score_match = re.search(r"分數[:：]\s*([-+]?\d*\.?\d+)", text)
-            if score_match:
-                try:
-                    final_score = float(score_match.group(1))
-                except: pass
-            
-            # 找評論 (抓取 "評論：" 後面的所有文字)
-            comment_match = re.search(r"評論[:：]\s*(.*)", text, re.DOTALL)
-            if comment_match:
-                final_comment = comment_match.group(1).strip()
-            
-            # 如果還是沒抓到，就直接回傳整段文字，至少讓使用者看得到東西
-            if final_comment == "AI 未提供評論" and len(text) > 5:
-                final_comment = text
-
-            return final_score, final_comment
-
-        except Exception as e:
-            print(f"⚠️ [Sentiment] 錯誤 (第 {attempt+1} 次): {e}")
-            if attempt == max_retries - 1:
-                return 0, f"分析失敗: {str(e)}"
-            time.sleep(2)
-    
-    return 0, "AI 系統忙碌中"
\ No newline at end of file
+            _call_llm(stock_name, news_list, model_name, prompt, cache_key, llm.BACKGROUND)
+        finally:
+            with _background_lock:
+                _in_flight.discard(cache_key)
+
+    _background.submit(task)
+
+def quick_score(news_list):
+    """ 新聞標題快速評分 (幾微秒，不打 LLM)：(score, comment) """
+    return fast_sentiment.score_news(news_list)
+
+@metrics.timed('analyze_sentiment')
+def analyze_sentiment(stock_name, news_list, tech_data, chip_data=None, priority=llm.INTERACTIVE):
+    """
+    綜合分析：新聞 + 籌碼 + 技術指標
+    策略：改用「純文字解析」模式，解決 JSON 格式導致的字數限制與報錯問題。
+    priority: llm.INTERACTIVE (網頁 / LINE) 或 llm.BACKGROUND (預熱、早報、批次)
+    Config.SENTIMENT_MODE：
+      'fast'   直接回快速分數
+      'tiered' 互動請求快取沒有時先回快速分數，LLM 丟到背景算 (算完進快取，下次就是 LLM 結果)
+    """
+    mode = Config.SENTIMENT_MODE
+    if mode == 'fast':
+        return quick_score(news_list)
+
+    # 1. 檢查 API Key
+    if not llm.api_key():
+        return _failed(news_list, "系統錯誤：未設定 API Key")
+
+    model_name, prompt, cache_key = _build_prompt(stock_name, news_list, tech_data, chip_data)
+    hit, cached_result = cache.get('sentiment', cache_key)
+    if hit:
+        print(f"⚡ [Sentiment] {stock_name} 輸入沒變，使用快取結果")
+        return cached_result
+
+    if mode == 'tiered' and priority == llm.INTERACTIVE:
+        _submit_background(stock_name, news_list, model_name, prompt, cache_key)
+        return quick_score(news_list)
+
+    return _call_llm(stock_name, news_list, model_name, prompt, cache_key, priority)
+
+def stream_sentiment(stock_name, news_list, tech_data, chip_data=None):
+    """
+    串流版 analyze_sentiment：一段一段 yield 模型輸出的原始文字 (「分數：... 評論：...」)
+    網頁邊收邊顯示，全部收完再解析存進快取
+    """
+    if not llm.api_key():
+        yield "評論：系統錯誤：未設定 API Key"
+        return
+
+    model_name, prompt, cache_key = _build_prompt(stock_name, news_list, tech_data, chip_data)
+    hit, cached_result = cache.get('sentiment', cache_key)
+    if hit:
+        score, comment = cached_result
+        yield f"分數：{score}\n評論：{comment}"
+        return
+
+    print(f"🧐 [Sentiment] 串流分析 {stock_name} (Model={model_name})")
+    parts = []
+    try:
+        for text in llm.stream(prompt, model_name, GENERATION_CONFIG, priority=llm.INTERACTIVE):
+            parts.append(text)
+            yield text
+    except llm.LLMBusyError:
+        # 額度不足：跟 analyze_sentiment 一樣，先拿這檔股票上一次的結果頂著
+        # 跟 _call_llm 一樣標明是舊結果，也不存成這次輸入的快取
+        hit, old_text = cache.get('llm_fallback', f"sentiment:{stock_name}")
+        if not hit:
+            yield "評論：AI 系統忙碌中，請稍後再試"
+            return
+        score, comment = parse_response(old_text)
+        yield f"分數：{score}\n評論：{STALE_LABEL}\n{comment}"
+        return
+    except Exception as e:
+        print(f"⚠️ [Sentiment] 串流錯誤: {e}")
+        yield f"\n評論：分析失敗: {str(e)}"
+        return
+
+    text = "".join(parts).strip()
+    result = parse_response(text)
+    cache.put('sentiment', cache_key, result)
+    cache.put('llm_fallback', f"sentiment:{stock_name}", text)
+    cache.bump_version(page_cache.sentiment_version_name(stock_name))
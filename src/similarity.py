@@ -0,0 +1,261 @@
+import datetime
+import os
+import threading
+import numpy as np
+from config import Config
+from src import ml_predict, metrics, leader, trading_calendar
+
+# 相似股搜尋：每檔股票一個「指紋」向量，查詢時跟全部股票算一次相似度取前 k 名
+#
+# 指紋 (ml_predict.prepare_features 算出來的特徵，取最後幾天)：
+#   path      最近 PATH_DAYS 天的累積報酬路徑 (log，起點 = 0)
+#   rsi       最近 RECENT_DAYS 天的 RSI
+#   macd      最近 RECENT_DAYS 天的 MACD_Hist (除以股價，不同價位才能比)
+#   bias      最近 RECENT_DAYS 天的 Bias_20
+#   volume    今天成交量 / 20 日均量 (log)
+# 每一欄先對全部股票做標準化 (z-score)，每個區塊再依長度調整權重 (20 天的路徑不會蓋過 1 個量比)，
+# 最後單位化，相似度 = 內積 (cosine)。2000 檔 × 36 維查一次不到 1 毫秒。
+#
+# 索引存在 Config.SIMILARITY_INDEX_PATH (.npz)：
+#   盤後排程重建一次 (自選股 + 熱門股 + 最近有人看過的股票)
+#   結果頁分析時順手更新那一檔 (K 線最後一天變了才算)，不用等到晚上，並記下看過的日期；
+#   只靠結果頁加進來的股票超過 SIMILARITY_AD_HOC_DAYS 天沒人看就不再每晚重抓
+# 多個 worker 各自讀同一個檔，檔案時間變了就重新載入；
+# 寫入 (讀 → 改 → 寫) 整段拿檔案鎖，兩個 worker 同時更新不會蓋掉對方加的股票。
+
+PATH_DAYS = 20
+RECENT_DAYS = 5
+BLOCKS = (('path', PATH_DAYS), ('rsi', RECENT_DAYS), ('macd', RECENT_DAYS), ('bias', RECENT_DAYS), ('volume', 1))
+DIMENSIONS = sum(size for _, size in BLOCKS)
+
+_lock = threading.Lock()
+_tickers = []           # 第 i 列是哪一檔
+_dates = []             # 第 i 列用的 K 線最後一天
+_viewed = []            # 第 i 列最後一次在結果頁被看的日期 ('' = 排程 / 選股器加的，不會過期)
+_vectors = np.empty((0, DIMENSIONS), dtype=np.float32)
+_rows = {}              # ticker → 列號
+_normalized = None      # 標準化 + 單位化後的矩陣 (有變動才重算)
+_loaded_mtime = None
+
+def _last_date(df):
+    value = df['Date'].iloc[-1] if 'Date' in df else df.index[-1]
+    return str(value)[:10]
+
+def fingerprint(df):
+    """ 一檔股票的指紋向量 (float32, 長度 DIMENSIONS)；資料不夠回傳 None """
+    data = ml_predict.prepare_features(df)
+    if len(data) < max(PATH_DAYS + 1, 20):
+        return None
+    close = data['Close'].to_numpy(dtype=float)[-(PATH_DAYS + 1):]
+    recent = data.iloc[-RECENT_DAYS:]
+    volume = df['Volume'].to_numpy(dtype=float)[-20:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        parts = [
+            np.log(close[1:] / close[0]),
+            recent['RSI'].to_numpy(dtype=float) / 100,
+            (recent['MACD_Hist'] / recent['Close']).to_numpy(dtype=float),
+            recent['Bias_20'].to_numpy(dtype=float),
+            [np.log(volume[-1] / volume.mean())],
+        ]
+        vector = np.concatenate(parts).astype(np.float32)
+    if not np.isfinite(vector).all():
+        return None
+    return vector
+
+def _normalize(vectors):
+    mean = vectors.mean(axis=0)
+    std = vectors.std(axis=0)
+    std[std == 0] = 1
+    z = (vectors - mean) / std
+    weights = np.concatenate([np.full(size, 1 / np.sqrt(size)) for _, size in BLOCKS]).astype(np.float32)
+    z *= weights
+    norms = np.linalg.norm(z, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (z / norms).astype(np.float32), mean, std, weights
+
+# ---------------------------------------------------------------
+#  索引檔 (.npz)：讀 / 寫 (寫到暫存檔再改名，別的 worker 不會讀到寫一半的檔)
+# ---------------------------------------------------------------
+
+def _path():
+    return Config.SIMILARITY_INDEX_PATH
+
+def _set(tickers, dates, vectors, viewed=None):
+    global _tickers, _dates, _viewed, _vectors, _rows, _normalized
+    _tickers = list(tickers)
+    _dates = list(dates)
+    _viewed = list(viewed) if viewed is not None else [''] * len(_tickers)
+    _vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, DIMENSIONS)
+    _rows = {t: i for i, t in enumerate(_tickers)}
+    _normalized = None
+
+def _reload_if_changed():
+    """ 檔案被別的 worker / 夜間重建改過就重新載入 (只看修改時間，幾微秒) """
+    global _loaded_mtime
+    path = _path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return
+    if mtime == _loaded_mtime:
+        return
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if data['vectors'].shape[1:] != (DIMENSIONS,):
+                print("⚠️ [相似股] 索引格式跟程式不符，等下次重建")
+                return
+            # 舊版索引沒有 viewed：當成排程 / 選股器加的，不會被清掉
+            viewed = data['viewed'].tolist() if 'viewed' in data.files else None
+            _set(data['tickers'].tolist(), data['dates'].tolist(), data['vectors'], viewed)
+        _loaded_mtime = mtime
+    except Exception as e:
+        print(f"⚠️ [相似股] 索引讀取失敗: {e}")
+
+def _save():
+    global _loaded_mtime
+    path = _path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, tickers=np.array(_tickers, dtype=str), dates=np.array(_dates, dtype=str),
+             viewed=np.array(_viewed, dtype=str), vectors=_vectors)
+    os.replace(tmp_path, path)
+    _loaded_mtime = os.path.getmtime(path)
+
+# ---------------------------------------------------------------
+#  建立 / 更新
+# ---------------------------------------------------------------
+
+@metrics.timed('similarity_rebuild')
+def rebuild(frames, keep=None, viewed=()):
+    """
+    更新索引：frames = {ticker: K 線 df}；K 線最後一天跟索引裡一樣的就不重算。回傳這次重算了幾檔
+    keep  : 有給的話 (盤後排程)，只靠結果頁加進來、超過 SIMILARITY_AD_HOC_DAYS 天沒人看
+            又不在 keep 裡的股票從索引拿掉
+    viewed: 這些股票記成今天有人看過
+    """
+    # 指紋在鎖外面先算好 (全市場要好幾秒)，拿鎖之後只合併，不擋查詢也不擋別的 worker
+    with _lock:
+        _reload_if_changed()
+        known = {t: _dates[row] for t, row in _rows.items()}
+    computed = []
+    for ticker, df in frames.items():
+        last_date = _last_date(df)
+        if known.get(ticker) == last_date:
+            continue
+        vector = fingerprint(df)
+        if vector is not None:
+            computed.append((ticker, last_date, vector))
+
+    today = str(trading_calendar.today_tw())
+    with _lock, leader.file_lock(f"{_path()}.lock"):
+        # 拿到鎖之後再讀一次：別的 worker 可能剛寫完
+        _reload_if_changed()
+        tickers, dates, seen = list(_tickers), list(_dates), list(_viewed)
+        vectors = list(_vectors)
+        rows = dict(_rows)
+        updated = 0
+        for ticker, last_date, vector in computed:
+            row = rows.get(ticker)
+            if row is None:
+                rows[ticker] = len(tickers)
+                tickers.append(ticker)
+                dates.append(last_date)
+                seen.append('')
+                vectors.append(vector)
+            elif dates[row] != last_date:
+                dates[row] = last_date
+                vectors[row] = vector
+            else:
+                continue
+            updated += 1
+
+        changed = updated > 0
+        for ticker in viewed:
+            row = rows.get(ticker)
+            if row is not None and seen[row] != today:
+                seen[row] = today
+                changed = True
+
+        if keep is not None:
+            keep = set(keep)
+            cutoff = str(trading_calendar.today_tw() - datetime.timedelta(days=Config.SIMILARITY_AD_HOC_DAYS))
+            kept = [i for i, t in enumerate(tickers) if t in keep or not seen[i] or seen[i] >= cutoff]
+            if len(kept) < len(tickers):
+                print(f"🧹 [相似股] 拿掉 {len(tickers) - len(kept)} 檔太久沒人看的股票")
+                tickers = [tickers[i] for i in kept]
+                dates = [dates[i] for i in kept]
+                seen = [seen[i] for i in kept]
+                vectors = [vectors[i] for i in kept]
+                changed = True
+
+        if changed or not os.path.exists(_path()):
+            _set(tickers, dates, np.array(vectors, dtype=np.float32).reshape(-1, DIMENSIONS), seen)
+            _save()
+        return updated
+
+def update(ticker, df):
+    """ 結果頁用：這檔的 K 線有新的一天就更新指紋，並記下今天有人看過 (一檔一天最多存一次檔) """
+    today = str(trading_calendar.today_tw())
+    with _lock:
+        _reload_if_changed()
+        row = _rows.get(ticker)
+        if row is not None and _dates[row] == _last_date(df) and _viewed[row] == today:
+            return False
+    return rebuild({ticker: df}, viewed=[ticker]) > 0
+
+def tickers():
+    with _lock:
+        _reload_if_changed()
+        return list(_tickers)
+
+def recent_tickers():
+    """
+    最近 SIMILARITY_AD_HOC_DAYS 天在結果頁被看過的股票 (最近看的在前面，最多 SIMILARITY_AD_HOC_MAX 檔)
+    盤後排程只重抓這些 + 自選股 + 熱門股，索引才不會因為有人隨手查過就永遠越長越大
+    """
+    cutoff = str(trading_calendar.today_tw() - datetime.timedelta(days=Config.SIMILARITY_AD_HOC_DAYS))
+    with _lock:
+        _reload_if_changed()
+        recent = [(day, t) for t, day in zip(_tickers, _viewed) if day and day >= cutoff]
+    recent.sort(reverse=True)
+    return [t for _, t in recent[:Config.SIMILARITY_AD_HOC_MAX]]
+
+# ---------------------------------------------------------------
+#  查詢
+# ---------------------------------------------------------------
+
+@metrics.timed('similarity_query')
+def query(ticker, k=None, df=None):
+    """
+    跟 ticker 最像的 k 檔：[{'ticker', 'similarity' (0~100), 'date'}, ...] (由高到低)
+    ticker 不在索引裡時可以給 df 現算指紋；都沒有回傳 []
+    """
+    global _normalized
+    k = k or Config.SIMILARITY_TOP_K
+    # 不在索引裡才現算指紋 (在鎖外面算，不擋別人查詢)
+    vector = fingerprint(df) if df is not None and ticker not in _rows else None
+    with _lock:
+        _reload_if_changed()
+        if len(_tickers) < 2:
+            return []
+        if _normalized is None:
+            _normalized = _normalize(_vectors)
+        matrix, mean, std, weights = _normalized
+        row = _rows.get(ticker)
+        if row is not None:
+            target = matrix[row]
+        elif vector is not None:
+            z = (vector - mean) / std * weights
+            target = (z / (np.linalg.norm(z) or 1)).astype(np.float32)
+        else:
+            return []
+        names, dates = _tickers, _dates
+
+    scores = matrix @ target
+    if row is not None:
+        scores[row] = -np.inf
+    k = min(k, len(scores) - (row is not None))
+    top = np.argpartition(-scores, k - 1)[:k] if k > 0 else []
+    top = sorted(top, key=lambda i: -scores[i])
+    return [{'ticker': names[i], 'similarity': round(float(scores[i]) * 50 + 50, 1), 'date': dates[i]}
+            for i in top]
@@ -0,0 +1,24 @@
+from src import strategy, ml_predict
+
+def compute_snapshot(df, ticker=None):
+    """
+    盤後快照：把一檔股票「今天」的重點數字算好
+    給早報、首頁自選股、LINE 快速回覆直接讀，不用每次重抓一年資料
+    有給 ticker 時 ML 機率跟結果頁 / 選股共用快取 (見 ml_predict.predict_batch)
+    """
+    is_breakout, tech_info = strategy.check_volume_breakout(df)
+    is_buy, signal_msg = strategy.check_buy_signal(df)
+    ml_prob = ml_predict.predict_next_day(df, ticker)
+
+    return {
+        "trade_date": df['Date'].iloc[-1].date(),
+        "close": float(tech_info['price']),
+        "change_pct": float(tech_info['change_pct']),
+        "vol_ratio": float(tech_info['vol_ratio']),
+        "rsi": float(tech_info['rsi']),
+        "macd_status": tech_info['macd_status'],
+        "is_breakout": bool(is_breakout),
+        "is_buy": bool(is_buy),
+        "signal_msg": signal_msg,
+        "ml_prob": ml_prob,
+    }
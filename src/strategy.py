@@ -1,9 +1,13 @@
 import pandas as pd
 import numpy as np
 from config import Config
+from src import kernels, rules
 
 def calculate_rsi(series, period=14):
     """計算 RSI 指標"""
+    if kernels.use_for_series():
+        return pd.Series(kernels.rsi(series.to_numpy(dtype=float), period)[0], index=series.index)
+
     delta = series.diff()
     up = delta.clip(lower=0)
     down = -1 * delta.clip(upper=0)
@@ -18,6 +22,10 @@ def calculate_rsi(series, period=14):
 
 def calculate_macd(series, fast=12, slow=26, signal=9):
     """計算 MACD 指標"""
+    if kernels.use_for_series():
+        lines = kernels.macd(series.to_numpy(dtype=float), fast, slow, signal)
+        return tuple(pd.Series(line[0], index=series.index) for line in lines)
+
     exp12 = series.ewm(span=fast, adjust=False).mean()
     exp26 = series.ewm(span=slow, adjust=False).mean()
     macd_line = exp12 - exp26
@@ -89,78 +97,19 @@ def check_volume_breakout(df):
         "macd_status": macd_status
     }
 
-def check_buy_signal(df):
+def check_buy_signal(df, strategy_name=None):
     """
-    🚀 實戰訊號檢查 (新增功能)
-    判斷「今天」是否符合回測中的「雙均線雙斜率共振」策略
+    🚀 實戰訊號檢查
+    判斷「今天」是否符合回測用的同一套策略規則 (Config.STRATEGY_RULES，預設「雙均線雙斜率共振」)
     回傳: (是否買進: bool, 原因描述: str)
     """
-    # 1. 確保資料夠多 (計算 MA60 至少要 60 筆)
-    if len(df) < 60:
-        return False, "⚠️ 資料不足 (新上市?)"
-
-    # 為了避免影響原始 df，使用 copy
-    temp_df = df.copy()
-
-    # 2. 確保必要指標已計算 (MA20, MA60, RSI)
-    temp_df['MA20'] = temp_df['Close'].rolling(window=20).mean()
-    temp_df['MA60'] = temp_df['Close'].rolling(window=60).mean()
-    temp_df['RSI'] = calculate_rsi(temp_df['Close'])
-    
-    # 取得今天的數據 (最後一列)
-    today = temp_df.iloc[-1]
-    # 取得昨天的數據 (倒數第二列，用來算斜率)
-    yesterday = temp_df.iloc[-2]
-
-    # 計算斜率 (今天 - 昨天)
-    ma20_slope = today['MA20'] - yesterday['MA20']
-    ma60_slope = today['MA60'] - yesterday['MA60']
-    
-    # 準備比較用的 5日均量 (不含今天，前5天的平均)
-    vol_ma5 = temp_df['Volume'].iloc[-6:-1].mean()
-    
-    # --- 3. 讀取 Config 參數 ---
-    # 如果 Config 裡沒有設定 BACKTEST_ 開頭的參數，就用預設值
-    vol_multiplier = getattr(Config, 'BACKTEST_VOL_MULTIPLIER', 2.0)
-    rsi_limit = getattr(Config, 'BACKTEST_RSI_LIMIT', 75)
-
-    # --- 4. 逐一檢查條件 (跟回測邏輯一模一樣) ---
-
-    # A. 趨勢條件 (雙均線 + 雙斜率)
-    # 確保收盤在均線之上，且均線正在往上翹
-    trend_ok = (today['Close'] > today['MA20']) and \
-               (ma20_slope > 0) and \
-               (today['Close'] > today['MA60']) and \
-               (ma60_slope > 0)
+    rule_set = rules.get_strategy(strategy_name)
 
-    # B. 動能條件 (爆量)
-    vol_ok = today['Volume'] > (vol_ma5 * vol_multiplier)
-
-    # C. 型態條件 (收紅K)
-    candle_ok = today['Close'] > today['Open']
-
-    # D. 風險條件 (RSI)
-    rsi_ok = today['RSI'] < rsi_limit
-
-    # --- 5. 產生結論 ---
-    reasons = []
-    
-    if trend_ok: reasons.append("✅趨勢多頭")
-    else: reasons.append("❌趨勢未確認")
-    
-    if vol_ok: reasons.append("✅量能爆發")
-    else: reasons.append("❌量能平平")
-    
-    if candle_ok: reasons.append("✅收紅")
-    else: reasons.append("❌收黑/平")
-    
-    if rsi_ok: reasons.append("✅RSI安全")
-    else: reasons.append("❌RSI過熱")
+    # 確保資料夠多 (例如計算 MA60 至少要 60 筆)
+    if len(df) < rule_set.min_bars:
+        return False, "⚠️ 資料不足 (新上市?)"
 
-    # 綜合判斷 (全部 True 才是 True)
-    is_buy = trend_ok and vol_ok and candle_ok and rsi_ok
-    
-    # 組合回傳訊息
-    msg = " | ".join(reasons)
-    
-    return is_buy, msg
\ No newline at end of file
+    # 每條規則整段算完取最後一天，跟回測逐日判斷的結果一模一樣
+    is_buy, checks = rule_set.evaluate_last(df)
+    msg = " | ".join(("✅" if ok else "❌") + text for ok, text in checks)
+    return is_buy, msg
@@ -0,0 +1,118 @@
+import datetime
+import os
+from pytz import timezone
+from config import Config
+
+TW_TZ = timezone(Config.MARKET_TIMEZONE)
+
+_holidays = None
+
+def _parse_hhmm(text):
+    hour, minute = text.split(":")
+    return datetime.time(int(hour), int(minute))
+
+def load_holidays(path=None):
+    """
+    讀取本地休市日檔案 (每行一個 YYYY-MM-DD，# 開頭為註解)
+    只讀一次，之後直接用記憶體中的 set
+    """
+    global _holidays
+    if _holidays is not None and path is None:
+        return _holidays
+
+    path = path or Config.HOLIDAY_FILE
+    days = set()
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#')[0].strip()
+                if not line:
+                    continue
+                days.add(datetime.date.fromisoformat(line.split()[0]))
+    except FileNotFoundError:
+        print(f"⚠️ [交易日曆] 找不到休市日檔案 {path}，只排除週末")
+
+    _holidays = days
+    return days
+
+def now_tw():
+    """ 現在的台北時間 (帶時區) """
+    return datetime.datetime.now(TW_TZ)
+
+def today_tw():
+    """ 台北的「今天」，伺服器在 UTC 也不會算錯日期 """
+    return now_tw().date()
+
+def to_tw(dt):
+    """ 把任何 datetime 轉成台北時間 (沒有時區的當成台北時間) """
+    if dt.tzinfo is None:
+        return TW_TZ.localize(dt)
+    return dt.astimezone(TW_TZ)
+
+def is_trading_day(day):
+    """ 週一到週五，且不在休市日清單內 """
+    if isinstance(day, datetime.datetime):
+        day = to_tw(day).date()
+    return day.weekday() < 5 and day not in load_holidays()
+
+def previous_trading_day(day):
+    """ day 之前 (不含 day) 的最近一個交易日 """
+    day -= datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day -= datetime.timedelta(days=1)
+    return day
+
+def next_trading_day(day):
+    """ day 之後 (不含 day) 的下一個交易日 """
+    day += datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day += datetime.timedelta(days=1)
+    return day
+
+def session_bounds(day):
+    """ 回傳某天的 (開盤, 收盤) 台北時間 """
+    open_at = TW_TZ.localize(datetime.datetime.combine(day, _parse_hhmm(Config.MARKET_OPEN_TIME)))
+    close_at = TW_TZ.localize(datetime.datetime.combine(day, _parse_hhmm(Config.MARKET_CLOSE_TIME)))
+    return open_at, close_at
+
+def is_market_open(now=None):
+    """ 現在是不是盤中 """
+    now = to_tw(now) if now else now_tw()
+    if not is_trading_day(now.date()):
+        return False
+    open_at, close_at = session_bounds(now.date())
+    return open_at <= now <= close_at
+
+def latest_release(ready_time, now=None):
+    """
+    最近一次「資料定稿」的時間點
+    例如 ready_time="14:00"：週六呼叫會得到週五 14:00；週一 10:00 呼叫也是週五 14:00
+    """
+    now = to_tw(now) if now else now_tw()
+    ready = _parse_hhmm(ready_time)
+
+    day = now.date()
+    if not is_trading_day(day) or now.time() < ready:
+        day = previous_trading_day(day)
+    return TW_TZ.localize(datetime.datetime.combine(day, ready))
+
+def needs_refresh(fetched_at, ready_time=None, session_ttl=None, off_ttl=None, now=None):
+    """
+    判斷快取資料「有沒有可能已經過期」
+    1. 盤中：有設定 session_ttl 的資料，超過秒數就重抓
+    2. 有 ready_time：只要抓取時間晚於最近一次定稿時間，資料就不可能有變化
+    3. 都沒有：退回用 off_ttl 秒數判斷
+    """
+    now = to_tw(now) if now else now_tw()
+    fetched_at = to_tw(fetched_at)
+    age = (now - fetched_at).total_seconds()
+
+    if session_ttl is not None and is_market_open(now):
+        return age > session_ttl
+
+    if ready_time:
+        return fetched_at < latest_release(ready_time, now)
+
+    if off_ttl is not None:
+        return age > off_ttl
+    return True
@@ -0,0 +1,282 @@
+import asyncio
+import atexit
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import aiohttp
+from config import Config
+from src import metrics
+
+# 所有上游服務 (FinMind / yfinance / GoogleNews / Gemini) 共用的連線層
+# - HTTP API (FinMind)：aiohttp 非同步連線池 (keep-alive)，跑在背景事件迴圈
+#   一般 Flask 程式碼用 get_json() 同步呼叫即可
+# - 自帶連線的套件 (yfinance、GoogleNews、Gemini SDK)：用 call() 包起來，
+#   一樣享有併發上限、重試退避、斷路器；逾時要自己把 timeout(provider) 傳給套件
+#   (yfinance 的 timeout=、Gemini 的 request_options)，套件沒有逾時參數的 (GoogleNews) 改用 call_with_timeout()
+# 設定見 Config.UPSTREAM_POLICIES
+
+class UpstreamError(Exception):
+    """ 上游服務呼叫失敗 (重試後仍失敗) """
+
+class CircuitOpenError(UpstreamError):
+    """ 斷路器打開中，直接拒絕，不去打已經掛掉的服務 """
+
+class _RetryableHTTPError(UpstreamError):
+    """ 429 / 5xx：上游暫時有狀況，值得重試 """
+
+class CircuitBreaker:
+    """
+    連續失敗 failure_threshold 次就「斷路」reset_timeout 秒
+    時間到放一個請求試試看 (half-open)，成功就恢復，失敗就繼續斷路
+    """
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # half-open：先放行這一個，其他人繼續等結果
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.opened_at is not None:
+                print(f"🟢 [上游] {self.name} 恢復正常，關閉斷路器")
+            self.opened_at = None
+        metrics.set_gauge('upstream_circuit_open', 0, provider=self.name)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                print(f"🔴 [上游] {self.name} 連續失敗 {self.failures} 次，斷路 {self.reset_timeout} 秒")
+            is_open = self.opened_at is not None
+        metrics.set_gauge('upstream_circuit_open', 1 if is_open else 0, provider=self.name)
+
+_breakers = {}
+_thread_semaphores = {}
+_registry_lock = threading.Lock()
+
+def policy(provider):
+    """ 某個上游服務的設定 (UPSTREAM_DEFAULT_POLICY 加上 UPSTREAM_POLICIES 裡的覆寫) """
+    settings = dict(Config.UPSTREAM_DEFAULT_POLICY)
+    settings.update(Config.UPSTREAM_POLICIES.get(provider, {}))
+    return settings
+
+def breaker(provider):
+    with _registry_lock:
+        if provider not in _breakers:
+            settings = policy(provider)
+            _breakers[provider] = CircuitBreaker(provider, settings['failure_threshold'], settings['reset_timeout'])
+        return _breakers[provider]
+
+def _thread_semaphore(provider):
+    with _registry_lock:
+        if provider not in _thread_semaphores:
+            _thread_semaphores[provider] = threading.BoundedSemaphore(policy(provider)['concurrency'])
+        return _thread_semaphores[provider]
+
+def backoff(attempt, policy):
+    """ 指數退避 + 隨機抖動 (full jitter)，避免所有 worker 同一時間一起重試 """
+    cap = min(policy['backoff_max'], policy['backoff_base'] * (2 ** attempt))
+    return random.uniform(0, cap)
+
+def _record_failure(provider, cb, error):
+    cb.record_failure()
+    metrics.inc('upstream_errors_total', provider=provider)
+    print(f"⚠️ [上游] {provider} 失敗: {error}")
+
+# ---------------------------------------------------------------
+#  1. 同步包裝：給 yfinance / GoogleNews / Gemini SDK 這類自帶連線的套件
+# ---------------------------------------------------------------
+
+def timeout(provider):
+    """ 單次呼叫的逾時秒數 (傳給套件自己的 timeout 參數) """
+    return policy(provider)['timeout']
+
+_timeout_executor = None
+_timeout_executor_lock = threading.Lock()
+
+def _run_with_timeout(func, args, kwargs, seconds, semaphore):
+    """
+    丟到執行緒跑，最多等 seconds 秒 (逾時丟 FutureTimeout)
+    執行緒停不下來，所以併發名額等它真的跑完才還，卡住的呼叫不會超過併發上限
+    """
+    global _timeout_executor
+    with _timeout_executor_lock:
+        if _timeout_executor is None:
+            _timeout_executor = ThreadPoolExecutor(max_workers=Config.UPSTREAM_POOL_SIZE,
+                                                   thread_name_prefix='upstream-call')
+    try:
+        future = _timeout_executor.submit(func, *args, **kwargs)
+    except BaseException:
+        # 沒送出去 (例如關機中 executor 已經 shutdown)：不會有 done callback，名額要在這裡還
+        semaphore.release()
+        raise
+    future.add_done_callback(lambda _: semaphore.release())
+    return future.result(timeout=seconds)
+
+def call_with_timeout(provider, func, *args, **kwargs):
+    """
+    跟 call() 一樣，但 func 本身沒有逾時參數：超過 policy 的 timeout 就不等了，算一次失敗
+    例：upstream.call_with_timeout('googlenews', googlenews.search, "2330")
+    """
+    return _call(provider, func, args, kwargs, hard_timeout=True)
+
+def call(provider, func, *args, **kwargs):
+    """
+    透過斷路器 + 併發上限 + 重試呼叫 func
+    例：upstream.call('yfinance', stock.history, period="1y", timeout=upstream.timeout('yfinance'))
+    """
+    return _call(provider, func, args, kwargs, hard_timeout=False)
+
+def _call(provider, func, args, kwargs, hard_timeout):
+    settings = policy(provider)
+    cb = breaker(provider)
+    semaphore = _thread_semaphore(provider)
+
+    for attempt in range(settings['retries'] + 1):
+        if not cb.allow():
+            metrics.inc('upstream_rejected_total', provider=provider)
+            raise CircuitOpenError(f"{provider} 暫時停用 (斷路器打開中)")
+
+        # 等不到併發名額就當成失敗，不要讓 worker 執行緒一直卡著
+        if not semaphore.acquire(timeout=settings['timeout']):
+            metrics.inc('upstream_rejected_total', provider=provider)
+            raise UpstreamError(f"{provider} 併發已滿，等待逾時")
+        start = time.perf_counter()
+        try:
+            if hard_timeout:
+                result = _run_with_timeout(func, args, kwargs, settings['timeout'], semaphore)
+            else:
+                result = func(*args, **kwargs)
+            cb.record_success()
+            metrics.observe('upstream_latency_seconds', time.perf_counter() - start, provider=provider)
+            return result
+        except Exception as e:
+            error = f"逾時 ({settings['timeout']} 秒)" if isinstance(e, FutureTimeout) else e
+            _record_failure(provider, cb, error)
+            if attempt == settings['retries']:
+                raise UpstreamError(f"{provider} 呼叫失敗: {error}") from e
+        finally:
+            if not hard_timeout:
+                semaphore.release()
+
+        metrics.inc('upstream_retries_total', provider=provider)
+        time.sleep(backoff(attempt, settings))
+
+# ---------------------------------------------------------------
+#  2. 非同步 HTTP：aiohttp 連線池，跑在一條背景執行緒的事件迴圈
+# ---------------------------------------------------------------
+
+_loop = None
+_loop_lock = threading.Lock()
+_session = None
+_async_semaphores = {}
+
+def _event_loop():
+    """ 第一次用到才啟動背景事件迴圈 (gunicorn fork 之後各 worker 自己建) """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="upstream-loop", daemon=True)
+            thread.start()
+            _loop = loop
+        return _loop
+
+def _close_session():
+    """ process 結束時關閉連線池 (避免 aiohttp 的 Unclosed session 警告) """
+    if _loop is not None and _session is not None and not _session.closed:
+        try:
+            asyncio.run_coroutine_threadsafe(_session.close(), _loop).result(timeout=2)
+        except Exception:
+            pass
+
+atexit.register(_close_session)
+
+async def _get_session():
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=Config.UPSTREAM_POOL_SIZE,
+            keepalive_timeout=Config.UPSTREAM_KEEPALIVE,
+            ttl_dns_cache=300,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def client_session():
+    """ 共用的 aiohttp 連線池 (給要自己處理回應的模組，例如 LINE 推播) """
+    return await _get_session()
+
+def _async_semaphore(provider):
+    # 只會在事件迴圈執行緒裡呼叫，不需要上鎖
+    if provider not in _async_semaphores:
+        _async_semaphores[provider] = asyncio.Semaphore(policy(provider)['concurrency'])
+    return _async_semaphores[provider]
+
+async def fetch_json(provider, url, params=None, method='GET'):
+    """ 非同步取得 JSON (含重試、斷路器、併發上限)，要在事件迴圈裡 await """
+    settings = policy(provider)
+    cb = breaker(provider)
+    session = await _get_session()
+    timeout = aiohttp.ClientTimeout(total=settings['timeout'])
+
+    for attempt in range(settings['retries'] + 1):
+        if not cb.allow():
+            metrics.inc('upstream_rejected_total', provider=provider)
+            raise CircuitOpenError(f"{provider} 暫時停用 (斷路器打開中)")
+
+        start = time.perf_counter()
+        try:
+            async with _async_semaphore(provider):
+                async with session.request(method, url, params=params, timeout=timeout) as resp:
+                    # 429 / 5xx 值得重試；其他 4xx 是請求本身有問題，重試也沒用
+                    if resp.status == 429 or resp.status >= 500:
+                        raise _RetryableHTTPError(f"HTTP {resp.status}")
+                    if resp.status >= 400:
+                        cb.record_success()
+                        raise UpstreamError(f"{provider} 回傳 HTTP {resp.status}")
+                    data = await resp.json(content_type=None)
+            cb.record_success()
+            metrics.observe('upstream_latency_seconds', time.perf_counter() - start, provider=provider)
+            return data
+        except (_RetryableHTTPError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _record_failure(provider, cb, repr(e))
+            last_error = e
+
+        if attempt == settings['retries']:
+            raise UpstreamError(f"{provider} 呼叫失敗: {last_error!r}") from last_error
+        metrics.inc('upstream_retries_total', provider=provider)
+        await asyncio.sleep(backoff(attempt, settings))
+
+def run_coroutine(coro, timeout, provider='upstream'):
+    """ 在背景事件迴圈執行 coro 並同步等結果，超過 timeout 秒就取消 """
+    future = asyncio.run_coroutine_threadsafe(coro, _event_loop())
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise UpstreamError(f"{provider} 等待逾時")
+
+def call_budget(provider):
+    """ 一次 fetch_json 最久要等多久 (最壞情況：每次都逾時 + 每次都退避到上限) """
+    settings = policy(provider)
+    return (settings['retries'] + 1) * (settings['timeout'] + settings['backoff_max']) + 5
+
+def get_json(provider, url, params=None):
+    """ 同步版 fetch_json：給現有的 Flask / 排程程式碼直接呼叫 """
+    return run_coroutine(fetch_json(provider, url, params), call_budget(provider), provider)